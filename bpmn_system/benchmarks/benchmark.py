@@ -0,0 +1,461 @@
+"""
+Benchmark de extremo a extremo del sistema.
+
+Reproduce los casos de la carpeta `Pruebas` (y procesos sintéticos más grandes)
+a través de todas las etapas: recuperación de contexto, construcción y
+tokenización del prompt, generación, extracción del JSON, construcción del
+diagrama (código DOT con DotWriter) y renderizado con Graphviz. Guarda los
+resultados en un fichero JSON que se puede comparar con el de otra ejecución.
+
+Uso:
+    python benchmark.py run --backend fake --repeat 5 --output actual.json
+    python benchmark.py run --backend hf --vectorstore ../server/context/faiss_index
+    python benchmark.py compare base.json actual.json --tolerance 0.1
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'client'))
+
+from backends import FakeBackend, create_backend
+from prompts import build_prompt_suffix, extract_process_json
+from synthetic_flows import synthetic_flow
+from dot_writer import write_dot
+from diagram_renderer import render_source
+import graphviz
+
+PRUEBAS_DIR = os.path.join(ROOT_DIR, 'Pruebas')
+STAGES = ('retrieval', 'prompt', 'generation', 'extraction', 'diagram', 'render')
+PERCENTILES = (50, 90, 95, 99)
+
+
+class BenchmarkCase:
+    """A user prompt with its context and the process JSON expected for it."""
+
+    __slots__ = ('name', 'prompt', 'context', 'expected_text')
+
+    def __init__(self, name, prompt, context, expected_text):
+        self.name = name
+        self.prompt = prompt
+        self.context = context
+        self.expected_text = expected_text
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def load_pruebas_cases(pruebas_dir=PRUEBAS_DIR):
+    """Loads every `Pruebas/procesoN` folder that has a prompt and an output JSON."""
+    cases = []
+    for name in sorted(os.listdir(pruebas_dir)):
+        case_dir = os.path.join(pruebas_dir, name)
+        prompt = _read(os.path.join(case_dir, 'prompt.txt'))
+        expected_text = _read(os.path.join(case_dir, 'json.txt'))
+        if prompt and expected_text:
+            cases.append(BenchmarkCase(name, prompt, _read(os.path.join(case_dir, 'context.txt')), expected_text))
+    return cases
+
+
+def synthetic_cases(sizes):
+    """One synthetic case per size, to measure processes larger than the real ones."""
+    return [
+        BenchmarkCase(
+            f"sintetico{size}",
+            f"Describe un proceso de {size} pasos con decisiones y bucles",
+            '',
+            json.dumps(synthetic_flow(size, seed=size), indent=2, ensure_ascii=False)
+        )
+        for size in sizes
+    ]
+
+
+class ReplayBackend(FakeBackend):
+    """FakeBackend that answers each registered prompt with the expected output of its case."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.model_id = 'replay'
+        self.replies = {}
+
+    def _response_for(self, prompt_suffix):
+        reply = self.replies.get(prompt_suffix)
+        if reply is None:
+            return super()._response_for(prompt_suffix)
+        return reply
+
+
+def build_retriever(vectorstore_path, device):
+    """Loads the FAISS vectorstore with the same embedding model as the server."""
+    from sentence_transformers import SentenceTransformer
+    from ingestion import CustomEmbeddings
+    from retriever import ContextRetriever
+
+    embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=device)
+    return ContextRetriever(vectorstore_path, CustomEmbeddings(embedding_model))
+
+
+def count_elements(process_json):
+    """Number of flow elements, including the tasks inside branches and loops."""
+    total = 0
+    for element in process_json.get('flow', []):
+        total += 1
+        for branch in element.get('ramas', []):
+            total += len(branch.get('tareas', []))
+        total += len(element.get('tareas', []))
+    return total
+
+
+def percentile(ordered, pct):
+    """Linear-interpolated percentile of an already sorted list."""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(seconds):
+    """Latency summary in milliseconds."""
+    ordered = sorted(s * 1000 for s in seconds)
+    summary = {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered),
+        'min_ms': ordered[0],
+        'max_ms': ordered[-1],
+    }
+    for pct in PERCENTILES:
+        summary[f'p{pct}_ms'] = percentile(ordered, pct)
+    return summary
+
+
+class StageTimer:
+    """Times the stages of one iteration and, optionally, their peak Python memory."""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.times = {}
+        self.peaks = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        ti = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.times[stage] = time.perf_counter() - ti
+        if self.trace_memory:
+            self.peaks[stage] = tracemalloc.get_traced_memory()[1]
+        return result
+
+
+def run_case(case, backend, retriever, render_formats, trace_memory):
+    """Runs one case through every stage and returns its timings, memory peaks and token counts."""
+    timer = StageTimer(trace_memory)
+
+    if retriever is not None:
+        context = timer.run('retrieval', retriever.retrieve, case.prompt)
+    else:
+        context = case.context
+
+    def build_prompt():
+        prompt_suffix = build_prompt_suffix(context, case.prompt)
+        return prompt_suffix, backend.count_tokens(prompt_suffix)
+
+    prompt_suffix, _ = timer.run('prompt', build_prompt)
+    if isinstance(backend, ReplayBackend):
+        backend.replies[prompt_suffix] = case.expected_text
+
+    result = timer.run('generation', backend.generate, prompt_suffix)
+    process_json = timer.run('extraction', extract_process_json, result.text)
+    source = timer.run('diagram', write_dot, process_json)
+
+    if render_formats:
+        # One layout for every format, without the render cache so each iteration pays for Graphviz
+        timer.run('render', render_source, source, render_formats)
+
+    return {
+        'times': timer.times,
+        'peaks': timer.peaks,
+        'elements': count_elements(process_json),
+        'prompt_tokens': result.prompt_tokens,
+        'generated_tokens': result.generated_tokens,
+        'time_to_first_token': result.time_to_first_token,
+        'generation_time': result.generation_time,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+
+def gpu_peak_mb():
+    torch = sys.modules.get('torch')
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda.max_memory_allocated() / 2**20
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(cases, backend, retriever=None, repeat=3, warmup=1,
+                  render_formats=('png',), trace_memory=False):
+    """
+    Runs every case `warmup + repeat` times and aggregates the measured iterations.
+
+    Returns:
+        dict: Per-stage and per-case latency summaries, generation throughput and memory
+    """
+    if render_formats:
+        try:
+            graphviz.Digraph().pipe(format='svg')
+        except graphviz.ExecutableNotFound:
+            print("Graphviz (dot) no está instalado: se omite la etapa de renderizado.")
+            render_formats = ()
+
+    if trace_memory:
+        tracemalloc.start()
+
+    ti = time.perf_counter()
+    samples = {}
+    errors = {}
+    for case in cases:
+        samples[case.name] = []
+        for iteration in range(warmup + repeat):
+            try:
+                sample = run_case(case, backend, retriever, render_formats, trace_memory)
+            except Exception as e:
+                errors.setdefault(case.name, []).append(str(e))
+                continue
+            if iteration >= warmup:
+                samples[case.name].append(sample)
+        print(f"{case.name}: {len(samples[case.name])} iteraciones medidas, "
+              f"{len(errors.get(case.name, []))} errores.")
+    wall_time = time.perf_counter() - ti
+
+    if trace_memory:
+        tracemalloc.stop()
+
+    all_samples = [sample for case_samples in samples.values() for sample in case_samples]
+    results = {
+        'stages': {},
+        'cases': {},
+        'generation': {},
+        'memory': {'peak_rss_mb': peak_rss_mb(), 'gpu_peak_mb': gpu_peak_mb()},
+        'wall_time_s': wall_time,
+    }
+    if not all_samples:
+        results['errors'] = errors
+        return results
+
+    def stage_summaries(case_samples):
+        summaries = {}
+        for stage in STAGES:
+            values = [s['times'][stage] for s in case_samples if stage in s['times']]
+            if values:
+                summaries[stage] = summarize(values)
+        summaries['total'] = summarize([sum(s['times'].values()) for s in case_samples])
+        return summaries
+
+    results['stages'] = stage_summaries(all_samples)
+    for name, case_samples in samples.items():
+        if case_samples:
+            generation_time = sum(s['generation_time'] for s in case_samples)
+            results['cases'][name] = {
+                'elements': case_samples[0]['elements'],
+                'prompt_tokens': case_samples[0]['prompt_tokens'],
+                'generated_tokens': case_samples[0]['generated_tokens'],
+                'tokens_per_second': (
+                    sum(s['generated_tokens'] for s in case_samples) / generation_time
+                    if generation_time else 0.0
+                ),
+                'stages': stage_summaries(case_samples),
+            }
+
+    generation_time = sum(s['generation_time'] for s in all_samples)
+    generated_tokens = sum(s['generated_tokens'] for s in all_samples)
+    results['generation'] = {
+        'generated_tokens': generated_tokens,
+        'tokens_per_second': generated_tokens / generation_time if generation_time else 0.0,
+        'time_to_first_token': summarize([s['time_to_first_token'] or 0.0 for s in all_samples]),
+    }
+
+    if trace_memory:
+        results['memory']['python_peak_mb'] = {
+            stage: max(s['peaks'][stage] for s in all_samples if stage in s['peaks']) / 2**20
+            for stage in STAGES
+            if any(stage in s['peaks'] for s in all_samples)
+        }
+    if errors:
+        results['errors'] = errors
+    return results
+
+
+def print_report(results):
+    header = f"{'etapa':<12}" + ''.join(f"{f'p{pct} ms':>11}" for pct in PERCENTILES) + f"{'media ms':>11}"
+    print(header)
+    for stage, summary in results['stages'].items():
+        print(f"{stage:<12}" + ''.join(f"{summary[f'p{pct}_ms']:>11.2f}" for pct in PERCENTILES)
+              + f"{summary['mean_ms']:>11.2f}")
+
+    generation = results['generation']
+    if generation:
+        print(f"\nTokens generados: {generation['generated_tokens']} | "
+              f"{generation['tokens_per_second']:.1f} tokens/s | "
+              f"TTFT p50: {generation['time_to_first_token']['p50_ms']:.1f} ms")
+    memory = results['memory']
+    print(f"Memoria máxima (RSS): {memory['peak_rss_mb']:.1f} MB")
+    if memory.get('gpu_peak_mb') is not None:
+        print(f"Memoria máxima (GPU): {memory['gpu_peak_mb']:.1f} MB")
+    for stage, peak in memory.get('python_peak_mb', {}).items():
+        print(f"  pico Python en {stage}: {peak:.2f} MB")
+    for name, messages in results.get('errors', {}).items():
+        print(f"Errores en {name}: {messages[0]} ({len(messages)} veces)")
+
+
+def compare(base, current, tolerance=0.1, min_delta_ms=1.0, metrics=('p50_ms', 'p95_ms')):
+    """
+    Compares two result files stage by stage.
+
+    A metric regresses when it is more than `tolerance` (relative) and more than
+    `min_delta_ms` (absolute, to ignore noise on sub-millisecond stages) slower
+    than the base; the generation throughput regresses when it drops by more
+    than `tolerance`.
+
+    Returns:
+        list: Description of every regression found
+    """
+    regressions = []
+    print(f"{'etapa':<12}{'métrica':<10}{'base':>11}{'actual':>11}{'cambio':>10}")
+    for stage, base_summary in base['stages'].items():
+        current_summary = current['stages'].get(stage)
+        if current_summary is None:
+            continue
+        for metric in metrics:
+            before, after = base_summary[metric], current_summary[metric]
+            change = (after - before) / before if before else 0.0
+            regressed = change > tolerance and after - before > min_delta_ms
+            print(f"{stage:<12}{metric:<10}{before:>11.2f}{after:>11.2f}{change * 100:>9.1f}%"
+                  + ('  REGRESIÓN' if regressed else ''))
+            if regressed:
+                regressions.append(f"{stage} {metric}: {before:.2f} -> {after:.2f} ms")
+
+    before = base.get('generation', {}).get('tokens_per_second')
+    after = current.get('generation', {}).get('tokens_per_second')
+    if before and after is not None:
+        change = (after - before) / before
+        regressed = change < -tolerance
+        print(f"{'generation':<12}{'tokens/s':<10}{before:>11.1f}{after:>11.1f}{change * 100:>9.1f}%"
+              + ('  REGRESIÓN' if regressed else ''))
+        if regressed:
+            regressions.append(f"tokens/s: {before:.1f} -> {after:.1f}")
+    return regressions
+
+
+def build_backend(args):
+    if args.backend == 'replay':
+        return ReplayBackend(latency_ms=args.latency_ms, tokens_per_second=args.tokens_per_second)
+    if args.backend == 'fake':
+        return create_backend('fake', responses_dir=PRUEBAS_DIR, latency_ms=args.latency_ms,
+                              tokens_per_second=args.tokens_per_second)
+    return create_backend(args.backend, model_path=args.model_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo del generador BPMN")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Ejecuta el benchmark")
+    run_parser.add_argument('--backend', default='replay', choices=('replay', 'fake', 'hf', 'cpu'),
+                            help="'replay' devuelve el JSON esperado de cada caso sin modelo")
+    run_parser.add_argument('--model-path', default="/mnt/backupnas/fgarcia/Llama3")
+    run_parser.add_argument('--latency-ms', type=float, default=0.0)
+    run_parser.add_argument('--tokens-per-second', type=float, default=0.0)
+    run_parser.add_argument('--vectorstore', help="Índice FAISS; sin él se usa el context.txt de cada caso")
+    run_parser.add_argument('--embedding-device', default='cpu')
+    run_parser.add_argument('--synthetic-sizes', type=int, nargs='*', default=[25, 50, 100])
+    run_parser.add_argument('--no-pruebas', action='store_true', help="Solo casos sintéticos")
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--warmup', type=int, default=1)
+    run_parser.add_argument('--formats', nargs='*', default=['png'],
+                            help="Formatos a renderizar; vacío para omitir el renderizado")
+    run_parser.add_argument('--trace-memory', action='store_true',
+                            help="Mide el pico de memoria Python por etapa (añade sobrecoste)")
+    run_parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+
+    compare_parser = subparsers.add_parser('compare', help="Compara dos ficheros de resultados")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1)
+    compare_parser.add_argument('--min-delta-ms', type=float, default=1.0)
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        regressions = compare(base, current, tolerance=args.tolerance, min_delta_ms=args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regresiones detectadas.")
+            sys.exit(1)
+        print("\nSin regresiones.")
+        return
+
+    cases = [] if args.no_pruebas else load_pruebas_cases()
+    cases += synthetic_cases(args.synthetic_sizes)
+    backend = build_backend(args)
+    retriever = build_retriever(args.vectorstore, args.embedding_device) if args.vectorstore else None
+
+    results = run_benchmark(
+        cases, backend, retriever=retriever, repeat=args.repeat, warmup=args.warmup,
+        render_formats=tuple(args.formats), trace_memory=args.trace_memory
+    )
+    results['meta'] = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': args.backend,
+        'model_id': backend.model_id,
+        'retrieval': bool(retriever),
+        'repeat': args.repeat,
+        'warmup': args.warmup,
+        'cases': [case.name for case in cases],
+    }
+
+    print()
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark de la construcción del código DOT: DotWriter frente a FlexibleBPMNGenerator.
+
+Para procesos sintéticos de tamaño creciente (con pasarelas y bucles anidados)
+mide el tiempo de obtener el código DOT del diagrama con el generador basado en
+`graphviz.Digraph` y con la emisión directa, y comprueba que ambos textos son
+idénticos byte a byte. Ambos parten de la misma FlowIR ya compilada.
+
+También construye el diagrama de forma incremental (DiagramBuilder, un elemento
+del flujo cada vez) y compara el coste por elemento del primer y del último
+décimo del flujo, que debe ser el mismo.
+
+Uso:
+    python dot_benchmark.py --sizes 100 1000 10000 50000 --repeat 3
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'client'))
+
+from synthetic_flows import synthetic_flow
+from flow_ir import compile_flow
+from bpmn_generator import FlexibleBPMNGenerator
+from dot_writer import write_dot
+from diagram_builder import DiagramBuilder
+
+
+def best_of(repeat, function):
+    """
+    Minimum wall time of `repeat` runs, and the result of the last one. The
+    cyclic garbage collector is paused, as in ir_benchmark.
+    """
+    best = float('inf')
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            ti = time.perf_counter()
+            result = function()
+            best = min(best, time.perf_counter() - ti)
+    finally:
+        gc.enable()
+    return best, result
+
+
+def build_incrementally(flow):
+    """
+    Adds the flow to a DiagramBuilder one element at a time.
+
+    Returns:
+        tuple: (builder, seconds per IR element of the first tenth, of the last tenth)
+    """
+    builder = DiagramBuilder()
+    tenth = max(1, len(flow) // 10)
+    rates = []
+    for part in (flow[:tenth], flow[tenth:-tenth], flow[-tenth:]):
+        before = len(builder)
+        ti = time.perf_counter()
+        for item in part:
+            builder.add_element(item)
+        rates.append((time.perf_counter() - ti) / max(1, len(builder) - before))
+    return builder, rates[0], rates[2]
+
+
+def benchmark_size(size, depth, repeat):
+    data = synthetic_flow(size, seed=size, max_depth=depth)
+    ir = compile_flow(data)
+    elements = len(ir)
+
+    generator_time, expected = best_of(repeat, lambda: FlexibleBPMNGenerator().create_bpmn_diagram(ir).source)
+    writer_time, source = best_of(repeat, lambda: write_dot(ir))
+    builder_time, (builder, first_rate, last_rate) = best_of(repeat, lambda: build_incrementally(data['flow']))
+    partial_time, partial = best_of(repeat, builder.source)
+
+    return {
+        'size': size,
+        'elements': elements,
+        'dot_kb': len(source.encode('utf-8')) / 1024,
+        'generator_ms': generator_time * 1000,
+        'writer_ms': writer_time * 1000,
+        'writer_us_per_element': writer_time * 1e6 / elements,
+        'speedup': generator_time / writer_time,
+        'builder_ms': builder_time * 1000,
+        'builder_first_us_per_element': first_rate * 1e6,
+        'builder_last_us_per_element': last_rate * 1e6,
+        'builder_source_ms': partial_time * 1000,
+        'identical': source == expected and partial == expected,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la emisión directa del código DOT")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--depth', type=int, default=2, help="Niveles de anidamiento de pasarelas y bucles")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    print(f"{'tamaño':>8}{'elementos':>11}{'DOT KB':>10}{'generador ms':>14}{'writer ms':>11}"
+          f"{'µs/elem':>9}{'aceleración':>13}{'builder ms':>12}{'µs/elem 1º/últ. 10%':>21}{'idéntico':>10}")
+    results = []
+    for size in args.sizes:
+        result = benchmark_size(size, args.depth, args.repeat)
+        results.append(result)
+        print(f"{size:>8}{result['elements']:>11}{result['dot_kb']:>10.1f}{result['generator_ms']:>14.1f}"
+              f"{result['writer_ms']:>11.1f}{result['writer_us_per_element']:>9.2f}"
+              f"{result['speedup']:>12.1f}x{result['builder_ms']:>12.1f}"
+              f"{result['builder_first_us_per_element']:>12.2f} /{result['builder_last_us_per_element']:>7.2f}"
+              f"{'sí' if result['identical'] else 'NO':>10}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'depth': args.depth, 'results': results}, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    if not all(result['identical'] for result in results):
+        sys.exit("El código DOT de DotWriter o DiagramBuilder no coincide con el de FlexibleBPMNGenerator")
+
+
+if __name__ == "__main__":
+    main()
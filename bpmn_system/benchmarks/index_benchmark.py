@@ -0,0 +1,146 @@
+"""
+Benchmark de tipos de índice FAISS: latencia de consulta, memoria y recall@k.
+
+Compara cada configuración con la búsqueda exacta sobre los mismos vectores,
+que pueden salir de un vectorstore existente o generarse sintéticamente para
+simular corpus de distintos tamaños.
+
+Uso:
+    python index_benchmark.py --num-vectors 100000
+    python index_benchmark.py --index ../server/context/faiss_index --configs flat hnsw,ef_search=32
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+
+from index_factory import build_index, format_index_config, index_memory_bytes, parse_index_config
+
+DEFAULT_CONFIGS = (
+    'flat',
+    'ivf,nprobe=1', 'ivf,nprobe=8', 'ivf,nprobe=32',
+    'hnsw,ef_search=16', 'hnsw,ef_search=64', 'hnsw,ef_search=256',
+    'ivfpq,nprobe=8', 'ivfpq,nprobe=32',
+)
+
+
+def load_vectors(index_path):
+    """Exact vectors of a vectorstore folder (vectors.faiss if present, else index.faiss)."""
+    for name in ('vectors.faiss', 'index.faiss'):
+        path = os.path.join(index_path, name)
+        if os.path.exists(path):
+            index = faiss.read_index(path)
+            return index.reconstruct_n(0, index.ntotal)
+    raise FileNotFoundError(f"No hay índice FAISS en {index_path}")
+
+
+def synthetic_vectors(num_vectors, dimension, num_clusters=64, seed=0):
+    """Normalized vectors grouped around random centers, like sentence embeddings of related texts."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension)).astype('float32')
+    assignment = rng.integers(0, num_clusters, num_vectors)
+    vectors = centers[assignment] + 0.6 * rng.standard_normal((num_vectors, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(vectors, num_queries, noise=0.3, seed=1):
+    """Perturbed copies of random stored vectors, so every query has close neighbours."""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), num_queries)]
+    queries = queries + noise * rng.standard_normal(queries.shape).astype('float32') / np.sqrt(vectors.shape[1])
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.ascontiguousarray(queries, dtype='float32')
+
+
+def recall_at_k(found, exact):
+    """Mean fraction of the exact k nearest neighbours returned by the index."""
+    k = exact.shape[1]
+    return float(np.mean([len(set(f) & set(e)) / k for f, e in zip(found, exact)]))
+
+
+def benchmark_config(config, vectors, queries, exact_ids, k):
+    tb = time.perf_counter()
+    index, used_config = build_index(vectors, config)
+    build_time = time.perf_counter() - tb
+
+    # One query at a time, like the server does for each request
+    latencies = []
+    found = np.empty((len(queries), k), dtype='int64')
+    for i, query in enumerate(queries):
+        tq = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - tq)
+        found[i] = ids[0]
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'config': format_index_config(config),
+        'built_as': format_index_config(used_config),
+        'build_s': build_time,
+        'memory_mb': index_memory_bytes(index) / 2**20,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'qps': len(queries) / float(np.sum(latencies)),
+        f'recall@{k}': recall_at_k(found, exact_ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de tipos de índice FAISS")
+    parser.add_argument('--index', help="Carpeta de un vectorstore; sin ella se generan vectores sintéticos")
+    parser.add_argument('--num-vectors', type=int, default=50000)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--num-queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--configs', nargs='+', default=list(DEFAULT_CONFIGS))
+    parser.add_argument('--threads', type=int, default=1, help="Hilos de FAISS durante las búsquedas")
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+
+    if args.index:
+        vectors = np.ascontiguousarray(load_vectors(args.index), dtype='float32')
+    else:
+        vectors = synthetic_vectors(args.num_vectors, args.dimension)
+    queries = make_queries(vectors, args.num_queries)
+    k = min(args.k, len(vectors))
+    print(f"{len(vectors)} vectores de dimensión {vectors.shape[1]}, {len(queries)} consultas, k={k}.")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, exact_ids = exact.search(queries, k)
+
+    results = []
+    header = f"{'config':<28}{'build s':>9}{'MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'qps':>10}{f'recall@{k}':>11}"
+    print(header)
+    for spec in args.configs:
+        result = benchmark_config(parse_index_config(spec), vectors, queries, exact_ids, k)
+        results.append(result)
+        print(f"{result['config']:<28}{result['build_s']:>9.2f}{result['memory_mb']:>9.1f}"
+              f"{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}{result['qps']:>10.0f}"
+              f"{result[f'recall@{k}']:>11.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'num_vectors': len(vectors),
+                'dimension': int(vectors.shape[1]),
+                'num_queries': len(queries),
+                'k': k,
+                'results': results,
+            }, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark de la representación intermedia (FlowIR) con procesos grandes.
+
+Para procesos sintéticos de tamaño creciente (con pasarelas y bucles anidados)
+mide la compilación del JSON a la IR, el pico de memoria que reserva y la
+emisión del diagrama Graphviz y del BPMN XML a partir de ella. El tiempo y la
+memoria por elemento deben mantenerse constantes al crecer el proceso.
+
+Uso:
+    python ir_benchmark.py --sizes 1000 10000 50000 --depth 2
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'client'))
+
+from synthetic_flows import synthetic_flow
+from flow_ir import compile_flow
+from bpmn_generator import FlexibleBPMNGenerator
+from bpmn_xml import BPMNDiagram
+
+
+def timed(function):
+    """
+    Wall time of `function` with the cyclic garbage collector paused: its full
+    collections scan every live object, which would hide the growth of the
+    algorithm itself behind the size of the heap.
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        ti = time.perf_counter()
+        result = function()
+        return time.perf_counter() - ti, result
+    finally:
+        gc.enable()
+
+
+def peak_memory(function):
+    """Peak of the memory allocated while `function` runs (tracemalloc), and its result."""
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, result
+
+
+def benchmark_size(size, depth, nested_ratio):
+    data = synthetic_flow(size, seed=size, max_depth=depth, nested_ratio=nested_ratio)
+    json_bytes = len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    compile_time, ir = timed(lambda: compile_flow(data))
+    compile_peak, _ = peak_memory(lambda: compile_flow(data))
+    elements = len(ir)
+
+    dot_time, diagram = timed(lambda: FlexibleBPMNGenerator().create_bpmn_diagram(ir))
+    layout_time, bpmn = timed(lambda: BPMNDiagram().build(ir).layout())
+    xml_time, _ = timed(bpmn.to_xml)
+
+    return {
+        'size': size,
+        'elements': elements,
+        'distinct_strings': len(ir.strings),
+        'json_kb': json_bytes / 1024,
+        'compile_ms': compile_time * 1000,
+        'compile_us_per_element': compile_time * 1e6 / elements,
+        'compile_peak_bytes_per_element': compile_peak / elements,
+        'ir_bytes_per_element': ir.memory_bytes() / elements,
+        'dot_ms': dot_time * 1000,
+        'dot_lines': diagram.source.count('\n'),
+        'bpmn_layout_ms': layout_time * 1000,
+        'bpmn_xml_ms': xml_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la representación intermedia del flujo")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--depth', type=int, default=2, help="Niveles de anidamiento de pasarelas y bucles")
+    parser.add_argument('--nested-ratio', type=float, default=0.3)
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    print(f"{'tamaño':>8}{'elementos':>11}{'compilar ms':>13}{'µs/elem':>9}{'pico B/elem':>13}"
+          f"{'IR B/elem':>11}{'dot ms':>10}{'layout ms':>11}{'xml ms':>10}")
+    results = []
+    for size in args.sizes:
+        result = benchmark_size(size, args.depth, args.nested_ratio)
+        results.append(result)
+        print(f"{size:>8}{result['elements']:>11}{result['compile_ms']:>13.2f}"
+              f"{result['compile_us_per_element']:>9.2f}{result['compile_peak_bytes_per_element']:>13.0f}"
+              f"{result['ir_bytes_per_element']:>11.0f}{result['dot_ms']:>10.1f}"
+              f"{result['bpmn_layout_ms']:>11.1f}{result['bpmn_xml_ms']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'depth': args.depth, 'nested_ratio': args.nested_ratio, 'results': results}, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark del layout propio (exportación BPMN 2.0 XML) frente a Graphviz.
+
+Para procesos sintéticos de tamaño creciente mide la construcción y el layout
+en Python, la serialización del XML y, si `dot` está instalado, el camino de
+Graphviz (FlexibleBPMNGenerator + layout ortogonal + SVG). El tiempo por
+elemento del layout propio debe mantenerse constante al crecer el proceso.
+
+Uso:
+    python layout_benchmark.py --sizes 10 100 1000 5000
+    python layout_benchmark.py --sizes 50 200 --repeat 3 --output layout.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import graphviz
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'client'))
+
+from synthetic_flows import synthetic_flow
+from bpmn_generator import FlexibleBPMNGenerator
+from bpmn_xml import BPMNDiagram
+from diagram_renderer import render_source
+
+
+def best_of(repeat, function):
+    """Minimum wall time of `repeat` runs, and the result of the last one."""
+    best = float('inf')
+    for _ in range(repeat):
+        ti = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - ti)
+    return best, result
+
+
+def graphviz_available():
+    try:
+        render_source(graphviz.Digraph().source, ('svg',))
+        return True
+    except graphviz.ExecutableNotFound:
+        return False
+
+
+def benchmark_size(size, repeat, with_graphviz, graphviz_limit):
+    data = synthetic_flow(size, seed=size)
+
+    layout_time, diagram = best_of(repeat, lambda: BPMNDiagram().build(data).layout())
+    xml_time, xml = best_of(repeat, diagram.to_xml)
+    result = {
+        'size': size,
+        'nodes': len(diagram.nodes),
+        'flows': len(diagram.flows),
+        'layout_ms': layout_time * 1000,
+        'layout_us_per_node': layout_time * 1e6 / len(diagram.nodes),
+        'xml_ms': xml_time * 1000,
+        'xml_kb': len(xml.encode('utf-8')) / 1024,
+        'graphviz_ms': None,
+    }
+
+    # The orthogonal layout of dot grows much faster; very large flows are skipped
+    if with_graphviz and size <= graphviz_limit:
+        graphviz_time, _ = best_of(repeat, lambda: render_source(
+            FlexibleBPMNGenerator().create_bpmn_diagram(data).source, ('svg',)
+        ))
+        result['graphviz_ms'] = graphviz_time * 1000
+        result['speedup'] = graphviz_time / (layout_time + xml_time)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del layout BPMN propio frente a Graphviz")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100, 500, 1000, 5000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--graphviz-limit', type=int, default=1000,
+                        help="Tamaño máximo de proceso que se renderiza con Graphviz")
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    with_graphviz = graphviz_available()
+    if not with_graphviz:
+        print("Graphviz (dot) no está instalado: solo se mide el layout propio.")
+
+    print(f"{'elementos':>10}{'nodos':>8}{'layout ms':>11}{'µs/nodo':>9}{'xml ms':>9}{'xml KB':>9}"
+          f"{'graphviz ms':>13}{'aceleración':>13}")
+    results = []
+    for size in args.sizes:
+        result = benchmark_size(size, args.repeat, with_graphviz, args.graphviz_limit)
+        results.append(result)
+        graphviz_ms = f"{result['graphviz_ms']:.1f}" if result['graphviz_ms'] is not None else '-'
+        speedup = f"{result['speedup']:.1f}x" if 'speedup' in result else '-'
+        print(f"{size:>10}{result['nodes']:>8}{result['layout_ms']:>11.2f}{result['layout_us_per_node']:>9.1f}"
+              f"{result['xml_ms']:>9.2f}{result['xml_kb']:>9.1f}{graphviz_ms:>13}{speedup:>13}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'graphviz': with_graphviz, 'results': results}, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
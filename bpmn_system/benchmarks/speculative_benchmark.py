@@ -0,0 +1,159 @@
+"""
+Benchmark de la decodificación especulativa.
+
+Genera los casos de `Pruebas` con decodificación greedy normal (el mismo bucle
+sin borrador, una pasada del modelo por token) y con cada drafter, comprueba
+que la salida es idéntica y mide tokens por segundo, tasa de aceptación y
+aceleración. Funciona en CPU con modelos pequeños que compartan tokenizer.
+
+Uso:
+    python speculative_benchmark.py --model HuggingFaceTB/SmolLM2-360M-Instruct \\
+        --draft-model HuggingFaceTB/SmolLM2-135M-Instruct --max-new-tokens 256
+    python speculative_benchmark.py --model /mnt/backupnas/fgarcia/Llama3 --device cuda --drafters ngram
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'benchmarks'))
+
+from benchmark import load_pruebas_cases
+from prompts import SYSTEM_PROMPT_PREFIX, build_prompt_suffix
+from speculative import DraftModelDrafter, NgramDrafter, SpeculativeDecoder
+
+
+class NoDrafter:
+    """Proposes nothing: the speculative loop becomes plain greedy decoding."""
+
+    num_tokens = 0
+
+    def reset(self, prompt_ids):
+        pass
+
+    def propose(self, ids):
+        return []
+
+    def accepted(self, num_ids):
+        pass
+
+
+def load_model(path, device):
+    model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float32).to(device)
+    model.eval()
+    return model
+
+
+def stop_token_ids(tokenizer):
+    ids = [tokenizer.eos_token_id]
+    eot_id = tokenizer.convert_tokens_to_ids("<|eot_id|>")
+    if eot_id is not None and eot_id != tokenizer.unk_token_id:
+        ids.append(eot_id)
+    return ids
+
+
+def run_drafter(name, drafter, model, tokenizer, prompts, prefix_cache, max_new_tokens):
+    """Generates every prompt with one drafter; returns the outputs and the aggregated stats."""
+    decoder = SpeculativeDecoder(model, tokenizer, drafter, stop_token_ids(tokenizer))
+    outputs = []
+    total_time = 0.0
+    for input_ids in prompts:
+        past_key_values = copy.deepcopy(prefix_cache)
+        ti = time.perf_counter()
+        output_ids, _ = decoder.generate(input_ids, past_key_values, max_new_tokens)
+        total_time += time.perf_counter() - ti
+        outputs.append(output_ids)
+
+    stats = decoder.stats
+    return outputs, dict(
+        drafter=name,
+        seconds=total_time,
+        tokens_per_second=stats.generated / total_time if total_time else 0.0,
+        **stats.to_dict()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación especulativa")
+    parser.add_argument('--model', required=True, help="Modelo principal (ruta o id de Hugging Face)")
+    parser.add_argument('--draft-model', help="Modelo borrador con el mismo tokenizer")
+    parser.add_argument('--drafters', nargs='+', default=['ngram', 'draft'], choices=['ngram', 'draft'])
+    parser.add_argument('--num-draft-tokens', type=int, nargs='+', default=[4, 8])
+    parser.add_argument('--max-new-tokens', type=int, default=256)
+    parser.add_argument('--cases', type=int, default=None, help="Número máximo de casos de Pruebas")
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--threads', type=int, default=None, help="Hilos de torch en CPU")
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = load_model(args.model, args.device)
+    draft_model = None
+    if 'draft' in args.drafters:
+        if not args.draft_model:
+            parser.error("--drafters draft necesita --draft-model")
+        draft_model = load_model(args.draft_model, args.device)
+
+    cases = load_pruebas_cases()[:args.cases]
+    prefix_ids = tokenizer(SYSTEM_PROMPT_PREFIX, return_tensors="pt").input_ids.to(args.device)
+    prompts = [
+        torch.cat([prefix_ids, tokenizer(
+            build_prompt_suffix(case.context, case.prompt), add_special_tokens=False, return_tensors="pt"
+        ).input_ids.to(args.device)], dim=-1)
+        for case in cases
+    ]
+    with torch.no_grad():
+        prefix_cache = DynamicCache()
+        model(input_ids=prefix_ids, past_key_values=prefix_cache, use_cache=True)
+    print(f"{len(cases)} casos, prefijo de {prefix_ids.shape[-1]} tokens, hasta {args.max_new_tokens} tokens nuevos.")
+
+    baseline_outputs, baseline = run_drafter(
+        'greedy', NoDrafter(), model, tokenizer, prompts, prefix_cache, args.max_new_tokens
+    )
+    results = [baseline]
+
+    for name in args.drafters:
+        for num_tokens in args.num_draft_tokens:
+            if name == 'ngram':
+                drafter = NgramDrafter(num_tokens=num_tokens)
+            else:
+                drafter = DraftModelDrafter(draft_model, num_tokens=num_tokens)
+            outputs, result = run_drafter(
+                f"{name}:{num_tokens}", drafter, model, tokenizer, prompts, prefix_cache, args.max_new_tokens
+            )
+            result['identical_output'] = outputs == baseline_outputs
+            result['speedup'] = baseline['seconds'] / result['seconds'] if result['seconds'] else 0.0
+            results.append(result)
+
+    print(f"{'drafter':<12}{'tok/s':>9}{'aceptación':>12}{'tok/pasada':>12}{'aceleración':>13}{'idéntica':>10}")
+    for result in results:
+        print(f"{result['drafter']:<12}{result['tokens_per_second']:>9.1f}"
+              f"{result['acceptance_rate']:>12.1%}{result['tokens_per_pass']:>12.2f}"
+              f"{result.get('speedup', 1.0):>12.2f}x{str(result.get('identical_output', True)):>10}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model': args.model,
+                'draft_model': args.draft_model,
+                'device': args.device,
+                'max_new_tokens': args.max_new_tokens,
+                'cases': [case.name for case in cases],
+                'results': results,
+            }, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark del streaming de la generación: tiempo hasta el primer elemento frente al total.
+
+Genera los casos de `Pruebas` con el backend fake (latencia y velocidad de
+decodificación configurables) pasando el texto, según se genera, por el mismo
+FlowStreamParser que usa /generate_stream. Mide por caso el tiempo hasta el
+primer token, hasta el primer elemento del flow (lo primero que el cliente
+puede dibujar) y hasta el final de la generación, y comprueba que los
+elementos extraídos en streaming son los mismos que los del JSON final.
+
+Uso:
+    python stream_benchmark.py --tokens-per-second 30 --latency-ms 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'server'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'bpmn_system', 'benchmarks'))
+
+from benchmark import PRUEBAS_DIR, load_pruebas_cases
+from backends import FakeBackend
+from flow_stream import FlowStreamParser
+from prompts import build_prompt_suffix, extract_process_json
+
+
+def stream_case(backend, case):
+    """Generates one case feeding the parser from `on_text`; returns its timings."""
+    parser = FlowStreamParser()
+    times = {}
+
+    def on_text(text):
+        times.setdefault('first_token', time.perf_counter())
+        if parser.feed(text):
+            times.setdefault('first_element', time.perf_counter())
+
+    ti = time.perf_counter()
+    result = backend.generate(build_prompt_suffix(case.context, case.prompt), on_text=on_text)
+    total = time.perf_counter() - ti
+
+    flow = extract_process_json(result.text).get('flow', [])
+    return {
+        'case': case.name,
+        'elements': len(flow),
+        'first_token_s': times['first_token'] - ti if 'first_token' in times else None,
+        'first_element_s': times['first_element'] - ti if 'first_element' in times else None,
+        'total_s': total,
+        'identical': parser.elements == flow,
+    }
+
+
+def mean_of(results, key):
+    values = [result[key] for result in results if result[key] is not None]
+    return statistics.mean(values) if values else None
+
+
+def _seconds(value):
+    return f"{'-':>10}" if value is None else f"{value:>10.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del tiempo hasta el primer elemento en streaming")
+    parser.add_argument('--tokens-per-second', type=float, default=30.0,
+                        help="Velocidad de decodificación simulada por el backend fake")
+    parser.add_argument('--latency-ms', type=float, default=500.0,
+                        help="Tiempo hasta el primer token simulado por el backend fake")
+    parser.add_argument('--cases', type=int, default=None, help="Número máximo de casos de Pruebas")
+    parser.add_argument('--output', help="Fichero JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    cases = load_pruebas_cases()[:args.cases]
+    backend = FakeBackend(responses_dir=PRUEBAS_DIR, latency_ms=args.latency_ms,
+                          tokens_per_second=args.tokens_per_second)
+
+    print(f"{'caso':<14}{'elementos':>10}{'1er token s':>12}{'1er elem. s':>12}{'total s':>10}"
+          f"{'1er elem./total':>17}{'idéntico':>10}")
+    results = []
+    for case in cases:
+        result = stream_case(backend, case)
+        results.append(result)
+        ratio = f"{result['first_element_s'] / result['total_s']:>16.0%}" if result['first_element_s'] else f"{'-':>16}"
+        print(f"{case.name:<14}{result['elements']:>10}  {_seconds(result['first_token_s'])}"
+              f"  {_seconds(result['first_element_s'])}{_seconds(result['total_s'])} {ratio}"
+              f"{'sí' if result['identical'] else 'NO':>10}")
+
+    summary = {key: mean_of(results, key) for key in ('first_token_s', 'first_element_s', 'total_s')}
+    print(f"\nMedia: primer token {_seconds(summary['first_token_s']).strip()} s, "
+          f"primer elemento {_seconds(summary['first_element_s']).strip()} s, "
+          f"total {_seconds(summary['total_s']).strip()} s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'tokens_per_second': args.tokens_per_second, 'latency_ms': args.latency_ms,
+                       'summary': summary, 'results': results}, f, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+    if not all(result['identical'] for result in results):
+        sys.exit("Los elementos extraídos en streaming no coinciden con el flow del JSON final")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 # app.py
 import streamlit as st
 import requests
-from bpmn_generator import FlexibleBPMNGenerator
+from diagram_renderer import RenderCache, render_process
+from diagram_builder import DiagramBuilder
+from bpmn_xml import export_bpmn_xml
 import json
-import tempfile
 import os
+import time
 
 # Configuración de la página
 st.set_page_config(
@@ -16,7 +18,116 @@ st.set_page_config(
 SERVER_HOST = "localhost"  # o la IP del servidor si es necesario
 SERVER_PORT = 5000
 SERVER_URL = f"http://{SERVER_HOST}:{SERVER_PORT}"
-JSON_PATH = "/home/fgarcia/bpmn_system/client/process.json"
+
+# Tiempos de espera (segundos) para las llamadas al servidor; el servidor envía un
+# comentario cada 15 s sin eventos, así que STREAM_READ_TIMEOUT solo salta si se cae
+REQUEST_TIMEOUT = 10
+STREAM_READ_TIMEOUT = 60
+JOB_TIMEOUT = 600
+
+# Intervalo mínimo (segundos) entre dos redibujados del diagrama parcial
+PARTIAL_RENDER_INTERVAL = 0.5
+
+# Caché de diagramas renderizados (BPMN_RENDER_CACHE_DIR la guarda también en disco)
+RENDER_CACHE_MB = 64
+
+
+@st.cache_resource
+def get_render_cache():
+    """Una sola caché para todas las ejecuciones del script de Streamlit."""
+    return RenderCache(
+        max_bytes=RENDER_CACHE_MB * 2**20,
+        cache_dir=os.environ.get('BPMN_RENDER_CACHE_DIR')
+    )
+
+
+def list_knowledge_bases():
+    """Bases de conocimiento del servidor; 'default' es el contexto por defecto."""
+    try:
+        response = requests.get(f"{SERVER_URL}/knowledge_bases", timeout=REQUEST_TIMEOUT)
+        return ["default"] + response.json().get("available", [])
+    except (requests.RequestException, ValueError):
+        return ["default"]
+
+
+def stream_process_json(prompt, knowledge_base="default"):
+    """
+    Genera el proceso con /generate_stream y devuelve sus eventos a medida que llegan.
+
+    Yields:
+        tuple: (evento, datos) con evento 'tokens', 'element' o 'done'
+
+    Raises:
+        RuntimeError: si el servidor rechaza la petición, la generación falla o se agota el tiempo
+    """
+    deadline = time.time() + JOB_TIMEOUT
+    with requests.post(
+        f"{SERVER_URL}/generate_stream",
+        json={"prompt": prompt, "knowledge_base": knowledge_base},
+        headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+        stream=True,
+        timeout=(REQUEST_TIMEOUT, STREAM_READ_TIMEOUT)
+    ) as response:
+        if response.status_code != 200:
+            raise RuntimeError(f"El servidor no aceptó la petición: {response.text}")
+        response.encoding = 'utf-8'
+
+        # Formato SSE: líneas "event:" y "data:" terminadas por una línea vacía; ":" es un comentario
+        event, data_lines = 'message', []
+        for line in response.iter_lines(decode_unicode=True):
+            if time.time() > deadline:
+                # Al cerrar la conexión el servidor cancela la generación
+                raise RuntimeError(f"La generación superó el tiempo máximo de {JOB_TIMEOUT} segundos")
+            if line:
+                field, _, value = line.partition(':')
+                if field == 'event':
+                    event = value.strip()
+                elif field == 'data':
+                    data_lines.append(value[1:] if value.startswith(' ') else value)
+                continue
+            if not data_lines:
+                continue
+
+            data = json.loads('\n'.join(data_lines))
+            if event == 'error':
+                raise RuntimeError(f"La generación terminó con estado '{data.get('status')}': {data.get('error', '')}")
+            yield event, data
+            if event == 'done':
+                return
+            event, data_lines = 'message', []
+
+    raise RuntimeError("El servidor cerró la conexión antes de terminar la generación")
+
+
+def generate_with_progress(prompt, knowledge_base, progress, partial_diagram):
+    """
+    Consume el stream de generación dibujando el proceso según llegan sus elementos.
+
+    Returns:
+        tuple: (datos del evento 'done', segundos hasta el primer elemento visible, segundos totales)
+    """
+    started = time.time()
+    first_element = None
+    last_render = 0.0
+    builder = DiagramBuilder()
+
+    for event, data in stream_process_json(prompt, knowledge_base):
+        if event == 'done':
+            return data, first_element, time.time() - started
+        if event != 'element':
+            continue
+
+        builder.add_element(data['element'])
+        now = time.time()
+        # El primer elemento se dibuja siempre; los siguientes, como mucho cada PARTIAL_RENDER_INTERVAL
+        if now - last_render >= PARTIAL_RENDER_INTERVAL:
+            # Graphviz en el navegador: el diagrama parcial no pasa por dot ni por la caché
+            partial_diagram.graphviz_chart(builder.source())
+            last_render = now
+            if first_element is None:
+                first_element = now - started
+        progress.caption(f"Generando... {data['index'] + 1} elementos recibidos")
+
 
 # Título y descripción
 st.title("Generador de Diagramas BPMN")
@@ -32,65 +143,75 @@ user_prompt = st.text_area(
     placeholder="Ejemplo: Quiero modelar el proceso de contratación de un nuevo empleado..."
 )
 
+# Base de conocimiento usada como contexto
+knowledge_base = st.selectbox("Base de conocimiento:", list_knowledge_bases())
+
 # Botón para generar el diagrama
 if st.button("Generar Diagrama BPMN"):
     if user_prompt:
         with st.spinner("Generando diagrama..."):
             try:
-                # Llamada al servidor para generar el JSON
-                response = requests.post(
-                    f"{SERVER_URL}/generate_json",
-                    json={"prompt": user_prompt},
-                    headers={"Content-Type": "application/json"}
-                )
+                # El diagrama se va dibujando mientras el servidor genera el JSON
+                progress = st.empty()
+                partial_diagram = st.empty()
+                try:
+                    done, first_element, total_time = generate_with_progress(
+                        user_prompt, knowledge_base, progress, partial_diagram
+                    )
+                    job_id, process_json = done['request_id'], done['data']
+                except RuntimeError as e:
+                    st.error(f"Error al generar el diagrama. {str(e)}")
+                    process_json = None
+                finally:
+                    progress.empty()
+                    partial_diagram.empty()
                 
-                if response.status_code == 200:
-                    # Leer el JSON del archivo guardado
+                if process_json is not None:
                     try:
-                        with open(JSON_PATH, 'r', encoding='utf-8') as f:
-                            process_json = json.load(f)
+                        st.caption(f"ID de petición: {job_id}")
+                        if first_element is not None:
+                            st.caption(f"Primer elemento visible en {first_element:.2f} s · "
+                                       f"latencia total {total_time:.2f} s")
+                        else:
+                            st.caption(f"Latencia total {total_time:.2f} s")
                         
                         # Mostrar el JSON generado (colapsado por defecto)
                         with st.expander("Ver JSON generado"):
                             st.json(process_json)
                         
-                        # Generar el diagrama BPMN
-                        generator = FlexibleBPMNGenerator()
+                        # Generar el diagrama BPMN: un solo layout para todos los formatos,
+                        # servido desde la caché si el JSON no ha cambiado
+                        rendered = render_process(process_json, ('png', 'pdf'), cache=get_render_cache())
+                        
+                        # Mostrar el diagrama
+                        st.image(rendered['png'])
                         
-                        # Crear un directorio temporal para los archivos generados
-                        with tempfile.TemporaryDirectory() as temp_dir:
-                            output_path = os.path.join(temp_dir, "bpmn_diagram")
-                            diagram = generator.create_bpmn_diagram(process_json)
-                            
-                            # Guardar el diagrama en diferentes formatos
-                            diagram.render(output_path, format='png', cleanup=True)
-                            diagram.render(output_path, format='pdf', cleanup=True)
-                            
-                            # Mostrar el diagrama
-                            st.image(f"{output_path}.png")
-                            
-                            # Botones de descarga
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                with open(f"{output_path}.png", "rb") as file:
-                                    st.download_button(
-                                        label="Descargar PNG",
-                                        data=file,
-                                        file_name="diagrama_bpmn.png",
-                                        mime="image/png"
-                                    )
-                            with col2:
-                                with open(f"{output_path}.pdf", "rb") as file:
-                                    st.download_button(
-                                        label="Descargar PDF",
-                                        data=file,
-                                        file_name="diagrama_bpmn.pdf",
-                                        mime="application/pdf"
-                                    )
+                        # Botones de descarga
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.download_button(
+                                label="Descargar PNG",
+                                data=rendered['png'],
+                                file_name="diagrama_bpmn.png",
+                                mime="image/png"
+                            )
+                        with col2:
+                            st.download_button(
+                                label="Descargar PDF",
+                                data=rendered['pdf'],
+                                file_name="diagrama_bpmn.pdf",
+                                mime="application/pdf"
+                            )
+                        with col3:
+                            # BPMN 2.0 XML con layout propio, importable en herramientas BPMN
+                            st.download_button(
+                                label="Descargar BPMN (XML)",
+                                data=export_bpmn_xml(process_json),
+                                file_name="diagrama_bpmn.bpmn",
+                                mime="application/xml"
+                            )
                     except Exception as e:
-                        st.error(f"Error al leer el archivo JSON: {str(e)}")
-                else:
-                    st.error(f"Error al generar el diagrama. Respuesta del servidor: {response.text}")
+                        st.error(f"Error al procesar el JSON recibido: {str(e)}")
             
             except Exception as e:
                 st.error(f"Error de conexión: {str(e)}")
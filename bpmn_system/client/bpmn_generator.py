@@ -1,27 +1,32 @@
 import graphviz
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Optional, Tuple, Union
+from flow_ir import FlowIR, NO_STRING, EVENT, TASK, GATEWAY, LOOP, compile_flow
+
+# Identifier of an element in the diagram: a node id, or (entry, exit) node ids
+# for gateways and loops, or None for elements that could not be drawn
+NodeRef = Optional[Union[str, Tuple[str, str]]]
 
 
 class FlexibleBPMNGenerator:
     def __init__(self):
         self.node_counter = 0
         self.existing_nodes = set()
-        self.node_map = {}  # Mapping of node names to IDs
-        self.processed_tasks = set()  # Set of processed task names (strings)
+        self.task_ids = {}  # Interned task name (string id) -> node id
+        self.ir = None
 
     def get_unique_node_id(self, name: str) -> str:
         """Generates a unique ID for each node."""
-        base_id = "".join(c for c in str(name) if c.isalnum())
-        
+        return self._unique_id("".join(c for c in str(name) if c.isalnum()))
+
+    def _unique_id(self, base_id: str) -> str:
+        """Unique node ID from an already filtered (alphanumeric) base."""
         if base_id not in self.existing_nodes:
             self.existing_nodes.add(base_id)
-            self.node_map[name] = base_id
             return base_id
         
         self.node_counter += 1
         new_id = f"{base_id}_{self.node_counter}"
         self.existing_nodes.add(new_id)
-        self.node_map[name] = new_id
         return new_id
 
     def create_legend(self, dot: graphviz.Digraph) -> None:
@@ -97,8 +102,11 @@ class FlexibleBPMNGenerator:
                 for node_type, _, _, _, _ in node_types:
                     row.node(f"icon_{node_type}")
 
-    def create_bpmn_diagram(self, data: Dict[str, Any]) -> graphviz.Digraph:
-        """Creates a BPMN diagram with a fully connected flow."""
+    def create_bpmn_diagram(self, data: Union[Dict[str, Any], FlowIR]) -> graphviz.Digraph:
+        """Creates a BPMN diagram with a fully connected flow from a process JSON or its FlowIR."""
+        ir = data if isinstance(data, FlowIR) else compile_flow(data)
+        self.ir = ir
+
         dot = graphviz.Digraph(comment='BPMN Diagram')
         dot.attr(rankdir='TB')  # Diagrama global en dirección vertical
         dot.attr('node', fontname='Helvetica')
@@ -110,20 +118,18 @@ class FlexibleBPMNGenerator:
         with dot.subgraph(name='cluster_main') as main:
             main.attr(style='invis')
             # Procesar el flujo principal
-            if 'flow' in data:
-                self.process_flow(main, data['flow'])
+            self.process_flow(main, 0)
         
         # Crear un nodo espaciador
         dot.node('spacer', '', shape='none', height='0.5', style='invis')
         
         # Conectar el último nodo del flujo principal con el espaciador
-        if 'flow' in data and len(data['flow']) > 0:
-            last_elem = data['flow'][-1]
-            if 'name' in last_elem and last_elem.get('type') == 'evento':
-                last_node_name = last_elem['name']
-                last_node_id = self.node_map.get(last_node_name)
-                if last_node_id:
-                    dot.edge(last_node_id, 'spacer', style='invis')
+        # (solo si el evento final comparte nombre con una tarea, como en la versión anterior)
+        last = ir.last_child(0)
+        if last >= 0 and ir.kind[last] == EVENT:
+            last_node_id = self.task_ids.get(ir.name[last])
+            if last_node_id:
+                dot.edge(last_node_id, 'spacer', style='invis')
         
         # Crear la leyenda en un subgrafo separado
         with dot.subgraph(name='cluster_legend') as legend_section:
@@ -132,10 +138,26 @@ class FlexibleBPMNGenerator:
         
         return dot
 
-    def process_evento(self, dot: graphviz.Digraph, evento: Dict[str, Any]) -> str:
+    def process_element(self, dot: graphviz.Digraph, index: int) -> NodeRef:
+        """Draws one element of the IR and returns how to connect to it."""
+        kind = self.ir.kind[index]
+        if kind == EVENT:
+            return self.process_evento(dot, index)
+        if kind == TASK:
+            return self.process_task(dot, index)
+        if kind == GATEWAY:
+            # Nodo de división y nodo de unión
+            return self.process_gateway(dot, index)
+        if kind == LOOP:
+            # Nodo de inicio y nodo de salida del bucle
+            return self.process_loop(dot, index)
+        return None  # Placeholder para mantener la alineación
+
+    def process_evento(self, dot: graphviz.Digraph, index: int) -> str:
         """Procesa un evento (inicio o fin) dentro del flujo."""
-        event_name = evento.get('name', '')
-        node_id = self.get_unique_node_id(f"evento_{event_name}")
+        ir = self.ir
+        event_name = ir.strings[ir.name[index]]
+        node_id = self._unique_id("evento" + ir.base_id(ir.name[index]))
         
         if event_name.lower() == 'inicio':
             shape = 'circle'
@@ -162,9 +184,9 @@ class FlexibleBPMNGenerator:
                     penwidth='2.0')
             
             # Añadir etiqueta para el motivo de fin si existe
-            if 'condicion' in evento:
-                label_id = self.get_unique_node_id(f"fin_label_{event_name}")
-                condition_text = evento.get('condicion', '')
+            if ir.text[index] != NO_STRING:
+                label_id = self._unique_id("finlabel" + ir.base_id(ir.name[index]))
+                condition_text = ir.strings[ir.text[index]]
                 dot.node(label_id, condition_text,
                         shape='box',
                         style='filled,dashed',
@@ -188,9 +210,9 @@ class FlexibleBPMNGenerator:
                 
         return node_id
 
-    def create_condition_node(self, dot: graphviz.Digraph, condition_text: str, name_prefix: str) -> str:
+    def create_condition_node(self, dot: graphviz.Digraph, condition_text: str, base_id: str) -> str:
         """Crea un nodo de condición."""
-        node_id = self.get_unique_node_id(f"condition_{name_prefix}")
+        node_id = self._unique_id("condition" + base_id)
         
         dot.node(node_id, condition_text,
                 shape='box',
@@ -201,50 +223,13 @@ class FlexibleBPMNGenerator:
                 
         return node_id
 
-    def process_flow(self, dot: graphviz.Digraph, flow: List[Dict[str, Any]]) -> None:
-        """Processes the sequential flow array and connects all elements."""
-        previous_node_id = None
-        
+    def process_flow(self, dot: graphviz.Digraph, index: int) -> None:
+        """Processes a sequence of the IR (the main flow) and connects all elements."""
         # Primera pasada: crear todos los nodos
         node_ids = []
-        for element in flow:
-            element_type = element.get('type')
-            
-            if not element_type:
-                print(f"Warning: Skipping element without type: {element}")
-                continue
-            
+        for child in self.ir.children(index):
             try:
-                if element_type == 'evento':
-                    node_id = self.process_evento(dot, element)
-                    node_ids.append(node_id)
-                    
-                elif element_type == 'tarea':
-                    node_id = self.process_task(dot, element)
-                    node_ids.append(node_id)
-                    
-                elif element_type == 'pasarela':
-                    # Procesamos la pasarela y obtenemos el nodo de inicio y el nodo de unión
-                    gateway_id, merge_id = self.process_gateway(dot, element)
-                    
-                    # Guardamos directamente el merge_id como punto final
-                    # Eliminamos el nodo neutro
-                    node_ids.append((gateway_id, merge_id))
-                    
-                elif element_type == 'bucle':
-                    # Procesamos el bucle y obtenemos el nodo de inicio y el nodo de salida
-                    loop_start_id, loop_end_id = self.process_loop(dot, element)
-                    
-                    # Guardamos directamente el nodo de fin de bucle
-                    node_ids.append((loop_start_id, loop_end_id))
-                
-                else:
-                    print(f"Warning: Unrecognized element type: {element_type}")
-                    node_ids.append(None)  # Placeholder para mantener la alineación
-                    
-            except KeyError as e:
-                print(f"Error processing element: Missing key {e}")
-                node_ids.append(None)
+                node_ids.append(self.process_element(dot, child))
             except Exception as e:
                 print(f"Unexpected error processing flow element: {e}")
                 node_ids.append(None)
@@ -271,19 +256,37 @@ class FlexibleBPMNGenerator:
                 
             dot.edge(from_node, to_node, penwidth='1.5')
 
-    def process_task(self, dot: graphviz.Digraph, task: Dict[str, Any]) -> str:
-        """Processes a single task."""
-        task_name = str(task.get('name', ''))
-        task_description = task.get('description', task_name)
+    def process_chain(self, dot: graphviz.Digraph, index: int, start_id: str) -> str:
+        """
+        Draws the contents of a branch or loop body after `start_id`, connecting
+        each element to the previous one, and returns the last node.
+        """
+        last_id = start_id
+        for child in self.ir.children(index):
+            node = self.process_element(dot, child)
+            if node is None:
+                continue
+            entry, exit_id = node if isinstance(node, tuple) else (node, node)
+            dot.edge(last_id, entry, penwidth='1.5')
+            last_id = exit_id
+        return last_id
+
+    def process_task(self, dot: graphviz.Digraph, index: int) -> str:
+        """Processes a single task; a task name already drawn reuses its node."""
+        ir = self.ir
+        name_id = ir.name[index]
         
         # Verificar si ya procesamos esta tarea
-        if task_name in self.processed_tasks:
-            return self.node_map[task_name]
+        task_id = self.task_ids.get(name_id)
+        if task_id is not None:
+            return task_id
 
-        task_id = self.get_unique_node_id(task_name)
-        self.processed_tasks.add(task_name)
+        task_id = self._unique_id(ir.base_id(name_id))
+        self.task_ids[name_id] = task_id
         
-        dot.node(task_id, task_description,
+        # Las tareas con descripción la muestran en lugar del nombre
+        text_id = ir.text[index] if ir.text[index] != NO_STRING else name_id
+        dot.node(task_id, ir.strings[text_id],
                 shape='box',
                 style='rounded,filled',
                 fillcolor='#E6F3FF',
@@ -293,13 +296,15 @@ class FlexibleBPMNGenerator:
         
         return task_id
 
-    def process_gateway(self, dot: graphviz.Digraph, gateway: Dict[str, Any]) -> tuple:
+    def process_gateway(self, dot: graphviz.Digraph, index: int) -> tuple:
         """Processes a gateway and returns both input and output node IDs."""
-        gateway_id = self.get_unique_node_id(f"gateway_{gateway['name']}")
-        merge_id = self.get_unique_node_id(f"merge_{gateway['name']}")
+        ir = self.ir
+        base = ir.base_id(ir.name[index])
+        gateway_id = self._unique_id("gateway" + base)
+        merge_id = self._unique_id("merge" + base)
 
         # Determinar el tipo de pasarela y sus atributos visuales
-        gateway_type = gateway.get('type_pasarela', 'XOR')
+        gateway_type = ir.strings[ir.text[index]]
         
         if gateway_type == 'XOR':
             label = 'X'
@@ -327,9 +332,8 @@ class FlexibleBPMNGenerator:
                 height='0.5')
 
         # Procesar cada rama
-        for i, branch in enumerate(gateway.get('ramas', [])):
-            branch_name = branch.get('name', f'Rama {i+1}')
-            branch_condition = branch.get('condición', '')
+        for i, branch in enumerate(ir.children(index)):
+            branch_condition = ir.string(ir.text[branch])
             
             branch_start = gateway_id
             
@@ -339,7 +343,7 @@ class FlexibleBPMNGenerator:
                 condition_id = self.create_condition_node(
                     dot, 
                     branch_condition,
-                    f"branch_{gateway['name']}_{i}"
+                    f"branch{base}{i}"
                 )
                 
                 # Conectar el gateway al nodo de condición
@@ -348,38 +352,20 @@ class FlexibleBPMNGenerator:
                 # La condición es ahora el punto de inicio para las tareas
                 branch_start = condition_id
             
-            for task_name in branch.get('tareas', []):
-                # Asegurarnos de que task_name sea string
-                task_name = str(task_name)
-                
-                # Verificar si la tarea ya existe
-                if task_name in self.processed_tasks:
-                    task_id = self.node_map[task_name]
-                else:
-                    task_id = self.get_unique_node_id(task_name)
-                    dot.node(task_id, task_name,
-                            shape='box',
-                            style='rounded,filled',
-                            fillcolor='#E6F3FF',
-                            penwidth='2.0',
-                            height='0.6',
-                            margin='0.3,0.2')
-                    self.processed_tasks.add(task_name)
-                
-                # Conectar desde la condición o la tarea anterior
-                dot.edge(branch_start, task_id, penwidth='1.5')
-                branch_start = task_id
-            
-            # Conectar la última tarea al merge
+            # Tareas (o elementos anidados) de la rama, y la última conectada al merge
+            branch_start = self.process_chain(dot, branch, branch_start)
             dot.edge(branch_start, merge_id, penwidth='1.5')
 
         return gateway_id, merge_id
 
-    def process_loop(self, dot: graphviz.Digraph, loop: Dict[str, Any]) -> tuple:
+    def process_loop(self, dot: graphviz.Digraph, index: int) -> tuple:
         """Processes a loop structure and returns both input and output node IDs."""
+        ir = self.ir
+        base = ir.base_id(ir.name[index])
+
         # Creamos nodos para inicio y fin del bucle
-        loop_start_id = self.get_unique_node_id(f"loop_start_{loop['name']}")
-        loop_end_id = self.get_unique_node_id(f"loop_end_{loop['name']}")
+        loop_start_id = self._unique_id("loopstart" + base)
+        loop_end_id = self._unique_id("loopend" + base)
 
         # Nodo de inicio del bucle
         dot.node(loop_start_id, "",
@@ -399,34 +385,15 @@ class FlexibleBPMNGenerator:
                 height='0.7',
                 width='0.7')
 
-        # Procesar las tareas del bucle
-        last_task_id = loop_start_id
-        for task_name in loop.get('tareas', []):
-            task_name = str(task_name)
-            
-            # Verificar si la tarea ya existe
-            if task_name in self.processed_tasks:
-                task_id = self.node_map[task_name]
-            else:
-                task_id = self.get_unique_node_id(task_name)
-                dot.node(task_id, task_name,
-                        shape='box',
-                        style='rounded,filled',
-                        fillcolor='#E6F3FF',
-                        penwidth='2.0',
-                        height='0.6',
-                        margin='0.3,0.2')
-                self.processed_tasks.add(task_name)
-            
-            dot.edge(last_task_id, task_id, penwidth='1.5')
-            last_task_id = task_id
+        # Procesar las tareas (o elementos anidados) del bucle
+        last_task_id = self.process_chain(dot, index, loop_start_id)
 
         # Crear nodo de condición de cierre del bucle
-        condition_text = loop.get('condición', '')
+        condition_text = ir.string(ir.text[index])
         loop_condition_id = self.create_condition_node(
             dot, 
             condition_text,
-            f"loop_cond_{loop['name']}"
+            "loopcond" + base
         )
         
         # Conectar la última tarea con el nodo de condición
@@ -441,11 +408,11 @@ class FlexibleBPMNGenerator:
         return loop_start_id, loop_end_id
 
 
-def create_and_save_bpmn(json_data: Dict[str, Any], output_filename: str) -> None:
-    """Creates and saves a BPMN diagram from JSON data."""
-    generator = FlexibleBPMNGenerator()
-    diagram = generator.create_bpmn_diagram(json_data)
-    
-    diagram.render(output_filename, format='png', cleanup=True)
-    diagram.render(output_filename, format='pdf', cleanup=True)
-    diagram.render(output_filename, format='svg', cleanup=True)
\ No newline at end of file
+def create_and_save_bpmn(json_data: Dict[str, Any], output_filename: str,
+                         formats=('png', 'pdf', 'svg'), cache=None) -> None:
+    """Creates and saves a BPMN diagram from JSON data, laid out once for all formats."""
+    from diagram_renderer import render_process
+
+    for fmt, data in render_process(json_data, formats, cache=cache).items():
+        with open(f"{output_filename}.{fmt}", 'wb') as f:
+            f.write(data)
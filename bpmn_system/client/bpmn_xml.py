@@ -0,0 +1,474 @@
+"""
+Exportación del `flow` a BPMN 2.0 XML con coordenadas de diagrama (BPMN DI).
+
+El layout se calcula en Python, sin Graphviz, aprovechando la estructura del
+flujo: una secuencia principal de izquierda a derecha, las ramas de cada
+pasarela apiladas entre el nodo de división y el de unión, y los bucles con su
+arco de retorno por encima. Cada bloque se mide y se coloca una sola vez, así
+que el tiempo crece linealmente con el tamaño del proceso. El XML resultante se
+puede abrir en herramientas BPMN (Camunda Modeler, bpmn.io, Signavio...).
+"""
+
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Optional, Union
+from flow_ir import FlowIR, NO_STRING, EVENT, TASK, GATEWAY, LOOP, compile_flow
+
+BPMN_NS = 'http://www.omg.org/spec/BPMN/20100524/MODEL'
+BPMNDI_NS = 'http://www.omg.org/spec/BPMN/20100524/DI'
+DC_NS = 'http://www.omg.org/spec/DD/20100524/DC'
+DI_NS = 'http://www.omg.org/spec/DD/20100524/DI'
+XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+
+for _prefix, _uri in (('bpmn', BPMN_NS), ('bpmndi', BPMNDI_NS), ('dc', DC_NS), ('di', DI_NS), ('xsi', XSI_NS)):
+    ET.register_namespace(_prefix, _uri)
+
+# Tamaños de los elementos y separaciones del layout (en píxeles)
+NODE_SIZES = {
+    'task': (100, 80),
+    'startEvent': (36, 36),
+    'endEvent': (36, 36),
+    'intermediateThrowEvent': (36, 36),
+    'exclusiveGateway': (50, 50),
+    'parallelGateway': (50, 50),
+}
+H_GAP = 50
+V_GAP = 30
+LOOP_MARGIN = 40
+MARGIN = 50
+
+
+class DiagramNode:
+    """A BPMN flow node with its bounds once laid out."""
+
+    __slots__ = ('id', 'kind', 'name', 'documentation', 'width', 'height', 'x', 'y', 'incoming', 'outgoing')
+
+    def __init__(self, node_id, kind, name='', documentation=None):
+        self.id = node_id
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.width, self.height = NODE_SIZES[kind]
+        self.x = 0.0
+        self.y = 0.0
+        self.incoming = []
+        self.outgoing = []
+
+    @property
+    def is_gateway(self):
+        return self.kind.endswith('Gateway')
+
+    @property
+    def center_x(self):
+        return self.x + self.width / 2
+
+    @property
+    def center_y(self):
+        return self.y + self.height / 2
+
+
+class DiagramFlow:
+    """A sequence flow; `back` marks the return arc of a loop."""
+
+    __slots__ = ('id', 'source', 'target', 'name', 'condition', 'back', 'waypoints')
+
+    def __init__(self, flow_id, source, target, name='', condition=None, back=False):
+        self.id = flow_id
+        self.source = source
+        self.target = target
+        self.name = name
+        self.condition = condition
+        self.back = back
+        self.waypoints = []
+
+
+class _Block:
+    """Layout unit: measured once (width and extent above/below its center line), then placed."""
+
+    __slots__ = ('width', 'above', 'below')
+
+    def place(self, x, center_y):
+        raise NotImplementedError
+
+
+class _NodeBlock(_Block):
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+        self.width = node.width
+        self.above = self.below = node.height / 2
+
+    def place(self, x, center_y):
+        self.node.x = x
+        self.node.y = center_y - self.node.height / 2
+
+
+class _SequenceBlock(_Block):
+    __slots__ = ('blocks',)
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.width = sum(block.width for block in blocks) + H_GAP * max(len(blocks) - 1, 0)
+        self.above = max((block.above for block in blocks), default=0)
+        self.below = max((block.below for block in blocks), default=0)
+
+    def place(self, x, center_y):
+        for block in self.blocks:
+            block.place(x, center_y)
+            x += block.width + H_GAP
+
+
+class _GatewayBlock(_Block):
+    """Split gateway, branches stacked vertically around the center line, merge gateway."""
+
+    __slots__ = ('split', 'merge', 'branches', 'offsets', 'inner_width', 'center_y')
+
+    def __init__(self, split, merge, branches):
+        self.split = split
+        self.merge = merge
+        self.branches = branches
+        self.inner_width = max((branch.width for branch in branches), default=0)
+        self.width = split.width + merge.width + self.inner_width + 2 * H_GAP
+
+        # Empty branches still need a lane for their split -> merge arc
+        heights = [max(branch.above + branch.below, split.height) for branch in branches]
+        total = sum(heights) + V_GAP * max(len(heights) - 1, 0)
+        self.offsets = []
+        top = -total / 2
+        for branch, height in zip(branches, heights):
+            self.offsets.append(top + max(branch.above, split.height / 2))
+            top += height + V_GAP
+        self.above = max(total / 2, split.height / 2)
+        self.below = max(total / 2, split.height / 2)
+
+    def place(self, x, center_y):
+        self.center_y = center_y
+        _NodeBlock(self.split).place(x, center_y)
+        branch_x = x + self.split.width + H_GAP
+        for branch, offset in zip(self.branches, self.offsets):
+            # Branches narrower than the widest one are centered between the gateways
+            branch.place(branch_x + (self.inner_width - branch.width) / 2, center_y + offset)
+        _NodeBlock(self.merge).place(branch_x + self.inner_width + H_GAP, center_y)
+
+
+class _LoopBlock(_Block):
+    """Entry gateway, loop body, exit gateway; the return arc runs above the body."""
+
+    __slots__ = ('entry', 'exit', 'body', 'return_y')
+
+    def __init__(self, entry, body, exit_gateway):
+        self.entry = entry
+        self.exit = exit_gateway
+        self.body = body
+        self.width = entry.width + exit_gateway.width + body.width + 2 * H_GAP
+        self.above = max(body.above, entry.height / 2) + LOOP_MARGIN
+        self.below = max(body.below, entry.height / 2)
+        self.return_y = 0.0
+
+    def place(self, x, center_y):
+        _NodeBlock(self.entry).place(x, center_y)
+        self.body.place(x + self.entry.width + H_GAP, center_y)
+        _NodeBlock(self.exit).place(x + self.width - self.exit.width, center_y)
+        self.return_y = center_y - self.above + LOOP_MARGIN / 2
+
+
+class BPMNDiagram:
+    """
+    Nodes, sequence flows and layout of a process built from its `flow` JSON.
+
+    Mirrors FlexibleBPMNGenerator: events, tasks, XOR/AND gateways with their
+    branches and loops. Branch conditions become names and condition
+    expressions of the outgoing flows instead of separate nodes, and a task
+    name that appears twice gives two tasks, which keeps the layout a tree.
+    """
+
+    def __init__(self, process_name='Proceso'):
+        self.process_name = process_name
+        self.nodes = []
+        self.flows = []
+        self._loops = []
+        self._empty_branches = []  # (flow, gateway block, branch index)
+        self._counters = {}
+
+    def _new_id(self, prefix):
+        self._counters[prefix] = self._counters.get(prefix, 0) + 1
+        return f"{prefix}_{self._counters[prefix]}"
+
+    def _node(self, kind, name='', documentation=None):
+        prefix = {'task': 'Task', 'startEvent': 'StartEvent', 'endEvent': 'EndEvent',
+                  'intermediateThrowEvent': 'Event'}.get(kind, 'Gateway')
+        node = DiagramNode(self._new_id(prefix), kind, name, documentation)
+        self.nodes.append(node)
+        return node
+
+    def _connect(self, source, target, name='', condition=None, back=False):
+        flow = DiagramFlow(self._new_id('Flow'), source, target, name, condition, back)
+        source.outgoing.append(flow)
+        target.incoming.append(flow)
+        self.flows.append(flow)
+        return flow
+
+    # Construcción a partir de la representación intermedia
+
+    def build(self, data: Union[Dict[str, Any], FlowIR]) -> 'BPMNDiagram':
+        """Builds the nodes and flows from a process JSON or its FlowIR."""
+        self.ir = data if isinstance(data, FlowIR) else compile_flow(data)
+        self.root = self._sequence(0)
+        return self
+
+    def _sequence(self, index: int) -> _SequenceBlock:
+        """Builds the children of a sequence, branch or loop and connects them in order."""
+        blocks = []
+        previous_exit = None
+        for child in self.ir.children(index):
+            built = self._element(child)
+            if built is None:
+                continue
+            block, entry, exit_node = built
+            if previous_exit is not None:
+                self._connect(previous_exit, entry)
+            previous_exit = exit_node
+            blocks.append(block)
+        return _SequenceBlock(blocks)
+
+    def _element(self, index):
+        """Returns (block, entry node, exit node), or None for invalid elements, which are left out."""
+        ir = self.ir
+        kind = ir.kind[index]
+        if kind == EVENT:
+            return self._event(index)
+        if kind == TASK:
+            # Las tareas con descripción la muestran en lugar del nombre
+            text_id = ir.text[index] if ir.text[index] != NO_STRING else ir.name[index]
+            node = self._node('task', ir.strings[text_id])
+            return _NodeBlock(node), node, node
+        if kind == GATEWAY:
+            return self._gateway(index)
+        if kind == LOOP:
+            return self._loop(index)
+        return None
+
+    def _event(self, index):
+        ir = self.ir
+        name = ir.strings[ir.name[index]]
+        if name.lower() == 'inicio':
+            kind = 'startEvent'
+        elif name.lower() == 'fin':
+            kind = 'endEvent'
+        else:
+            kind = 'intermediateThrowEvent'
+        node = self._node(kind, name, documentation=ir.string(ir.text[index], None))
+        return _NodeBlock(node), node, node
+
+    def _gateway(self, index):
+        ir = self.ir
+        kind = 'parallelGateway' if ir.strings[ir.text[index]] == 'AND' else 'exclusiveGateway'
+        split = self._node(kind, ir.strings[ir.name[index]])
+        merge = self._node(kind)
+
+        branches = []
+        empty = []
+        for branch in ir.children(index):
+            sequence = self._sequence(branch)
+            condition = ir.string(ir.text[branch]) if kind == 'exclusiveGateway' else ''
+            name = condition or ir.string(ir.name[branch])
+            if sequence.blocks:
+                first, last = self._ends(sequence)
+                self._connect(split, first, name, condition or None)
+                self._connect(last, merge)
+            else:
+                empty.append((self._connect(split, merge, name, condition or None), len(branches)))
+            branches.append(sequence)
+
+        block = _GatewayBlock(split, merge, branches)
+        self._empty_branches.extend((flow, block, i) for flow, i in empty)
+        return block, split, merge
+
+    def _loop(self, index):
+        ir = self.ir
+        entry = self._node('exclusiveGateway', ir.strings[ir.name[index]])
+        body = self._sequence(index)
+        exit_gateway = self._node('exclusiveGateway', ir.string(ir.text[index]))
+
+        if body.blocks:
+            first, last = self._ends(body)
+            self._connect(entry, first)
+            self._connect(last, exit_gateway)
+        else:
+            self._connect(entry, exit_gateway)
+        self._connect(exit_gateway, entry, back=True)
+
+        block = _LoopBlock(entry, body, exit_gateway)
+        self._loops.append(block)
+        return block, entry, exit_gateway
+
+    def _ends(self, sequence):
+        """First entry and last exit node of a non-empty sequence."""
+        return self._entry(sequence.blocks[0]), self._exit(sequence.blocks[-1])
+
+    def _entry(self, block):
+        if isinstance(block, _NodeBlock):
+            return block.node
+        if isinstance(block, _GatewayBlock):
+            return block.split
+        if isinstance(block, _LoopBlock):
+            return block.entry
+        return self._entry(block.blocks[0])
+
+    def _exit(self, block):
+        if isinstance(block, _NodeBlock):
+            return block.node
+        if isinstance(block, _GatewayBlock):
+            return block.merge
+        if isinstance(block, _LoopBlock):
+            return block.exit
+        return self._exit(block.blocks[-1])
+
+    # Layout
+
+    def layout(self) -> 'BPMNDiagram':
+        """Places every node and routes every flow with orthogonal waypoints."""
+        self.root.place(MARGIN, MARGIN + self.root.above)
+        loop_return = {block.exit.id: block.return_y for block in self._loops}
+        for flow in self.flows:
+            if flow.back:
+                flow.waypoints = self._route_back(flow, loop_return[flow.source.id])
+            else:
+                flow.waypoints = self._route(flow.source, flow.target)
+        for flow, block, i in self._empty_branches:
+            flow.waypoints = self._route_lane(flow, block.center_y + block.offsets[i])
+        return self
+
+    @property
+    def width(self):
+        return self.root.width + 2 * MARGIN
+
+    @property
+    def height(self):
+        return self.root.above + self.root.below + 2 * MARGIN
+
+    @staticmethod
+    def _route(source, target):
+        sy, ty = source.center_y, target.center_y
+        if sy == ty:
+            return [(source.x + source.width, sy), (target.x, ty)]
+
+        down = ty > sy
+        if source.is_gateway:
+            # Split: leave vertically towards the branch, then run along it
+            return [
+                (source.center_x, source.y + source.height if down else source.y),
+                (source.center_x, ty),
+                (target.x, ty),
+            ]
+        if target.is_gateway:
+            # Merge: run along the branch, then enter vertically
+            return [
+                (source.x + source.width, sy),
+                (target.center_x, sy),
+                (target.center_x, target.y if sy < ty else target.y + target.height),
+            ]
+        mid_x = (source.x + source.width + target.x) / 2
+        return [(source.x + source.width, sy), (mid_x, sy), (mid_x, ty), (target.x, ty)]
+
+    @staticmethod
+    def _route_lane(flow, lane_y):
+        """Split -> merge arc of an empty branch, along the lane reserved for it."""
+        source, target = flow.source, flow.target
+        if lane_y == source.center_y:
+            return [(source.x + source.width, lane_y), (target.x, lane_y)]
+        down = lane_y > source.center_y
+        return [
+            (source.center_x, source.y + source.height if down else source.y),
+            (source.center_x, lane_y),
+            (target.center_x, lane_y),
+            (target.center_x, target.y + target.height if down else target.y),
+        ]
+
+    @staticmethod
+    def _route_back(flow, return_y):
+        source, target = flow.source, flow.target
+        return [
+            (source.center_x, source.y),
+            (source.center_x, return_y),
+            (target.center_x, return_y),
+            (target.center_x, target.y),
+        ]
+
+    # XML
+
+    def to_xml(self) -> str:
+        """BPMN 2.0 XML (semantic model plus DI) of the laid out diagram."""
+        definitions = ET.Element(f'{{{BPMN_NS}}}definitions', {
+            'id': 'Definitions_1',
+            'targetNamespace': 'http://bpmn.io/schema/bpmn',
+            'exporter': 'bpmn_system',
+        })
+        process = ET.SubElement(definitions, f'{{{BPMN_NS}}}process', {
+            'id': 'Process_1', 'name': self.process_name, 'isExecutable': 'false'
+        })
+
+        for node in self.nodes:
+            element = ET.SubElement(process, f'{{{BPMN_NS}}}{node.kind}', {'id': node.id})
+            if node.name:
+                element.set('name', node.name)
+            if node.documentation:
+                ET.SubElement(element, f'{{{BPMN_NS}}}documentation').text = node.documentation
+            for flow in node.incoming:
+                ET.SubElement(element, f'{{{BPMN_NS}}}incoming').text = flow.id
+            for flow in node.outgoing:
+                ET.SubElement(element, f'{{{BPMN_NS}}}outgoing').text = flow.id
+
+        for flow in self.flows:
+            element = ET.SubElement(process, f'{{{BPMN_NS}}}sequenceFlow', {
+                'id': flow.id, 'sourceRef': flow.source.id, 'targetRef': flow.target.id
+            })
+            if flow.name:
+                element.set('name', flow.name)
+            if flow.condition:
+                expression = ET.SubElement(element, f'{{{BPMN_NS}}}conditionExpression', {
+                    f'{{{XSI_NS}}}type': 'bpmn:tFormalExpression'
+                })
+                expression.text = flow.condition
+
+        diagram = ET.SubElement(definitions, f'{{{BPMNDI_NS}}}BPMNDiagram', {'id': 'BPMNDiagram_1'})
+        plane = ET.SubElement(diagram, f'{{{BPMNDI_NS}}}BPMNPlane', {'id': 'BPMNPlane_1', 'bpmnElement': 'Process_1'})
+        for node in self.nodes:
+            shape = ET.SubElement(plane, f'{{{BPMNDI_NS}}}BPMNShape', {
+                'id': f'{node.id}_di', 'bpmnElement': node.id
+            })
+            if node.is_gateway:
+                shape.set('isMarkerVisible', 'true')
+            ET.SubElement(shape, f'{{{DC_NS}}}Bounds', {
+                'x': _number(node.x), 'y': _number(node.y),
+                'width': _number(node.width), 'height': _number(node.height),
+            })
+        for flow in self.flows:
+            edge = ET.SubElement(plane, f'{{{BPMNDI_NS}}}BPMNEdge', {
+                'id': f'{flow.id}_di', 'bpmnElement': flow.id
+            })
+            for x, y in flow.waypoints:
+                ET.SubElement(edge, f'{{{DI_NS}}}waypoint', {'x': _number(x), 'y': _number(y)})
+
+        ET.indent(definitions)
+        return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(definitions, encoding='unicode') + '\n'
+
+
+def _number(value):
+    return f"{value:.1f}".rstrip('0').rstrip('.')
+
+
+def layout_process(json_data: Union[Dict[str, Any], FlowIR], process_name: Optional[str] = None) -> BPMNDiagram:
+    """Builds and lays out the diagram of a process JSON (or its FlowIR)."""
+    return BPMNDiagram(process_name or 'Proceso').build(json_data).layout()
+
+
+def export_bpmn_xml(json_data: Union[Dict[str, Any], FlowIR], process_name: Optional[str] = None) -> str:
+    """Converts a process JSON into BPMN 2.0 XML with diagram coordinates."""
+    return layout_process(json_data, process_name).to_xml()
+
+
+def save_bpmn_xml(json_data: Dict[str, Any], output_filename: str, process_name: Optional[str] = None) -> None:
+    """Writes the BPMN 2.0 XML of a process JSON to `output_filename`.bpmn."""
+    with open(f"{output_filename}.bpmn", 'w', encoding='utf-8') as f:
+        f.write(export_bpmn_xml(json_data, process_name))
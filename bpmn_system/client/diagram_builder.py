@@ -0,0 +1,224 @@
+"""
+Construcción incremental del diagrama BPMN a medida que llegan los elementos.
+
+El LLM genera el `flow` elemento a elemento. `DiagramBuilder` los recibe uno a
+uno, completos o por partes (abrir una pasarela, cada rama con sus tareas y
+cerrarla), y guarda entre llamadas el estado de conexión: el último nodo de la
+secuencia principal y la pila de pasarelas, ramas y bucles abiertos. Cada
+elemento se escribe una sola vez en el buffer de DotWriter, con coste constante,
+y `source()` devuelve en cualquier momento un diagrama parcial que Graphviz
+puede renderizar. Con el flujo completo, el código es idéntico al de `write_dot`
+con el JSON entero.
+"""
+
+from typing import Any, Dict, Optional, Union
+from dot_writer import DotWriter, FLOW_EDGE, HEADER, INDENT
+from flow_ir import (FlowIR, NO_STRING, SEQUENCE, EVENT, TASK, GATEWAY, LOOP, BRANCH,
+                     INVALID, KIND_NAMES, child_list)
+
+# Secuencias a las que se pueden añadir elementos
+CHAIN_KINDS = (SEQUENCE, BRANCH, LOOP)
+
+
+class _Frame:
+    """An open part of the flow: the main sequence, a gateway, one of its branches or a loop."""
+
+    __slots__ = ('kind', 'index', 'entry', 'exit', 'last', 'branches')
+
+    def __init__(self, kind, index, entry=None, exit_id=None):
+        self.kind = kind
+        self.index = index      # Element of the IR
+        self.entry = entry      # Gateway or loop start node
+        self.exit = exit_id     # Merge or loop end node
+        self.last = entry       # Last node of a branch or loop body
+        self.branches = 0       # Branches opened so far in a gateway
+
+
+def _text(item: Dict[str, Any], key: str) -> Optional[str]:
+    # Same conversion as compile_flow: a present key is kept even if it is null
+    return str(item[key]) if key in item else None
+
+
+class DiagramBuilder(DotWriter):
+    """
+    Builds the DOT source of a process diagram one flow element at a time.
+
+    Elements are added either complete (`add_element`, with the same JSON as
+    the `flow` list) or piece by piece (`add_task`, `start_gateway`,
+    `start_branch`, `end_branch`, `end_gateway`, `start_loop`, `end_loop`).
+    Nothing written is revisited: the edges of the main sequence go to their
+    own buffer, which is written after the elements as in `process_flow`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.ir = FlowIR()
+        self._body = []        # Nodes and edges of the elements, in generation order
+        self._flow_edges = []  # Edges between consecutive elements of the main sequence
+        self._frames = [_Frame(SEQUENCE, 0)]
+        self._previous = None  # Last element of the main sequence (node id or entry/exit pair)
+
+    def __len__(self):
+        """Number of elements received (including the branches of gateways)."""
+        return len(self.ir) - 1
+
+    @property
+    def depth(self) -> int:
+        """Number of gateways, branches and loops still open."""
+        return len(self._frames) - 1
+
+    @property
+    def complete(self) -> bool:
+        return len(self._frames) == 1
+
+    def source(self, style: Optional[Dict[str, str]] = None) -> str:
+        """
+        DOT source of the diagram built so far.
+
+        Open gateways and loops are drawn with the nodes they have so far.
+        Once every one of them is closed, the text is the same as `write_dot`
+        for the whole flow.
+        """
+        out = [HEADER]
+        out += self._body
+        out += self._flow_edges
+        self.write_tail(out, style)
+        return "".join(out)
+
+    def _container(self) -> _Frame:
+        frame = self._frames[-1]
+        if frame.kind not in CHAIN_KINDS:
+            raise ValueError(f"Cannot add an element directly to a {KIND_NAMES[frame.kind]}; start a branch first")
+        return frame
+
+    def _pop(self, kind) -> _Frame:
+        frame = self._frames[-1]
+        if frame.kind != kind:
+            raise ValueError(f"No open {KIND_NAMES[kind]} to close (current: {KIND_NAMES[frame.kind]})")
+        return self._frames.pop()
+
+    def _started(self, entry: str) -> None:
+        """Connects the main sequence to an element whose entry node is known."""
+        if self._frames[-1].kind == SEQUENCE and self._previous is not None:
+            previous = self._previous
+            from_node = previous[1] if isinstance(previous, tuple) else previous
+            self._flow_edges.append(f"{INDENT}{from_node} -> {entry}{FLOW_EDGE}")
+
+    def _finished(self, node) -> None:
+        """Chains a finished element (node id, entry/exit pair or None) to the open sequence."""
+        frame = self._frames[-1]
+        if frame.kind == SEQUENCE:
+            self._previous = node
+        elif node is not None:
+            entry, exit_id = node if isinstance(node, tuple) else (node, node)
+            self._body.append(f"{INDENT}{frame.last} -> {entry}{FLOW_EDGE}")
+            frame.last = exit_id
+
+    def _intern(self, value: Optional[str]) -> int:
+        return self.ir.intern(value) if value is not None else NO_STRING
+
+    def add_event(self, name: str, condition: Optional[str] = None) -> str:
+        """Adds a start, end or intermediate event; `condition` is the reason of an end event."""
+        parent = self._container()
+        index = self.ir.add(EVENT, self.ir.intern(name), self._intern(condition), parent.index)
+        node_id = self.process_evento(self._body, index)
+        self._started(node_id)
+        self._finished(node_id)
+        return node_id
+
+    def add_task(self, name: str, description: Optional[str] = None) -> str:
+        """Adds a task; a task name already in the diagram reuses its node."""
+        parent = self._container()
+        index = self.ir.add(TASK, self.ir.intern(name), self._intern(description), parent.index)
+        task_id = self.process_task(self._body, index)
+        self._started(task_id)
+        self._finished(task_id)
+        return task_id
+
+    def _add_invalid(self) -> None:
+        self.ir.add(INVALID, NO_STRING, NO_STRING, self._container().index)
+        self._finished(None)
+
+    def start_gateway(self, name: str, gateway_type: str = 'XOR') -> None:
+        parent = self._container()
+        index = self.ir.add(GATEWAY, self.ir.intern(name), self.ir.intern(gateway_type), parent.index)
+        gateway_id, merge_id = self.open_gateway(self._body, index)
+        self._started(gateway_id)
+        self._frames.append(_Frame(GATEWAY, index, gateway_id, merge_id))
+
+    def start_branch(self, condition: Optional[str] = None, name: Optional[str] = None) -> None:
+        gateway = self._frames[-1]
+        if gateway.kind != GATEWAY:
+            raise ValueError("Branches can only be added to an open gateway")
+        index = self.ir.add(BRANCH, self._intern(name), self._intern(condition), gateway.index)
+        start = self.open_branch(self._body, gateway.index, index, gateway.branches, gateway.entry)
+        gateway.branches += 1
+        self._frames.append(_Frame(BRANCH, index, start))
+
+    def end_branch(self) -> None:
+        branch = self._pop(BRANCH)
+        self._body.append(f"{INDENT}{branch.last} -> {self._frames[-1].exit}{FLOW_EDGE}")
+
+    def end_gateway(self) -> tuple:
+        gateway = self._pop(GATEWAY)
+        node = (gateway.entry, gateway.exit)
+        self._finished(node)
+        return node
+
+    def start_loop(self, name: str, condition: Optional[str] = None) -> None:
+        parent = self._container()
+        index = self.ir.add(LOOP, self.ir.intern(name), self._intern(condition), parent.index)
+        loop_start_id, loop_end_id = self.open_loop(self._body, index)
+        self._started(loop_start_id)
+        self._frames.append(_Frame(LOOP, index, loop_start_id, loop_end_id))
+
+    def end_loop(self, condition: Optional[str] = None) -> tuple:
+        """Closes the innermost loop; `condition` replaces the one given to `start_loop`."""
+        loop = self._pop(LOOP)
+        if condition is not None:
+            self.ir.text[loop.index] = self.ir.intern(condition)
+        self.close_loop(self._body, loop.index, loop.last, loop.entry, loop.exit)
+        node = (loop.entry, loop.exit)
+        self._finished(node)
+        return node
+
+    def add_element(self, item: Union[Dict[str, Any], str]) -> None:
+        """
+        Adds a complete element of the `flow` JSON to the open sequence, with
+        the same handling of malformed elements as compile_flow. Inside a
+        branch or a loop, `item` may also be a task name.
+        """
+        if not isinstance(item, dict):
+            self.add_task(item)
+            return
+
+        element_type = item.get('type')
+        if not element_type:
+            print(f"Warning: Skipping element without type: {item}")
+        elif element_type == 'evento':
+            self.add_event(item.get('name', ''), _text(item, 'condicion'))
+        elif element_type == 'tarea':
+            self.add_task(item.get('name', ''), _text(item, 'description'))
+        elif element_type in ('pasarela', 'bucle'):
+            if 'name' not in item:
+                print("Error processing element: Missing key 'name'")
+                self._add_invalid()
+            elif element_type == 'pasarela':
+                self.start_gateway(item['name'], item.get('type_pasarela', 'XOR'))
+                for branch in child_list(item, 'ramas'):
+                    if not isinstance(branch, dict):
+                        print(f"Warning: Skipping branch that is not an object: {branch!r}")
+                        continue
+                    self.start_branch(_text(branch, 'condición'), _text(branch, 'name'))
+                    for child in child_list(branch, 'tareas'):
+                        self.add_element(child)
+                    self.end_branch()
+                self.end_gateway()
+            else:
+                self.start_loop(item['name'], _text(item, 'condición'))
+                for child in child_list(item, 'tareas'):
+                    self.add_element(child)
+                self.end_loop()
+        else:
+            print(f"Warning: Unrecognized element type: {element_type}")
+            self._add_invalid()
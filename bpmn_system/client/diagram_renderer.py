@@ -0,0 +1,225 @@
+"""
+Renderizado de diagramas con una sola ejecución de Graphviz y caché de resultados.
+
+`dot` calcula el layout una vez y escribe todos los formatos pedidos
+(`-Tpng -o... -Tpdf -o...`) en la misma ejecución. Los resultados se guardan en
+una caché indexada por el hash del JSON del proceso y de los ajustes de estilo
+(incluido el propio generador), con un límite de tamaño en memoria y,
+opcionalmente, en disco; un diagrama que no ha cambiado no vuelve a pasar por
+Graphviz.
+"""
+
+from collections import OrderedDict
+import bpmn_generator
+import dot_writer
+import graphviz
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import threading
+
+DEFAULT_FORMATS = ('png', 'pdf', 'svg')
+
+
+def _generator_fingerprint():
+    # Any change to the node styles of the generator changes the rendered output
+    digest = hashlib.sha256()
+    for module in (bpmn_generator, dot_writer):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+GENERATOR_FINGERPRINT = _generator_fingerprint()
+
+
+def render_key(json_data, style=None):
+    """Hash of the process JSON, the extra graph attributes and the generator code."""
+    payload = json.dumps(
+        {'flow': json_data, 'style': style or {}, 'generator': GENERATOR_FINGERPRINT},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_source(source, formats=DEFAULT_FORMATS, engine='dot'):
+    """
+    Lays out a DOT source once and renders it to every format.
+
+    Returns:
+        dict: format -> bytes
+
+    Raises:
+        graphviz.ExecutableNotFound: If Graphviz is not installed
+        graphviz.CalledProcessError: If Graphviz fails
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cmd = [engine]
+        paths = {}
+        for fmt in formats:
+            paths[fmt] = os.path.join(temp_dir, f"diagram.{fmt}")
+            cmd += [f"-T{fmt}", f"-o{paths[fmt]}"]
+
+        try:
+            proc = subprocess.run(cmd, input=source.encode('utf-8'), capture_output=True)
+        except FileNotFoundError:
+            raise graphviz.ExecutableNotFound(cmd)
+        if proc.returncode != 0:
+            raise graphviz.CalledProcessError(proc.returncode, cmd, output=proc.stdout, stderr=proc.stderr)
+
+        rendered = {}
+        for fmt, path in paths.items():
+            with open(path, 'rb') as f:
+                rendered[fmt] = f.read()
+        return rendered
+
+
+class RenderCache:
+    """
+    LRU of rendered diagrams bounded by total size in bytes.
+
+    Entries are keyed by (render key, format). With `cache_dir` they are also
+    written to disk, which is trimmed to `max_disk_bytes` removing the least
+    recently used files first.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, cache_dir=None, max_disk_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._entries = OrderedDict()  # (key, format) -> bytes, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key, fmt):
+        return os.path.join(self.cache_dir, f"{key}.{fmt}")
+
+    def get(self, key, fmt):
+        with self._lock:
+            data = self._entries.get((key, fmt))
+            if data is not None:
+                self._entries.move_to_end((key, fmt))
+                self.hits += 1
+                return data
+
+        if self.cache_dir and os.path.exists(self._path(key, fmt)):
+            try:
+                with open(self._path(key, fmt), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(key, fmt))
+            except OSError:
+                data = None
+            if data is not None:
+                self._put_memory(key, fmt, data)
+                with self._lock:
+                    self.disk_hits += 1
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, fmt, data):
+        self._put_memory(key, fmt, data)
+        if self.cache_dir:
+            # Write and rename, so a concurrent reader never sees a partial file
+            path = self._path(key, fmt)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._trim_disk()
+
+    def _put_memory(self, key, fmt, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((key, fmt), None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[(key, fmt)] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def render_process(json_data, formats=DEFAULT_FORMATS, cache=None, style=None):
+    """
+    Renders the BPMN diagram of a process JSON to several formats.
+
+    Formats found in `cache` are served from it; the rest are rendered from a
+    single layout and stored.
+
+    Args:
+        json_data (dict): Process JSON
+        formats (tuple): Output formats, e.g. ('png', 'pdf')
+        cache (RenderCache, optional): Cache of rendered diagrams
+        style (dict, optional): Extra graph attributes (e.g. {'dpi': '150'})
+
+    Returns:
+        dict: format -> bytes
+    """
+    key = render_key(json_data, style)
+    rendered = {}
+    if cache is not None:
+        for fmt in formats:
+            data = cache.get(key, fmt)
+            if data is not None:
+                rendered[fmt] = data
+
+    missing = [fmt for fmt in formats if fmt not in rendered]
+    if missing:
+        source = dot_writer.write_dot(json_data, style)
+        for fmt, data in render_source(source, missing).items():
+            rendered[fmt] = data
+            if cache is not None:
+                cache.put(key, fmt, data)
+
+    return {fmt: rendered[fmt] for fmt in formats}
@@ -0,0 +1,274 @@
+"""
+Emisión directa del código DOT del diagrama BPMN.
+
+Produce exactamente el mismo texto que `FlexibleBPMNGenerator.create_bpmn_diagram`
+(`.source`) pero sin pasar por `graphviz.Digraph`: el código se escribe en una
+sola pasada sobre un único buffer. Lo que no depende del proceso se calcula una
+vez por proceso del sistema operativo: la cabecera y la leyenda se obtienen del
+propio generador con un flujo vacío, y los atributos de cada tipo de nodo y
+arista se formatean y entrecomillan una sola vez. Los textos del flujo se
+entrecomillan una vez por cadena distinta de la IR.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+from graphviz.quoting import ID, KEYWORDS, a_list, attr_list, quote
+from bpmn_generator import FlexibleBPMNGenerator
+from flow_ir import FlowIR, NO_STRING, EVENT, compile_flow
+
+
+def _node_attrs(**attrs) -> str:
+    # Resto de la línea de un nodo tras su etiqueta, con el formato de graphviz
+    return f" {a_list(kwargs=attrs)}]\n"
+
+
+def _edge_attrs(**attrs) -> str:
+    return f"{attr_list(kwargs=attrs)}\n"
+
+
+START_ATTRS = _node_attrs(shape='circle', style='filled', fillcolor='#90EE90',
+                          width='0.5', height='0.5', penwidth='2.0')
+END_ATTRS = _node_attrs(shape='doublecircle', style='filled', fillcolor='#FFB6C1',
+                        width='0.6', height='0.6', penwidth='2.0')
+EVENT_ATTRS = _node_attrs(shape='circle', style='filled', fillcolor='#E0E0E0',
+                          width='0.5', height='0.5', penwidth='2.0')
+END_LABEL_ATTRS = _node_attrs(shape='box', style='filled,dashed', fillcolor='#E0E0E0',
+                              fontsize='10', fontcolor='#555555')
+CONDITION_ATTRS = _node_attrs(shape='box', style='filled,dashed', fillcolor='#E0E0E0',
+                              fontsize='9', fontcolor='#555555')
+TASK_ATTRS = _node_attrs(shape='box', style='rounded,filled', fillcolor='#E6F3FF',
+                         penwidth='2.0', height='0.6', margin='0.3,0.2')
+XOR_ATTRS = _node_attrs(shape='diamond', style='filled', fillcolor='#FFFACD',
+                        penwidth='2.0', height='0.7', width='0.7')
+XOR_MERGE_ATTRS = _node_attrs(shape='diamond', style='filled', fillcolor='#FFFACD',
+                              penwidth='2.0', width='0.5', height='0.5')
+AND_ATTRS = _node_attrs(shape='diamond', style='filled', fillcolor='#98FB98',
+                        penwidth='2.0', height='0.7', width='0.7')
+AND_MERGE_ATTRS = _node_attrs(shape='diamond', style='filled', fillcolor='#98FB98',
+                              penwidth='2.0', width='0.5', height='0.5')
+LOOP_ATTRS = _node_attrs(shape='diamond', style='filled', fillcolor='#DDA0DD',
+                         penwidth='2.0', height='0.7', width='0.7')
+
+FLOW_EDGE = _edge_attrs(penwidth='1.5')
+BACK_EDGE = _edge_attrs(penwidth='1.5', constraint='false')
+END_LABEL_EDGE = _edge_attrs(style='dashed', arrowhead='none')
+INVISIBLE_EDGE = _edge_attrs(style='invis')
+
+# Nodos y aristas del subgrafo principal
+INDENT = "\t\t"
+
+
+def quote_id(node_id: str, is_valid_id=ID.match) -> str:
+    """
+    `graphviz.quoting.quote` for node ids: they only hold alphanumeric
+    characters and '_', so they are never HTML strings nor need escaping.
+    """
+    if is_valid_id(node_id) and node_id.lower() not in KEYWORDS:
+        return node_id
+    return f'"{node_id}"'
+
+
+def _split_template():
+    """
+    Header, spacer and legend of the diagram, taken from the generator itself
+    with an empty flow so that both stay in sync.
+    """
+    source = FlexibleBPMNGenerator().create_bpmn_diagram({'flow': []}).source
+    main_end = "\t}\n"
+    spacer = f"\tspacer [label=\"\"{_node_attrs(shape='none', height='0.5', style='invis')}"
+    head, found, legend = source.partition(main_end + spacer)
+    if not found or not legend.endswith("}\n"):
+        raise RuntimeError("Unexpected DOT template from FlexibleBPMNGenerator")
+    return head, main_end + spacer, legend[:-len("}\n")]
+
+
+HEADER, SPACER, LEGEND = _split_template()
+
+
+class DotWriter(FlexibleBPMNGenerator):
+    """
+    Writes the DOT source of FlexibleBPMNGenerator diagrams as text.
+
+    Node ids, ids uniqueness and the order of the statements are those of the
+    generator; the per-element methods take the output buffer (a list of
+    strings) instead of a graphviz.Digraph and return quoted node ids.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._labels = {}  # String id -> quoted label
+
+    def label(self, string_id: int) -> str:
+        """Quoted label of an IR string, computed once per distinct string."""
+        quoted = self._labels.get(string_id)
+        if quoted is None:
+            quoted = quote(self.ir.string(string_id))
+            self._labels[string_id] = quoted
+        return quoted
+
+    def write(self, data: Union[Dict[str, Any], FlowIR], style: Optional[Dict[str, str]] = None) -> str:
+        """
+        DOT source of the diagram of a process JSON or its FlowIR.
+
+        Args:
+            data: Process JSON or its FlowIR
+            style (dict, optional): Extra graph attributes, as `Digraph.attr(**style)`
+
+        Returns:
+            str: Same text as `FlexibleBPMNGenerator().create_bpmn_diagram(data).source`
+        """
+        ir = data if isinstance(data, FlowIR) else compile_flow(data)
+        self.ir = ir
+
+        out = [HEADER]
+        self.process_flow(out, 0)
+        self.write_tail(out, style)
+        return "".join(out)
+
+    def write_tail(self, out: List[str], style: Optional[Dict[str, str]] = None) -> None:
+        """Closes the main subgraph and adds the spacer, the legend and the extra graph attributes."""
+        ir = self.ir
+        out.append(SPACER)
+
+        # Solo si el evento final comparte nombre con una tarea, como en el generador
+        last = ir.last_child(0)
+        if last >= 0 and ir.kind[last] == EVENT:
+            last_node_id = self.task_ids.get(ir.name[last])
+            if last_node_id:
+                out.append(f"\t{last_node_id} -> spacer{INVISIBLE_EDGE}")
+
+        out.append(LEGEND)
+        if style:
+            out.append(f"\t{a_list(kwargs=style)}\n")
+        out.append("}\n")
+
+    def process_evento(self, out: List[str], index: int) -> str:
+        ir = self.ir
+        name_id = ir.name[index]
+        event_name = ir.strings[name_id]
+        node_id = quote_id(self._unique_id("evento" + ir.base_id(name_id)))
+
+        kind = event_name.lower()
+        if kind == 'inicio':
+            out.append(f"{INDENT}{node_id} [label={self.label(name_id)}{START_ATTRS}")
+        elif kind == 'fin':
+            out.append(f"{INDENT}{node_id} [label={self.label(name_id)}{END_ATTRS}")
+            if ir.text[index] != NO_STRING:
+                label_id = quote_id(self._unique_id("finlabel" + ir.base_id(name_id)))
+                out.append(f"{INDENT}{label_id} [label={self.label(ir.text[index])}{END_LABEL_ATTRS}")
+                out.append(f"{INDENT}{node_id} -> {label_id}{END_LABEL_EDGE}")
+        else:
+            out.append(f"{INDENT}{node_id} [label={self.label(name_id)}{EVENT_ATTRS}")
+        return node_id
+
+    def create_condition_node(self, out: List[str], condition_id: int, base_id: str) -> str:
+        node_id = quote_id(self._unique_id("condition" + base_id))
+        out.append(f"{INDENT}{node_id} [label={self.label(condition_id)}{CONDITION_ATTRS}")
+        return node_id
+
+    def process_flow(self, out: List[str], index: int) -> None:
+        node_ids = []
+        for child in self.ir.children(index):
+            try:
+                node_ids.append(self.process_element(out, child))
+            except Exception as e:
+                print(f"Unexpected error processing flow element: {e}")
+                node_ids.append(None)
+
+        for current, next_node in zip(node_ids, node_ids[1:]):
+            if current is None or next_node is None:
+                continue
+            from_node = current[1] if isinstance(current, tuple) else current
+            to_node = next_node[0] if isinstance(next_node, tuple) else next_node
+            out.append(f"{INDENT}{from_node} -> {to_node}{FLOW_EDGE}")
+
+    def process_chain(self, out: List[str], index: int, start_id: str) -> str:
+        last_id = start_id
+        for child in self.ir.children(index):
+            node = self.process_element(out, child)
+            if node is None:
+                continue
+            entry, exit_id = node if isinstance(node, tuple) else (node, node)
+            out.append(f"{INDENT}{last_id} -> {entry}{FLOW_EDGE}")
+            last_id = exit_id
+        return last_id
+
+    def process_task(self, out: List[str], index: int) -> str:
+        ir = self.ir
+        name_id = ir.name[index]
+        task_id = self.task_ids.get(name_id)
+        if task_id is not None:
+            return task_id
+
+        task_id = quote_id(self._unique_id(ir.base_id(name_id)))
+        self.task_ids[name_id] = task_id
+
+        text_id = ir.text[index] if ir.text[index] != NO_STRING else name_id
+        out.append(f"{INDENT}{task_id} [label={self.label(text_id)}{TASK_ATTRS}")
+        return task_id
+
+    def process_gateway(self, out: List[str], index: int) -> tuple:
+        gateway_id, merge_id = self.open_gateway(out, index)
+        for i, branch in enumerate(self.ir.children(index)):
+            branch_start = self.open_branch(out, index, branch, i, gateway_id)
+            branch_start = self.process_chain(out, branch, branch_start)
+            out.append(f"{INDENT}{branch_start} -> {merge_id}{FLOW_EDGE}")
+        return gateway_id, merge_id
+
+    def open_gateway(self, out: List[str], index: int) -> tuple:
+        """Writes the split and merge nodes of a gateway and returns their ids."""
+        ir = self.ir
+        base = ir.base_id(ir.name[index])
+        gateway_id = quote_id(self._unique_id("gateway" + base))
+        merge_id = quote_id(self._unique_id("merge" + base))
+
+        if ir.strings[ir.text[index]] == 'XOR':
+            out.append(f"{INDENT}{gateway_id} [label=X{XOR_ATTRS}")
+            out.append(f"{INDENT}{merge_id} [label=X{XOR_MERGE_ATTRS}")
+        else:
+            out.append(f'{INDENT}{gateway_id} [label="+"{AND_ATTRS}')
+            out.append(f'{INDENT}{merge_id} [label="+"{AND_MERGE_ATTRS}')
+        return gateway_id, merge_id
+
+    def open_branch(self, out: List[str], gateway: int, branch: int, position: int, gateway_id: str) -> str:
+        """
+        Writes the condition node of the `position`-th branch of an XOR
+        gateway, if it has one, and returns the node the branch starts from.
+        """
+        ir = self.ir
+        condition = ir.text[branch]
+        if ir.strings[ir.text[gateway]] != 'XOR' or condition == NO_STRING or ir.strings[condition] == '':
+            return gateway_id
+
+        base = ir.base_id(ir.name[gateway])
+        condition_id = self.create_condition_node(out, condition, f"branch{base}{position}")
+        out.append(f"{INDENT}{gateway_id} -> {condition_id}{FLOW_EDGE}")
+        return condition_id
+
+    def process_loop(self, out: List[str], index: int) -> tuple:
+        loop_start_id, loop_end_id = self.open_loop(out, index)
+        last_task_id = self.process_chain(out, index, loop_start_id)
+        self.close_loop(out, index, last_task_id, loop_start_id, loop_end_id)
+        return loop_start_id, loop_end_id
+
+    def open_loop(self, out: List[str], index: int) -> tuple:
+        """Writes the start and end nodes of a loop and returns their ids."""
+        base = self.ir.base_id(self.ir.name[index])
+        loop_start_id = quote_id(self._unique_id("loopstart" + base))
+        loop_end_id = quote_id(self._unique_id("loopend" + base))
+
+        out.append(f'{INDENT}{loop_start_id} [label=""{LOOP_ATTRS}')
+        out.append(f'{INDENT}{loop_end_id} [label=""{LOOP_ATTRS}')
+        return loop_start_id, loop_end_id
+
+    def close_loop(self, out: List[str], index: int, last_id: str, loop_start_id: str, loop_end_id: str) -> None:
+        """Writes the closing condition of a loop after its last node `last_id`."""
+        base = self.ir.base_id(self.ir.name[index])
+        loop_condition_id = self.create_condition_node(out, self.ir.text[index], "loopcond" + base)
+        out.append(f"{INDENT}{last_id} -> {loop_condition_id}{FLOW_EDGE}")
+        out.append(f"{INDENT}{loop_condition_id} -> {loop_start_id}{BACK_EDGE}")
+        out.append(f"{INDENT}{loop_condition_id} -> {loop_end_id}{FLOW_EDGE}")
+
+
+def write_dot(data: Union[Dict[str, Any], FlowIR], style: Optional[Dict[str, str]] = None) -> str:
+    """DOT source of the BPMN diagram of a process JSON (or its FlowIR)."""
+    return DotWriter().write(data, style)
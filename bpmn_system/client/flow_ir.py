@@ -0,0 +1,234 @@
+"""
+Representación intermedia compacta del `flow` de un proceso.
+
+El JSON se compila una sola vez en un árbol guardado en arrays paralelos (tipo,
+nombre, texto, primer hijo y siguiente hermano de cada elemento) con los textos
+internados en una tabla de cadenas, de modo que los nombres repetidos se
+guardan una vez y se comparan por índice. Las ramas de las pasarelas y los
+cuerpos de los bucles pueden contener tanto nombres de tareas como elementos
+completos, anidados a cualquier profundidad. Los generadores (Graphviz, BPMN XML)
+recorren esta representación en lugar del JSON.
+"""
+
+from array import array
+import sys
+
+# Tipos de elemento
+SEQUENCE, EVENT, TASK, GATEWAY, LOOP, BRANCH, INVALID = range(7)
+
+KIND_NAMES = ('sequence', 'evento', 'tarea', 'pasarela', 'bucle', 'rama', 'invalid')
+
+NO_STRING = -1
+
+_END = object()
+
+
+class FlowIR:
+    """
+    Array-backed tree of a process flow.
+
+    Element 0 is the root sequence (the `flow` list). For every element:
+        kind     one of SEQUENCE, EVENT, TASK, GATEWAY, LOOP, BRANCH, INVALID
+        name     string id of its name (task, event, gateway, loop, branch)
+        text     string id of its second text: task description, event
+                 `condicion`, gateway `type_pasarela`, branch or loop `condición`
+        children linked through first_child / next_sibling
+
+    Missing texts are NO_STRING. INVALID marks elements the generators draw as
+    a gap in the sequence (unknown type or a gateway or loop without name).
+    """
+
+    __slots__ = ('strings', '_string_ids', '_base_ids', 'kind', 'name', 'text',
+                 'first_child', 'next_sibling', '_last_child')
+
+    def __init__(self):
+        self.strings = []
+        self._string_ids = {}
+        self._base_ids = {}
+        self.kind = array('b')
+        self.name = array('i')
+        self.text = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self._last_child = array('i')
+        self.add(SEQUENCE, NO_STRING, NO_STRING, -1)
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern(self, value):
+        """String id of a value (converted to str), adding it to the table if new."""
+        value = str(value)
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(sys.intern(value))
+            self._string_ids[value] = string_id
+        return string_id
+
+    def string(self, string_id, default=''):
+        return self.strings[string_id] if string_id != NO_STRING else default
+
+    def base_id(self, string_id):
+        """Alphanumeric characters of a string (its Graphviz id), computed once per distinct string."""
+        base = self._base_ids.get(string_id)
+        if base is None:
+            base = "".join(c for c in self.strings[string_id] if c.isalnum())
+            self._base_ids[string_id] = base
+        return base
+
+    def add(self, kind, name, text, parent):
+        """Appends an element as the last child of `parent` and returns its index."""
+        index = len(self.kind)
+        self.kind.append(kind)
+        self.name.append(name)
+        self.text.append(text)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self._last_child.append(-1)
+        if parent >= 0:
+            last = self._last_child[parent]
+            if last < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[last] = index
+            self._last_child[parent] = index
+        return index
+
+    def children(self, index):
+        child = self.first_child[index]
+        while child >= 0:
+            yield child
+            child = self.next_sibling[child]
+
+    def has_children(self, index):
+        return self.first_child[index] >= 0
+
+    def last_child(self, index):
+        return self._last_child[index]
+
+    def element(self, index):
+        return Element(self, index)
+
+    @property
+    def root(self):
+        return Element(self, 0)
+
+    def count(self, kind):
+        return self.kind.tobytes().count(bytes([kind]))
+
+    def memory_bytes(self):
+        """Approximate size of the arrays and the string table."""
+        arrays = (self.kind, self.name, self.text, self.first_child, self.next_sibling, self._last_child)
+        return (sum(a.itemsize * len(a) for a in arrays)
+                + sum(sys.getsizeof(s) for s in self.strings))
+
+
+class Element:
+    """Read-only view of one element of a FlowIR."""
+
+    __slots__ = ('ir', 'index')
+
+    def __init__(self, ir, index):
+        self.ir = ir
+        self.index = index
+
+    @property
+    def kind(self):
+        return self.ir.kind[self.index]
+
+    @property
+    def name(self):
+        return self.ir.string(self.ir.name[self.index])
+
+    @property
+    def text(self):
+        """Second text of the element, or None if it is missing."""
+        return self.ir.string(self.ir.text[self.index], None)
+
+    @property
+    def children(self):
+        return [Element(self.ir, child) for child in self.ir.children(self.index)]
+
+    def __repr__(self):
+        return f"Element({KIND_NAMES[self.kind]}, {self.name!r})"
+
+
+def child_list(item, key):
+    """
+    The `ramas` or `tareas` list of an element; any other value is reported
+    and treated as an empty list.
+    """
+    children = item.get(key, [])
+    if not isinstance(children, list):
+        print(f"Warning: Ignoring '{key}' that is not a list: {children!r}")
+        return []
+    return children
+
+
+def compile_flow(data):
+    """
+    Compiles a process JSON into a FlowIR in a single pass.
+
+    Branch `tareas` and loop `tareas` may hold task names or nested elements.
+    The JSON is walked with an explicit stack, so nesting depth is not limited
+    by the recursion limit.
+
+    Returns:
+        FlowIR
+    """
+    ir = FlowIR()
+    # Iterators over pending lists: (iterator, parent index, True if the items are branches)
+    stack = [(iter(data.get('flow', [])), 0, False)]
+
+    while stack:
+        items, parent, branches = stack[-1]
+        item = next(items, _END)
+        if item is _END:
+            stack.pop()
+            continue
+
+        if branches:
+            if not isinstance(item, dict):
+                print(f"Warning: Skipping branch that is not an object: {item!r}")
+                continue
+            branch = ir.add(
+                BRANCH,
+                ir.intern(item['name']) if 'name' in item else NO_STRING,
+                ir.intern(item['condición']) if 'condición' in item else NO_STRING,
+                parent
+            )
+            stack.append((iter(child_list(item, 'tareas')), branch, False))
+            continue
+
+        if not isinstance(item, dict):
+            # Plain task name inside a branch or a loop
+            ir.add(TASK, ir.intern(item), NO_STRING, parent)
+            continue
+
+        element_type = item.get('type')
+        if not element_type:
+            print(f"Warning: Skipping element without type: {item}")
+        elif element_type == 'evento':
+            ir.add(EVENT, ir.intern(item.get('name', '')),
+                    ir.intern(item['condicion']) if 'condicion' in item else NO_STRING, parent)
+        elif element_type == 'tarea':
+            ir.add(TASK, ir.intern(item.get('name', '')),
+                    ir.intern(item['description']) if 'description' in item else NO_STRING, parent)
+        elif element_type in ('pasarela', 'bucle'):
+            if 'name' not in item:
+                print("Error processing element: Missing key 'name'")
+                ir.add(INVALID, NO_STRING, NO_STRING, parent)
+            elif element_type == 'pasarela':
+                gateway = ir.add(GATEWAY, ir.intern(item['name']),
+                                  ir.intern(item.get('type_pasarela', 'XOR')), parent)
+                stack.append((iter(child_list(item, 'ramas')), gateway, True))
+            else:
+                loop = ir.add(LOOP, ir.intern(item['name']),
+                               ir.intern(item['condición']) if 'condición' in item else NO_STRING, parent)
+                stack.append((iter(child_list(item, 'tareas')), loop, False))
+        else:
+            print(f"Warning: Unrecognized element type: {element_type}")
+            ir.add(INVALID, NO_STRING, NO_STRING, parent)
+
+    return ir
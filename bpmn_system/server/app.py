@@ -1,26 +1,280 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from llm_handler import LLMHandler
+from knowledge_bases import KnowledgeBaseNotReadyError, UnknownKnowledgeBaseError
+from backends import create_backend
+from jobs import JobManager, QueueFullError
+from metrics import CONTENT_TYPE, ServerMetrics
+from startup import Startup
+from flow_stream import GenerationStream
 import json
+import os
+import uuid
 
 app = Flask(__name__)
 CORS(app)
 
-# Inicializar el modelo una sola vez al inicio
-llm_handler = LLMHandler()
+# Los modelos se cargan una sola vez, en segundo plano (ver start_server): el puerto queda
+# abierto desde el principio y /readyz indica cuándo se puede enviar tráfico
+# BPMN_BACKEND elige el backend de generación: hf (GPU, por defecto), cpu o fake
+# BPMN_MODEL_PATH indica el modelo de los backends hf y cpu
+# BPMN_PREFIX_CACHE=0 desactiva la reutilización del KV cache del prefijo fijo del prompt
+# BPMN_MAX_BATCH_SIZE y BPMN_BATCH_WAIT_MS configuran la agrupación de peticiones concurrentes
+# BPMN_CONSTRAINED=1 restringe la generación a JSON válido según el esquema del flow
+# BPMN_SPECULATIVE=ngram|draft activa la decodificación especulativa (greedy, de una en una petición);
+# draft usa el modelo pequeño de BPMN_DRAFT_MODEL_PATH y BPMN_DRAFT_TOKENS fija los tokens por borrador
+# BPMN_FAKE_RESPONSES_DIR, BPMN_FAKE_LATENCY_MS y BPMN_FAKE_TOKENS_PER_SECOND configuran el backend fake
+# BPMN_JSON_OUTPUT_DIR guarda además una copia de cada JSON generado en esa carpeta
+# BPMN_CACHE_SIZE (0 la desactiva), BPMN_CACHE_TTL y BPMN_CACHE_DIR configuran la caché de respuestas
+# BPMN_SEMANTIC_CACHE_SIZE (0 la desactiva) y BPMN_SEMANTIC_CACHE_THRESHOLD configuran la caché semántica
+# BPMN_EMBEDDING_DEVICE fuerza el dispositivo del modelo de embeddings (cuda o cpu)
+# BPMN_INDEX_TYPE elige el índice de búsqueda del vectorstore (flat, ivf, hnsw, ivfpq), p. ej. "hnsw,ef_search=64"
+# BPMN_KNOWLEDGE_BASES_DIR contiene una subcarpeta con PDF por base de conocimiento, que las
+# peticiones eligen con "knowledge_base"; BPMN_KNOWLEDGE_BASE_MEMORY_MB limita las cargadas a la vez
+# BPMN_JSON_LOG=1 escribe una línea JSON con los tiempos por etapa de cada petición
+# BPMN_WARMUP=0 omite la generación de calentamiento antes de marcar el servidor como listo
+def build_backend():
+    backend_name = os.environ.get('BPMN_BACKEND', 'hf')
+    if backend_name == 'fake':
+        return create_backend(
+            'fake',
+            responses_dir=os.environ.get('BPMN_FAKE_RESPONSES_DIR'),
+            latency_ms=float(os.environ.get('BPMN_FAKE_LATENCY_MS', '50')),
+            tokens_per_second=float(os.environ.get('BPMN_FAKE_TOKENS_PER_SECOND', '50'))
+        )
+
+    options = {
+        'use_prefix_cache': os.environ.get('BPMN_PREFIX_CACHE', '1') != '0',
+        'constrained_decoding': os.environ.get('BPMN_CONSTRAINED', '0') == '1',
+        'batch_wait_ms': float(os.environ.get('BPMN_BATCH_WAIT_MS', '20')),
+    }
+    if 'BPMN_MODEL_PATH' in os.environ:
+        options['model_path'] = os.environ['BPMN_MODEL_PATH']
+    if 'BPMN_MAX_BATCH_SIZE' in os.environ:
+        options['max_batch_size'] = int(os.environ['BPMN_MAX_BATCH_SIZE'])
+    if os.environ.get('BPMN_SPECULATIVE'):
+        options['speculative'] = os.environ['BPMN_SPECULATIVE']
+        options['draft_model_path'] = os.environ.get('BPMN_DRAFT_MODEL_PATH')
+        if 'BPMN_DRAFT_TOKENS' in os.environ:
+            options['num_draft_tokens'] = int(os.environ['BPMN_DRAFT_TOKENS'])
+    return create_backend(backend_name, **options)
+
+server_metrics = ServerMetrics(json_log=os.environ.get('BPMN_JSON_LOG', '0') == '1')
+startup = Startup(metrics=server_metrics)
+
+# Se asignan durante el arranque; las rutas que los usan responden 503 hasta entonces
+backend = None
+llm_handler = None
+job_manager = None
+
+def load_backend():
+    global backend
+    backend = build_backend()
+
+def load_handler():
+    global llm_handler
+    # Importado aquí: torch y sentence-transformers tardan en cargarse
+    from llm_handler import LLMHandler
+
+    llm_handler = LLMHandler(
+        backend=backend,
+        embedding_device=os.environ.get('BPMN_EMBEDDING_DEVICE'),
+        json_output_dir=os.environ.get('BPMN_JSON_OUTPUT_DIR'),
+        cache_size=int(os.environ.get('BPMN_CACHE_SIZE', '256')),
+        cache_ttl=float(os.environ.get('BPMN_CACHE_TTL', '86400')),
+        cache_dir=os.environ.get('BPMN_CACHE_DIR'),
+        semantic_cache_size=int(os.environ.get('BPMN_SEMANTIC_CACHE_SIZE', '1000')),
+        semantic_cache_threshold=float(os.environ.get('BPMN_SEMANTIC_CACHE_THRESHOLD', '0.92')),
+        metrics=server_metrics,
+        index_config=os.environ.get('BPMN_INDEX_TYPE'),
+        knowledge_bases_dir=os.environ.get('BPMN_KNOWLEDGE_BASES_DIR'),
+        knowledge_base_memory_mb=float(os.environ.get('BPMN_KNOWLEDGE_BASE_MEMORY_MB', '1024')),
+        startup=startup
+    )
+
+def warmup():
+    llm_handler.warmup()
+
+def start_jobs():
+    global job_manager
+    # Pool de workers de generación delante del LLMHandler (BPMN_JOB_WORKERS, BPMN_JOB_QUEUE_SIZE)
+    job_manager = JobManager(
+        llm_handler.generate_json,
+        num_workers=int(os.environ.get('BPMN_JOB_WORKERS', str(llm_handler.backend.max_batch_size))),
+        max_queue_size=int(os.environ.get('BPMN_JOB_QUEUE_SIZE', '32'))
+    )
+    server_metrics.queue_depth.set_function(job_manager.queue_depth)
+
+def start_server():
+    steps = [('backend', load_backend), ('handler', load_handler)]
+    if os.environ.get('BPMN_WARMUP', '1') != '0':
+        steps.append(('warmup', warmup))
+    steps.append(('jobs', start_jobs))
+    startup.start(steps)
+
+start_server()
+
+# Rutas que responden aunque el servidor no haya terminado de arrancar
+ALWAYS_AVAILABLE = {'healthz', 'readyz', 'metrics'}
+
+@app.before_request
+def require_ready():
+    if request.endpoint in ALWAYS_AVAILABLE or startup.is_ready:
+        return None
+    response = jsonify({"success": False, "error": "El servidor está arrancando", **startup.to_dict()})
+    response.status_code = 503
+    response.headers['Retry-After'] = '5'
+    return response
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # El proceso está vivo mientras el arranque no haya fallado
+    status = 500 if startup.status == Startup.FAILED else 200
+    return jsonify(startup.to_dict()), status
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    return jsonify(startup.to_dict()), 200 if startup.is_ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(server_metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats():
+    return jsonify(llm_handler.backend.stats())
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    stats = {}
+    for name, cache in (('exact', llm_handler.response_cache), ('semantic', llm_handler.semantic_cache)):
+        stats[name] = {"enabled": False} if cache is None else {"enabled": True, **cache.stats()}
+    return jsonify(stats)
+
+@app.route('/knowledge_bases', methods=['GET'])
+def knowledge_bases():
+    if llm_handler.knowledge_bases is None:
+        return jsonify({"available": [], "resident": [], "indexing": []})
+    return jsonify(llm_handler.knowledge_bases.stats())
+
+def not_ready_response(error, **fields):
+    # Base de conocimiento sin índice todavía: se está indexando en segundo plano
+    response = jsonify({"success": False, **fields, "error": str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '30'
+    return response
+
+def knowledge_base_error(name):
+    """Error response if the knowledge base can't be used yet (loading it if needed), else None."""
+    try:
+        llm_handler.get_retriever(name)
+    except UnknownKnowledgeBaseError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except KnowledgeBaseNotReadyError as e:
+        return not_ready_response(e)
+    return None
+
+@app.route('/reindex', methods=['POST'])
+def reindex():
+    # Re-embeds only the chunks of the context PDF that changed; the retriever reloads the index
+    try:
+        stats = llm_handler.sync_vectorstore(force=(request.json or {}).get('force', False))
+        return jsonify({"success": True, **stats})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/generate_json', methods=['POST'])
 def generate_json():
+    request_id = uuid.uuid4().hex
     try:
         data = request.json
         user_prompt = data.get('prompt', '')
         
-        # Generar JSON usando el modelo
-        json_output = llm_handler.generate_json(user_prompt)
+        # Generar JSON usando el modelo ("semantic_cache": false evita la caché semántica)
+        process_json = llm_handler.generate_json(
+            user_prompt,
+            request_id=request_id,
+            use_semantic_cache=data.get('semantic_cache', True),
+            knowledge_base=data.get('knowledge_base')
+        )
         
-        return jsonify({"success": True, "data": json_output})
+        return jsonify({"success": True, "request_id": request_id, "data": process_json})
+    except UnknownKnowledgeBaseError as e:
+        return jsonify({"success": False, "request_id": request_id, "error": str(e)}), 404
+    except KnowledgeBaseNotReadyError as e:
+        return not_ready_response(e, request_id=request_id)
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+        return jsonify({"success": False, "request_id": request_id, "error": str(e)}), 500
+
+@app.route('/generate_stream', methods=['POST'])
+def generate_stream():
+    # Server-Sent Events: "tokens" con el texto generado desde el último envío, "element" con cada
+    # elemento del flow en cuanto se cierra, y al final "done" (JSON y tiempos) o "error"
+    data = request.json or {}
+    knowledge_base = data.get('knowledge_base')
+    error = knowledge_base_error(knowledge_base)
+    if error is not None:
+        return error
+
+    stream = GenerationStream()
+    try:
+        job = job_manager.submit(
+            data.get('prompt', ''),
+            use_semantic_cache=data.get('semantic_cache', True),
+            knowledge_base=knowledge_base,
+            on_text=stream.on_text
+        )
+    except QueueFullError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+
+    def events():
+        try:
+            yield from stream.events(job)
+        finally:
+            # El cliente cerró la conexión antes de terminar: liberar el worker
+            if not job.is_finished:
+                job_manager.cancel(job.id)
+            server_metrics.record_stream(**stream.timings())
+
+    return Response(
+        stream_with_context(events()),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Request-Id': job.id}
+    )
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.json or {}
+    user_prompt = data.get('prompt', '')
+    knowledge_base = data.get('knowledge_base')
+    error = knowledge_base_error(knowledge_base)
+    if error is not None:
+        return error
+    try:
+        job = job_manager.submit(
+            user_prompt,
+            use_semantic_cache=data.get('semantic_cache', True),
+            knowledge_base=knowledge_base
+        )
+    except QueueFullError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+
+    return jsonify({"success": True, "job_id": job.id, "status": job.status}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Trabajo no encontrado"}), 404
+
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Trabajo no encontrado"}), 404
+
+    return jsonify({"success": True, "job_id": job.id, "status": job.status})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
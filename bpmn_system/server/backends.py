@@ -0,0 +1,184 @@
+"""
+Backends de generación intercambiables detrás de LLMHandler.generate_json.
+
+Un backend recibe la parte variable del prompt (la parte fija es siempre
+`SYSTEM_PROMPT_PREFIX`) y devuelve el texto generado junto con sus métricas.
+El backend de transformers se importa solo cuando se usa, de modo que el backend
+de pruebas funciona en cualquier máquina sin GPU.
+"""
+
+from batching import GenerationCancelled
+from synthetic_flows import synthetic_flow
+import glob
+import hashlib
+import json
+import os
+import time
+
+
+class GenerationResult:
+    """Text generated for one request plus its token counts and timings."""
+
+    __slots__ = ('text', 'prompt_tokens', 'prefill_tokens', 'generated_tokens',
+                 'time_to_first_token', 'generation_time', 'tokenization_time', 'decode_to_text_time')
+
+    def __init__(self, text, prompt_tokens, prefill_tokens, generated_tokens,
+                 time_to_first_token, generation_time, tokenization_time=0.0, decode_to_text_time=0.0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.prefill_tokens = prefill_tokens
+        self.generated_tokens = generated_tokens
+        # time_to_first_token covers the prefill, the rest of generation_time is decoding
+        self.time_to_first_token = time_to_first_token
+        self.generation_time = generation_time
+        self.tokenization_time = tokenization_time
+        self.decode_to_text_time = decode_to_text_time
+
+
+class GenerationBackend:
+    """
+    Interface of a generation backend.
+
+    Attributes:
+        model_id (str): Identifies the model; part of the response cache key
+        max_new_tokens (int): Generation budget per request
+        max_batch_size (int): Requests the backend can serve at once
+    """
+
+    model_id = 'base'
+    max_new_tokens = 2000
+    max_batch_size = 1
+
+    def generate(self, prompt_suffix, cancel_event=None, on_text=None):
+        """
+        Generates the answer for `SYSTEM_PROMPT_PREFIX + prompt_suffix`.
+
+        If `on_text` is given, it is called with each new piece of the
+        generated text while the generation runs (from the generating thread).
+
+        Returns:
+            GenerationResult
+
+        Raises:
+            GenerationCancelled: If cancel_event is set before the generation ends
+        """
+        raise NotImplementedError
+
+    def count_tokens(self, text):
+        """Number of tokens of `text` for this backend."""
+        raise NotImplementedError
+
+    def warmup(self):
+        """Runs a short generation so the first request does not pay one-off initialization costs."""
+
+    def stats(self):
+        """Backend-specific statistics (e.g. batching)."""
+        return {}
+
+
+class FakeBackend(GenerationBackend):
+    """
+    Deterministic stand-in that returns canned or synthetic flows.
+
+    If `responses_dir` is given, the `*/json.txt` files below it (e.g. the
+    `Pruebas` folder) are served, choosing one from a hash of the prompt;
+    otherwise a synthetic flow of `synthetic_size` elements is generated. The
+    generation is simulated with a time to first token of `latency_ms` and a
+    decoding speed of `tokens_per_second`, counting ~4 characters per token.
+    Requests do not share any state, so `max_batch_size` of them can run at once.
+    With `on_text`, the text is handed out at that speed every STREAM_INTERVAL seconds.
+    """
+
+    CHARS_PER_TOKEN = 4
+    STREAM_INTERVAL = 0.05
+
+    def __init__(self, responses_dir=None, synthetic_size=10, latency_ms=50.0,
+                 tokens_per_second=50.0, max_new_tokens=2000, max_batch_size=8):
+        self.synthetic_size = synthetic_size
+        self.max_batch_size = max_batch_size
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.max_new_tokens = max_new_tokens
+        self.model_id = f"fake:{responses_dir or 'synthetic'}:{synthetic_size}"
+
+        self.responses = []
+        if responses_dir:
+            for path in sorted(glob.glob(os.path.join(responses_dir, '*', 'json.txt'))):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.responses.append(f.read().strip())
+
+    def count_tokens(self, text):
+        return max(1, len(text) // self.CHARS_PER_TOKEN)
+
+    def _response_for(self, prompt_suffix):
+        digest = int(hashlib.sha256(prompt_suffix.encode('utf-8')).hexdigest(), 16)
+        if self.responses:
+            return self.responses[digest % len(self.responses)]
+        return json.dumps(
+            synthetic_flow(self.synthetic_size, seed=digest % 2**32),
+            indent=2, ensure_ascii=False
+        )
+
+    def _sleep(self, seconds, cancel_event):
+        deadline = time.time() + seconds
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise GenerationCancelled("Petición cancelada durante la generación")
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.05))
+
+    def _stream(self, text, cancel_event, on_text):
+        """Hands out `text` in pieces at the simulated decoding speed."""
+        if self.tokens_per_second <= 0:
+            on_text(text)
+            return
+        step = self.CHARS_PER_TOKEN * max(1, int(self.tokens_per_second * self.STREAM_INTERVAL))
+        for start in range(0, len(text), step):
+            piece = text[start:start + step]
+            self._sleep(len(piece) / self.CHARS_PER_TOKEN / self.tokens_per_second, cancel_event)
+            on_text(piece)
+
+    def generate(self, prompt_suffix, cancel_event=None, on_text=None):
+        ti = time.time()
+        prompt_tokens = self.count_tokens(prompt_suffix)
+        tokenization_time = time.time() - ti
+
+        ti = time.time()
+        text = self._response_for(prompt_suffix)
+        generated_tokens = min(self.count_tokens(text), self.max_new_tokens)
+
+        self._sleep(self.latency, cancel_event)
+        time_to_first_token = time.time() - ti
+        if on_text is not None:
+            self._stream(text, cancel_event, on_text)
+        elif self.tokens_per_second > 0:
+            self._sleep(generated_tokens / self.tokens_per_second, cancel_event)
+
+        return GenerationResult(
+            text=text,
+            prompt_tokens=prompt_tokens,
+            prefill_tokens=prompt_tokens,
+            generated_tokens=generated_tokens,
+            time_to_first_token=time_to_first_token,
+            generation_time=time.time() - ti,
+            tokenization_time=tokenization_time
+        )
+
+
+def create_backend(name, **options):
+    """
+    Builds a backend by name: 'hf' (GPU, 4-bit), 'cpu' (transformers on CPU) or 'fake'.
+
+    `options` are passed to the backend constructor.
+    """
+    if name == 'fake':
+        return FakeBackend(**options)
+    if name == 'hf':
+        from hf_backend import HFTransformersBackend
+        return HFTransformersBackend(**options)
+    if name == 'cpu':
+        from hf_backend import CPUBackend
+        return CPUBackend(**options)
+    raise ValueError(f"Backend desconocido: {name}")
@@ -0,0 +1,235 @@
+from concurrent.futures import Future
+import random
+import threading
+import time
+
+
+def left_pad(sequences, pad_id):
+    """
+    Left-pads a list of token id lists to the same length.
+
+    Returns:
+        tuple: (padded sequences, attention masks, number of padding tokens)
+    """
+    max_len = max(len(seq) for seq in sequences)
+    padded, masks = [], []
+    padding = 0
+    for seq in sequences:
+        pad = max_len - len(seq)
+        padded.append([pad_id] * pad + list(seq))
+        masks.append([0] * pad + [1] * len(seq))
+        padding += pad
+    return padded, masks, padding
+
+
+class GenerationCancelled(Exception):
+    """Raised when a request is cancelled before or during its generation."""
+
+
+class _PendingRequest:
+    __slots__ = ('input_ids', 'cancel_event', 'on_token', 'future', 'arrival')
+
+    def __init__(self, input_ids, cancel_event=None, on_token=None):
+        self.input_ids = input_ids
+        self.cancel_event = cancel_event
+        self.on_token = on_token
+        self.future = Future()
+        self.arrival = time.time()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+
+class BatchScheduler:
+    """
+    Groups concurrent generation requests into batches.
+
+    Requests are collected until the oldest one has waited `max_wait_ms` or
+    `max_batch_size` requests of similar length are pending. Prompts are grouped
+    in buckets of `length_bucket` tokens so a batch never mixes very short and
+    very long prompts, which keeps padding low. Batches run one at a time on a
+    single background thread.
+
+    Args:
+        run_batch (callable): Receives a list of token id lists, the list of
+            their cancel events (threading.Event or None) and, as the keyword
+            `token_callbacks`, the list of their token callbacks (or None), and
+            returns one result per input, in the same order.
+        max_batch_size (int): Maximum number of requests per batch.
+        max_wait_ms (float): Maximum time a request waits for others to join.
+        length_bucket (int): Width (in tokens) of the length buckets.
+    """
+
+    def __init__(self, run_batch, max_batch_size=4, max_wait_ms=20, length_bucket=64):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.length_bucket = length_bucket
+
+        self._pending = []
+        self._cond = threading.Condition()
+
+        # Statistics
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_batches = 0
+        self.prompt_tokens = 0
+        self.padding_tokens = 0
+
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, input_ids, cancel_event=None, on_token=None):
+        """
+        Queues a prompt and returns a Future with its generation result.
+
+        If `cancel_event` is set before the batch starts, the request is dropped
+        and the Future raises GenerationCancelled. `on_token` (if given) is
+        called with every new token id of this prompt while the batch runs.
+        """
+        request = _PendingRequest(list(input_ids), cancel_event, on_token)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify()
+        return request.future
+
+    def _bucket(self, request):
+        return len(request.input_ids) // self.length_bucket
+
+    def _ready_batch(self):
+        """Returns the requests to run now, or None if the window is still open."""
+        oldest = self._pending[0]
+        bucket = self._bucket(oldest)
+        same_bucket = [r for r in self._pending if self._bucket(r) == bucket]
+
+        if len(same_bucket) < self.max_batch_size and time.time() - oldest.arrival < self.max_wait:
+            return None
+
+        batch = same_bucket[:self.max_batch_size]
+        taken = set(map(id, batch))
+        self._pending = [r for r in self._pending if id(r) not in taken]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = None
+                while batch is None:
+                    if not self._pending:
+                        self._cond.wait()
+                        continue
+                    batch = self._ready_batch()
+                    if batch is None:
+                        remaining = self.max_wait - (time.time() - self._pending[0].arrival)
+                        self._cond.wait(max(remaining, 0.001))
+
+            self._execute(batch)
+
+    def _execute(self, batch):
+        for request in batch:
+            if request.cancelled:
+                request.future.set_exception(GenerationCancelled("Petición cancelada antes de generar"))
+        batch = [r for r in batch if not r.cancelled]
+        if not batch:
+            return
+
+        sequences = [r.input_ids for r in batch]
+        max_len = max(len(seq) for seq in sequences)
+
+        self.num_requests += len(batch)
+        self.num_batches += 1
+        self.prompt_tokens += sum(len(seq) for seq in sequences)
+        self.padding_tokens += sum(max_len - len(seq) for seq in sequences)
+
+        try:
+            results = self.run_batch(
+                sequences, [r.cancel_event for r in batch], token_callbacks=[r.on_token for r in batch]
+            )
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def stats(self):
+        """Returns throughput and padding statistics since the scheduler started."""
+        elapsed = time.time() - self.start_time
+        total_tokens = self.prompt_tokens + self.padding_tokens
+        return {
+            'requests': self.num_requests,
+            'batches': self.num_batches,
+            'avg_batch_size': self.num_requests / self.num_batches if self.num_batches else 0.0,
+            'requests_per_second': self.num_requests / elapsed if elapsed > 0 else 0.0,
+            'padding_waste': self.padding_tokens / total_tokens if total_tokens else 0.0,
+        }
+
+
+class DeterministicModel:
+    """
+    Stand-in for `model.generate` that needs no GPU.
+
+    The generated tokens depend only on the input tokens, and the simulated cost
+    of a call mimics a GPU: prefill grows with the padded prompt length while a
+    decoding step costs about the same whatever the batch size.
+    """
+
+    def __init__(self, vocab_size=32000, new_tokens=32, prefill_ms_per_token=0.01,
+                 step_ms=2.0, pad_id=0):
+        self.vocab_size = vocab_size
+        self.new_tokens = new_tokens
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.step_ms = step_ms
+        self.pad_id = pad_id
+
+    def generate_one(self, input_ids):
+        seed = sum(input_ids) % self.vocab_size
+        return [(seed + i * 7919) % self.vocab_size for i in range(self.new_tokens)]
+
+    def run_batch(self, sequences, cancel_events=None, token_callbacks=None):
+        padded, masks, _ = left_pad(sequences, self.pad_id)
+        time.sleep((self.prefill_ms_per_token * len(padded[0]) + self.step_ms * self.new_tokens) / 1000)
+        results = [
+            self.generate_one([tok for tok, m in zip(seq, mask) if m])
+            for seq, mask in zip(padded, masks)
+        ]
+        for tokens, callback in zip(results, token_callbacks or []):
+            if callback is not None:
+                for token_id in tokens:
+                    callback(token_id)
+        return results
+
+
+def benchmark(num_requests=64, concurrency=16, max_batch_size=4, max_wait_ms=20, seed=0):
+    """Measures requests per second and padding waste with the deterministic model."""
+    rng = random.Random(seed)
+    model = DeterministicModel()
+    scheduler = BatchScheduler(model.run_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    prompts = [
+        [rng.randrange(1, model.vocab_size) for _ in range(rng.randint(50, 400))]
+        for _ in range(num_requests)
+    ]
+
+    def client(chunk):
+        for prompt in chunk:
+            result = scheduler.submit(prompt).result()
+            assert result == model.generate_one(prompt)
+
+    threads = [threading.Thread(target=client, args=(prompts[i::concurrency],)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return scheduler.stats()
+
+
+if __name__ == "__main__":
+    for batch_size in (1, 2, 4, 8):
+        stats = benchmark(max_batch_size=batch_size)
+        print(f"max_batch_size={batch_size}: "
+              f"{stats['requests_per_second']:.1f} req/s, "
+              f"batch medio {stats['avg_batch_size']:.2f}, "
+              f"padding {stats['padding_waste'] * 100:.1f}%")
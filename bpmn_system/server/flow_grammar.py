@@ -0,0 +1,396 @@
+"""
+Gramática del JSON `flow` para decodificación restringida.
+
+El formato del proceso tiene una profundidad acotada, así que se puede expresar como
+un autómata finito determinista sobre bytes UTF-8. A partir del vocabulario del
+tokenizer se precalcula, para cada estado del autómata, qué tokens mantienen la salida
+dentro del esquema y a qué estado llevan; durante la generación cada paso es una
+consulta a esas tablas.
+"""
+
+import re
+import time
+
+WHITESPACE = frozenset(b' \t\n\r')
+ESCAPABLE = b'"\\/bfnrt'
+HEX_DIGITS = b'0123456789abcdefABCDEF'
+
+# (first lead byte, last lead byte, allowed range of the second byte, continuation bytes)
+UTF8_LEAD_BYTES = (
+    (0xC2, 0xDF, None, 1),
+    (0xE0, 0xE0, (0xA0, 0xBF), 2),
+    (0xE1, 0xEC, None, 2),
+    (0xED, 0xED, (0x80, 0x9F), 2),
+    (0xEE, 0xEF, None, 2),
+    (0xF0, 0xF0, (0x90, 0xBF), 3),
+    (0xF1, 0xF3, None, 3),
+    (0xF4, 0xF4, (0x80, 0x8F), 3),
+)
+
+
+class FlowGrammar:
+    """
+    Byte-level DFA that accepts exactly the JSON documents of the `flow` schema.
+
+    States allowing whitespace loop on it before their next structural byte;
+    string-content states accept any printable ASCII byte through `default` and
+    well-formed multibyte UTF-8 sequences through explicit edges. Key order
+    follows the example of the prompt.
+    """
+
+    def __init__(self):
+        self.edges = []
+        self.default = []
+        self.whitespace = []
+        self._intermediate = set()
+
+        self.start = self._state()
+        self.final = self._state()
+        self._build()
+
+    # ------------------------------------------------------------------
+    # Construction helpers
+    # ------------------------------------------------------------------
+
+    def _state(self):
+        self.edges.append({})
+        self.default.append(None)
+        self.whitespace.append(False)
+        return len(self.edges) - 1
+
+    def _edge(self, src, byte, dst):
+        current = self.edges[src].get(byte)
+        if current is not None and current != dst:
+            raise ValueError(f"Ambiguous grammar at state {src} for byte {chr(byte)!r}")
+        self.edges[src][byte] = dst
+
+    def _literal(self, src, text, dst=None):
+        """Adds the bytes of `text` from `src`, sharing common prefixes with other literals."""
+        data = text.encode('utf-8')
+        state = src
+        for byte in data[:-1]:
+            nxt = self.edges[state].get(byte)
+            if nxt is None:
+                nxt = self._state()
+                self._intermediate.add(nxt)
+                self.edges[state][byte] = nxt
+            elif nxt not in self._intermediate:
+                raise ValueError(f"Ambiguous grammar at state {state} for literal {text!r}")
+            state = nxt
+
+        if dst is None:
+            dst = self._state()
+        self._edge(state, data[-1], dst)
+        return dst
+
+    def _token(self, src, text, dst=None):
+        """A structural literal, optionally preceded by whitespace."""
+        self.whitespace[src] = True
+        return self._literal(src, text, dst)
+
+    def _string(self, src, dst=None):
+        """A JSON string value, optionally preceded by whitespace."""
+        self.whitespace[src] = True
+        content = self._state()
+        escape = self._state()
+        self._edge(src, ord('"'), content)
+        self._edge(content, ord('\\'), escape)
+        for byte in ESCAPABLE:
+            self._edge(escape, byte, content)
+        self.default[content] = content
+
+        # \uXXXX escapes: exactly four hexadecimal digits
+        state = self._state()
+        self._edge(escape, ord('u'), state)
+        for i in range(4):
+            nxt = content if i == 3 else self._state()
+            for byte in HEX_DIGITS:
+                self._edge(state, byte, nxt)
+            state = nxt
+
+        # Multibyte UTF-8 characters: lead byte followed by 1-3 continuation bytes.
+        # E0, ED, F0 and F4 restrict their second byte (no overlongs or surrogates).
+        continuation = [content, self._state(), self._state(), self._state()]
+        for byte in range(0x80, 0xC0):
+            for i in range(1, 4):
+                self._edge(continuation[i], byte, continuation[i - 1])
+        for first, last, second, length in UTF8_LEAD_BYTES:
+            if second is None:
+                for byte in range(first, last + 1):
+                    self._edge(content, byte, continuation[length])
+            else:
+                restricted = self._state()
+                self._edge(content, first, restricted)
+                for byte in range(second[0], second[1] + 1):
+                    self._edge(restricted, byte, continuation[length - 1])
+
+        if dst is None:
+            dst = self._state()
+        self._edge(content, ord('"'), dst)
+        return dst
+
+    def _key(self, src, name):
+        """`"name":` -- returns the state before the value."""
+        state = self._token(src, f'"{name}"')
+        return self._token(state, ':')
+
+    def _string_list(self, src, dst=None):
+        """`[ "a", "b", ... ]`, possibly empty."""
+        opened = self._token(src, '[')
+        after_comma = self._state()
+        item_end = self._string(opened)
+        self._string(after_comma, item_end)
+        self._token(item_end, ',', after_comma)
+
+        if dst is None:
+            dst = self._state()
+        self._token(opened, ']', dst)
+        self._token(item_end, ']', dst)
+        return dst
+
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+
+    def _build(self):
+        state = self._token(self.start, '{')
+        state = self._key(state, 'flow')
+        element_start = self._token(state, '[')
+
+        element_end = self._state()
+        self._element(element_start, element_end)
+        self._token(element_end, ',', element_start)
+
+        state = self._token(element_end, ']')
+        self._token(state, '}', self.final)
+
+    def _element(self, src, dst):
+        state = self._token(src, '{')
+        type_value = self._key(state, 'type')
+
+        # evento: name y, opcionalmente, condicion (sin tilde, como en el generador)
+        state = self._token(type_value, '"evento"')
+        state = self._key(self._token(state, ','), 'name')
+        name_end = self._string(state)
+        self._token(name_end, '}', dst)
+        state = self._key(self._token(name_end, ','), 'condicion')
+        self._token(self._string(state), '}', dst)
+
+        # tarea: name y, opcionalmente, description
+        state = self._token(type_value, '"tarea"')
+        state = self._key(self._token(state, ','), 'name')
+        name_end = self._string(state)
+        self._token(name_end, '}', dst)
+        state = self._key(self._token(name_end, ','), 'description')
+        self._token(self._string(state), '}', dst)
+
+        # pasarela: name, type_pasarela y ramas
+        state = self._token(type_value, '"pasarela"')
+        state = self._key(self._token(state, ','), 'name')
+        state = self._key(self._token(self._string(state), ','), 'type_pasarela')
+        type_end = self._state()
+        self._token(state, '"XOR"', type_end)
+        self._literal(state, '"AND"', type_end)
+        state = self._key(self._token(type_end, ','), 'ramas')
+        branch_start = self._token(state, '[')
+        branch_end = self._state()
+        self._branch(branch_start, branch_end)
+        self._token(branch_end, ',', branch_start)
+        self._token(self._token(branch_end, ']'), '}', dst)
+
+        # bucle: name, condición y tareas
+        state = self._token(type_value, '"bucle"')
+        state = self._key(self._token(state, ','), 'name')
+        state = self._key(self._token(self._string(state), ','), 'condición')
+        state = self._key(self._token(self._string(state), ','), 'tareas')
+        self._token(self._string_list(state), '}', dst)
+
+    def _branch(self, src, dst):
+        """Rama de una pasarela: name, condición opcional (las AND no la llevan) y tareas."""
+        state = self._token(src, '{')
+        state = self._key(state, 'name')
+        after_name = self._token(self._string(state), ',')
+
+        tasks_key = self._state()
+        state = self._key(after_name, 'condición')
+        self._token(self._token(self._string(state), ','), '"tareas"', tasks_key)
+        self._literal(after_name, '"tareas"', tasks_key)
+
+        state = self._token(tasks_key, ':')
+        self._token(self._string_list(state), '}', dst)
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+
+    def advance(self, state, data):
+        """Returns the state reached after consuming `data`, or None if it is rejected."""
+        for byte in data:
+            nxt = self.edges[state].get(byte)
+            if nxt is None:
+                if self.whitespace[state] and byte in WHITESPACE:
+                    continue
+                nxt = self.default[state]
+                if nxt is None or not 0x20 <= byte < 0x80:
+                    return None
+            state = nxt
+        return state
+
+    def matches(self, text):
+        """True if `text` is a complete document of the schema."""
+        return self.advance(self.start, text.strip().encode('utf-8')) == self.final
+
+
+def _bytes_to_unicode():
+    """Byte <-> printable character table used by byte-level BPE tokenizers (GPT-2, Llama 3)."""
+    bs = list(range(ord('!'), ord('~') + 1)) + list(range(ord('¡'), ord('¬') + 1)) + list(range(ord('®'), ord('ÿ') + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+
+def token_bytes_from_tokenizer(tokenizer):
+    """
+    Returns {token_id: bytes} with the raw bytes each token produces.
+
+    Handles byte-level BPE vocabularies (Ġ-style), SentencePiece pieces (▁ and
+    <0xNN> byte fallback) and plain vocabularies. Special tokens are left out.
+    """
+    special_ids = set(tokenizer.all_special_ids)
+    for token_id, added in getattr(tokenizer, 'added_tokens_decoder', {}).items():
+        if added.special:
+            special_ids.add(token_id)
+
+    vocab = tokenizer.get_vocab()
+    byte_decoder = {c: b for b, c in _bytes_to_unicode().items()}
+    byte_level = sum(all(c in byte_decoder for c in tok) for tok in vocab) > 0.9 * len(vocab)
+    byte_fallback = re.compile(r'<0x([0-9A-Fa-f]{2})>')
+
+    token_bytes = {}
+    for token, token_id in vocab.items():
+        if token_id in special_ids:
+            continue
+        match = byte_fallback.fullmatch(token)
+        if match:
+            token_bytes[token_id] = bytes([int(match.group(1), 16)])
+        elif byte_level and all(c in byte_decoder for c in token):
+            token_bytes[token_id] = bytes(byte_decoder[c] for c in token)
+        else:
+            token_bytes[token_id] = token.replace('▁', ' ').encode('utf-8')
+    return token_bytes
+
+
+def _is_plain(data):
+    """True if `data` is complete, printable UTF-8 text without quotes or backslashes."""
+    if any(b < 0x20 or b in (0x22, 0x5C) for b in data):
+        return False
+    try:
+        data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class FlowTokenMasks:
+    """
+    Precomputed allowed tokens and transitions for every state of a FlowGrammar.
+
+    Tokens that are complete printable UTF-8 text without quotes or backslashes
+    keep a string in its content state, so those self-loops are stored once as a
+    shared set instead of one entry per content state.
+
+    Args:
+        grammar (FlowGrammar): Automaton of the schema.
+        token_bytes (dict): {token_id: bytes} of the vocabulary.
+        eos_token_ids (list): Tokens allowed once the document is complete.
+    """
+
+    def __init__(self, grammar, token_bytes, eos_token_ids):
+        ti = time.time()
+
+        self.grammar = grammar
+        self.start = grammar.start
+        self.eos_token_ids = list(eos_token_ids)
+
+        # Index the vocabulary by first byte after any leading whitespace
+        plain = []
+        by_first = {}
+        all_whitespace = []
+        for token_id, data in token_bytes.items():
+            if not data:
+                continue
+            if _is_plain(data):
+                plain.append(token_id)
+            stripped = data.lstrip(b' \t\n\r')
+            if stripped:
+                by_first.setdefault(stripped[0], []).append(token_id)
+            else:
+                all_whitespace.append(token_id)
+        by_first_raw = {}
+        for token_id, data in token_bytes.items():
+            if data:
+                by_first_raw.setdefault(data[0], []).append(token_id)
+
+        self.plain_tokens = frozenset(plain)
+        self.allowed = []
+        self.transitions = []
+        self.plain_loop = []
+
+        for state in range(len(grammar.edges)):
+            transitions = {}
+            loops = grammar.default[state] == state
+
+            if state == grammar.final:
+                candidates = []
+            elif loops:
+                candidates = [t for t in token_bytes if t not in self.plain_tokens]
+            elif grammar.whitespace[state]:
+                candidates = list(all_whitespace)
+                for byte in grammar.edges[state]:
+                    candidates.extend(by_first.get(byte, ()))
+            else:
+                candidates = []
+                for byte in grammar.edges[state]:
+                    candidates.extend(by_first_raw.get(byte, ()))
+
+            for token_id in candidates:
+                nxt = grammar.advance(state, token_bytes[token_id])
+                if nxt is not None:
+                    transitions[token_id] = nxt
+
+            allowed = list(transitions)
+            if loops:
+                allowed.extend(self.plain_tokens)
+            if state == grammar.final:
+                allowed.extend(self.eos_token_ids)
+
+            self.transitions.append(transitions)
+            self.plain_loop.append(loops)
+            self.allowed.append(allowed)
+
+        self._tensors = {}
+
+        print(f"Máscaras de la gramática calculadas en {time.time() - ti:.2f} segundos "
+              f"({len(grammar.edges)} estados, {len(token_bytes)} tokens).")
+
+    def next_state(self, state, token_id):
+        """State after emitting `token_id`, or None if the token leaves the grammar."""
+        nxt = self.transitions[state].get(token_id)
+        if nxt is None and self.plain_loop[state] and token_id in self.plain_tokens:
+            return state
+        return nxt
+
+    def allowed_tensor(self, state, device):
+        """Allowed token ids of a state as a LongTensor, built once per state and device."""
+        key = (state, str(device))
+        tensor = self._tensors.get(key)
+        if tensor is None:
+            import torch
+            tensor = torch.tensor(self.allowed[state], dtype=torch.long, device=device)
+            self._tensors[key] = tensor
+        return tensor
@@ -0,0 +1,243 @@
+"""
+Streaming de la generación: análisis incremental del JSON y eventos SSE.
+
+El texto del modelo llega a trozos. `FlowStreamParser` sigue su estructura con
+un JsonScanner y extrae cada elemento de la lista `flow` en cuanto se cierra
+su objeto, sin esperar al resto del JSON. `GenerationStream` conecta el hilo de
+generación con la respuesta Server-Sent Events de /generate_stream: agrupa los
+trozos de texto recibidos desde el último envío en un solo evento y mide el
+tiempo hasta el primer token, hasta el primer elemento y total.
+
+Este módulo no depende de torch ni de transformers.
+"""
+
+import json
+import queue
+import time
+
+
+class JsonScanner:
+    """
+    Follows the structure of a JSON text fed piece by piece.
+
+    Anything before the first '{' is ignored. Braces and brackets inside strings
+    (including escaped quotes) are not counted, so `complete` becomes True exactly
+    when the top-level object closes.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.complete = False
+
+    def feed(self, text):
+        """Consumes a piece of text. Returns True once the top-level object is closed."""
+        for ch in text:
+            if self.complete:
+                break
+
+            if not self.started:
+                if ch == '{':
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+
+        return self.complete
+
+
+class FlowStreamParser:
+    """
+    Extracts the elements of the top-level `flow` list from a JSON text fed
+    piece by piece.
+
+    The text is followed character by character with a JsonScanner. The last
+    string closed at the top level is remembered, so a '[' right after the
+    "flow" key opens the list; every object opened directly inside it is
+    parsed with json.loads as soon as its closing brace arrives. Elements that
+    are not valid JSON are counted in `invalid_elements` and skipped.
+    """
+
+    # Depth of the scanner inside the flow list, and inside one of its objects
+    FLOW_DEPTH = 2
+
+    def __init__(self):
+        self.scanner = JsonScanner()
+        self.text = ''
+        self.elements = []
+        self.invalid_elements = 0
+        self._string_start = None
+        self._last_key = None
+        self._in_flow = False
+        self._element_start = None
+
+    @property
+    def complete(self):
+        return self.scanner.complete
+
+    def feed(self, text):
+        """
+        Consumes a piece of text.
+
+        Returns:
+            list: Flow elements completed by this piece, in order
+        """
+        scanner = self.scanner
+        offset = len(self.text)
+        self.text += text
+        completed = []
+
+        for position, ch in enumerate(text, offset):
+            if scanner.complete:
+                break
+            depth, in_string = scanner.depth, scanner.in_string
+            scanner.feed(ch)
+
+            if scanner.in_string != in_string:
+                if scanner.in_string:
+                    self._string_start = position
+                elif depth == 1:
+                    self._last_key = self._parse(self.text[self._string_start:position + 1], count=False)
+                continue
+            if in_string:
+                continue
+
+            if ch == '[' and depth == 1:
+                self._in_flow = self._last_key == 'flow'
+            elif not self._in_flow:
+                continue
+            elif ch == '{' and depth == self.FLOW_DEPTH:
+                self._element_start = position
+            elif ch == '}' and scanner.depth == self.FLOW_DEPTH and self._element_start is not None:
+                element = self._parse(self.text[self._element_start:position + 1])
+                self._element_start = None
+                if element is not None:
+                    completed.append(element)
+            elif ch == ']' and depth == self.FLOW_DEPTH:
+                self._in_flow = False
+
+        self.elements.extend(completed)
+        return completed
+
+    def _parse(self, json_text, count=True):
+        try:
+            return json.loads(json_text)
+        except json.JSONDecodeError:
+            if count:
+                self.invalid_elements += 1
+            return None
+
+
+def format_sse(event, data):
+    """One Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class GenerationStream:
+    """
+    Bridge between the generation of one request and its SSE response.
+
+    `on_text` is given to the generation (it runs on the generation or batching
+    thread) and only queues the text. `events` runs on the request thread: it
+    feeds the parser and yields, until the job finishes, one `tokens` event
+    with all the text received since the previous one followed by an `element`
+    event per completed flow element, and finally `done` or `error`.
+
+    Args:
+        keepalive (float): Seconds without events before sending an SSE comment
+        poll_interval (float): Seconds between checks of the job state
+    """
+
+    def __init__(self, keepalive=15.0, poll_interval=0.1):
+        self.keepalive = keepalive
+        self.poll_interval = poll_interval
+        self.parser = FlowStreamParser()
+        self._queue = queue.Queue()
+
+        self.started = time.time()
+        self.first_token_time = None
+        self.first_element_time = None
+        self.elements_sent = 0
+
+    def on_text(self, text):
+        self._queue.put(text)
+
+    def _elapsed(self, moment):
+        return None if moment is None else moment - self.started
+
+    def timings(self):
+        """Seconds from the start of the request to the first token, the first element and now."""
+        return {
+            'time_to_first_token': self._elapsed(self.first_token_time),
+            'time_to_first_element': self._elapsed(self.first_element_time),
+            'total_time': time.time() - self.started,
+        }
+
+    def _element_event(self, element):
+        if self.first_element_time is None:
+            self.first_element_time = time.time()
+        event = format_sse('element', {'index': self.elements_sent, 'element': element})
+        self.elements_sent += 1
+        return event
+
+    def _drain(self, wait):
+        pieces = []
+        try:
+            pieces.append(self._queue.get(timeout=self.poll_interval) if wait else self._queue.get_nowait())
+            while True:
+                pieces.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return ''.join(pieces)
+
+    def events(self, job):
+        """
+        Yields the SSE messages of a job of the JobManager until it finishes.
+
+        A `done` event carries the final process JSON and the timings; flow
+        elements the parser did not see (a cached answer, or text outside the
+        stream) are sent from the final JSON before it.
+        """
+        last_sent = time.time()
+        while True:
+            # Read before draining: text queued before the job finished is never lost
+            finished = job.is_finished
+            text = self._drain(wait=not finished)
+            if text:
+                if self.first_token_time is None:
+                    self.first_token_time = time.time()
+                yield format_sse('tokens', {'text': text})
+                for element in self.parser.feed(text):
+                    yield self._element_event(element)
+                last_sent = time.time()
+            elif finished:
+                break
+            elif time.time() - last_sent >= self.keepalive:
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+
+        if job.status != job.DONE:
+            yield format_sse('error', {'status': job.status, 'error': job.error or job.status})
+            return
+
+        flow = job.result.get('flow', []) if isinstance(job.result, dict) else []
+        for element in flow[self.elements_sent:]:
+            yield self._element_event(element)
+        yield format_sse('done', {'request_id': job.id, 'data': job.result, **self.timings()})
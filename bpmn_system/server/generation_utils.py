@@ -0,0 +1,183 @@
+from transformers import LogitsProcessor, StoppingCriteria
+from transformers.generation.streamers import BaseStreamer
+from flow_stream import JsonScanner
+import torch
+import time
+
+
+class TimingStreamer(BaseStreamer):
+    """
+    Streamer that records when the first new token is produced.
+
+    `generate` first calls `put` with the prompt ids and then once per decoding
+    step, so the second call marks the end of prefill (time to first token).
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.first_token_time = None
+        self.end_time = None
+        self.num_tokens = 0
+        self._prompt_received = False
+
+    def put(self, value):
+        if not self._prompt_received:
+            self._prompt_received = True
+            return
+
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.num_tokens += value.numel()
+
+    def end(self):
+        self.end_time = time.time()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def total_time(self):
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+
+class TokenTextStream:
+    """
+    Turns the tokens of one sequence into text pieces as they are generated.
+
+    Works like transformers' TextStreamer: the tokens since the last newline
+    are decoded together and only the text up to the last space is sent, so a
+    word split across tokens or an incomplete character is never sent twice.
+    Call `end` after the generation to send the rest.
+    """
+
+    def __init__(self, tokenizer, on_text):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.token_cache = []
+        self.print_len = 0
+
+    def __call__(self, token_id):
+        self.token_cache.append(token_id)
+        text = self.tokenizer.decode(self.token_cache, skip_special_tokens=True)
+
+        if text.endswith('\n'):
+            printable = text[self.print_len:]
+            self.token_cache = []
+            self.print_len = 0
+        else:
+            printable = text[self.print_len:text.rfind(' ') + 1]
+            self.print_len += len(printable)
+
+        if printable:
+            self.on_text(printable)
+
+    def end(self):
+        if self.token_cache:
+            text = self.tokenizer.decode(self.token_cache, skip_special_tokens=True)
+            printable = text[self.print_len:]
+            self.token_cache = []
+            self.print_len = 0
+            if printable:
+                self.on_text(printable)
+
+
+class JsonStoppingCriteria(StoppingCriteria):
+    """
+    Stops each sequence as soon as its top-level JSON object is closed or a stop
+    token (e.g. <|eot_id|>) is generated.
+
+    Works row by row, so in a batch every sequence finishes independently.
+    A row also stops when its cancel event (if any) is set.
+    `generated_tokens[i]` holds the number of new tokens of row i up to the stop.
+    `token_callbacks[i]` (if not None) receives every one of those tokens as
+    soon as it is generated, e.g. a TokenTextStream.
+    """
+
+    def __init__(self, tokenizer, prompt_length, stop_token_ids, cancel_events=None, token_callbacks=None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop_token_ids = set(stop_token_ids)
+        self.cancel_events = cancel_events
+        self.token_callbacks = token_callbacks
+
+        self._processed = prompt_length
+        self._token_text = {}
+        self.scanners = None
+        self.done = None
+        self.generated_tokens = None
+
+    def _decode(self, token_id):
+        text = self._token_text.get(token_id)
+        if text is None:
+            text = self.tokenizer.decode([token_id], skip_special_tokens=False)
+            self._token_text[token_id] = text
+        return text
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.scanners is None:
+            batch_size = input_ids.shape[0]
+            self.scanners = [JsonScanner() for _ in range(batch_size)]
+            self.done = [False] * batch_size
+            self.generated_tokens = [0] * batch_size
+
+        new_tokens = input_ids[:, self._processed:].tolist()
+        self._processed = input_ids.shape[-1]
+
+        for i, tokens in enumerate(new_tokens):
+            if self.cancel_events and self.cancel_events[i] is not None and self.cancel_events[i].is_set():
+                self.done[i] = True
+            callback = self.token_callbacks[i] if self.token_callbacks else None
+            for token_id in tokens:
+                if self.done[i]:
+                    break
+                self.generated_tokens[i] += 1
+                if callback is not None:
+                    callback(token_id)
+                if token_id in self.stop_token_ids or self.scanners[i].feed(self._decode(token_id)):
+                    self.done[i] = True
+
+        return torch.tensor(self.done, dtype=torch.bool, device=input_ids.device)
+
+
+class FlowSchemaLogitsProcessor(LogitsProcessor):
+    """
+    Masks every token that would take the output outside the `flow` schema.
+
+    Keeps the grammar state of each row and advances it with the tokens produced
+    since the previous step; the allowed ids of each state come precomputed from
+    FlowTokenMasks, so a step is a table lookup plus one masked copy per row.
+    """
+
+    def __init__(self, token_masks, prompt_length):
+        self.token_masks = token_masks
+        self._processed = prompt_length
+        self.states = None
+
+    def __call__(self, input_ids, scores):
+        if self.states is None:
+            self.states = [self.token_masks.start] * input_ids.shape[0]
+
+        new_tokens = input_ids[:, self._processed:].tolist()
+        self._processed = input_ids.shape[-1]
+
+        for i, tokens in enumerate(new_tokens):
+            for token_id in tokens:
+                if self.states[i] is None:
+                    break
+                # None once the row leaves the grammar (e.g. padding after eos): no longer constrained
+                self.states[i] = self.token_masks.next_state(self.states[i], token_id)
+
+        for i, state in enumerate(self.states):
+            if state is None:
+                continue
+            allowed = self.token_masks.allowed_tensor(state, scores.device)
+            row = torch.full_like(scores[i], float('-inf'))
+            row[allowed] = scores[i, allowed]
+            scores[i] = row
+
+        return scores
@@ -0,0 +1,317 @@
+import torch
+from transformers import (
+    AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, DynamicCache,
+    LogitsProcessorList, StoppingCriteriaList
+)
+from backends import GenerationBackend, GenerationResult
+from prompts import SYSTEM_PROMPT_PREFIX, build_prompt_suffix
+from generation_utils import TimingStreamer, TokenTextStream, JsonStoppingCriteria, FlowSchemaLogitsProcessor
+from flow_grammar import FlowGrammar, FlowTokenMasks, token_bytes_from_tokenizer
+from batching import BatchScheduler, GenerationCancelled, left_pad
+from speculative import DraftModelDrafter, NgramDrafter, SpeculativeDecoder, SpeculativeStats
+import copy
+import time
+
+
+class HFTransformersBackend(GenerationBackend):
+    """
+    Hugging Face transformers backend: 4-bit Llama on GPU by default.
+
+    Reuses the KV cache of the fixed prompt prefix, groups concurrent requests
+    with a BatchScheduler, stops as soon as the JSON object closes and can
+    constrain decoding to the flow schema.
+
+    With `speculative` set to 'ngram' (drafts looked up in the prompt and the
+    output) or 'draft' (a small model at `draft_model_path`), requests are
+    decoded greedily one at a time with speculative decoding.
+    """
+
+    def __init__(self, model_path="/mnt/backupnas/fgarcia/Llama3", device="cuda",
+                 quantize_4bit=True, torch_dtype=torch.bfloat16, max_new_tokens=2000,
+                 use_prefix_cache=True, max_batch_size=4, batch_wait_ms=20,
+                 constrained_decoding=False, speculative=None, draft_model_path=None,
+                 num_draft_tokens=None):
+        self.model_path = model_path
+        self.model_id = model_path
+        self.device = device
+        self.quantize_4bit = quantize_4bit
+        self.torch_dtype = torch_dtype
+        self.max_new_tokens = max_new_tokens
+
+        # Reuse the KV cache of the fixed part of the prompt between requests
+        self.use_prefix_cache = use_prefix_cache
+
+        # Only allow tokens that keep the output valid against the flow schema
+        self.constrained_decoding = constrained_decoding
+
+        # Dynamic batching of concurrent requests
+        self.max_batch_size = max_batch_size
+        self.batch_wait_ms = batch_wait_ms
+
+        # Draft several tokens per step and verify them with a single forward pass
+        if speculative not in (None, 'ngram', 'draft'):
+            raise ValueError(f"Modo especulativo desconocido: {speculative} (opciones: ngram, draft)")
+        if speculative == 'draft' and not draft_model_path:
+            raise ValueError("El modo especulativo 'draft' necesita draft_model_path")
+        self.speculative = speculative
+        self.draft_model_path = draft_model_path
+        self.num_draft_tokens = num_draft_tokens
+        if speculative:
+            # Verification works on a single sequence
+            self.max_batch_size = 1
+
+        self.setup_model()
+        self.setup_prefix_cache()
+        self.setup_flow_grammar()
+        self.setup_speculative()
+        self.batcher = BatchScheduler(
+            self.generate_batch,
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.batch_wait_ms
+        )
+
+    def setup_model(self):
+        ti = time.time()
+
+        model_kwargs = {'torch_dtype': self.torch_dtype}
+        if self.quantize_4bit:
+            # Quantization configuration
+            model_kwargs['quantization_config'] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_compute_dtype=torch.bfloat16,
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_quant_type="nf4"
+            )
+        if self.device == "cuda":
+            model_kwargs['device_map'] = "auto"
+
+        # Load model and tokenizer
+        self.model = AutoModelForCausalLM.from_pretrained(self.model_path, **model_kwargs)
+        if self.device != "cuda":
+            self.model.to(self.device)
+        self.model.eval()
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+
+        # Generation stops at the end of the JSON object or at any of these tokens
+        self.stop_token_ids = [self.tokenizer.eos_token_id]
+        eot_id = self.tokenizer.convert_tokens_to_ids("<|eot_id|>")
+        if eot_id is not None and eot_id != self.tokenizer.unk_token_id:
+            self.stop_token_ids.append(eot_id)
+
+        print(f"Modelo {self.model_path} cargado en {time.time() - ti:.2f} segundos ({self.device}).")
+
+    def setup_prefix_cache(self):
+        """Tokenizes the fixed prompt prefix and precomputes its past_key_values."""
+        self.prefix_input_ids = self.tokenizer(
+            SYSTEM_PROMPT_PREFIX, return_tensors="pt"
+        ).input_ids.to(self.device)
+        self.prefix_cache = None
+
+        if not self.use_prefix_cache:
+            print("Prefix cache desactivado.")
+            return
+
+        ti = time.time()
+        with torch.no_grad():
+            prefix_cache = DynamicCache()
+            self.model(input_ids=self.prefix_input_ids, past_key_values=prefix_cache, use_cache=True)
+        self.prefix_cache = prefix_cache
+        tf = time.time()
+
+        print(f"Prefix cache calculado en {tf - ti:.2f} segundos "
+              f"({self.prefix_input_ids.shape[-1]} tokens).")
+
+    def setup_flow_grammar(self):
+        """Precomputes the allowed tokens of every grammar state from the tokenizer vocabulary."""
+        self.flow_token_masks = None
+        if not self.constrained_decoding:
+            return
+
+        self.flow_token_masks = FlowTokenMasks(
+            FlowGrammar(),
+            token_bytes_from_tokenizer(self.tokenizer),
+            self.stop_token_ids
+        )
+
+    def setup_speculative(self):
+        """Loads the drafter of speculative decoding, if enabled."""
+        self.speculative_decoder = None
+        if not self.speculative:
+            return
+
+        if self.speculative == 'ngram':
+            drafter = NgramDrafter(num_tokens=self.num_draft_tokens or 8)
+        else:
+            ti = time.time()
+            draft_model = AutoModelForCausalLM.from_pretrained(
+                self.draft_model_path,
+                torch_dtype=self.torch_dtype if self.device != "cpu" else torch.float32
+            ).to(self.model.device)
+            draft_model.eval()
+            draft_tokenizer = AutoTokenizer.from_pretrained(self.draft_model_path)
+            if draft_tokenizer.get_vocab() != self.tokenizer.get_vocab():
+                raise ValueError(f"El modelo borrador {self.draft_model_path} no comparte el tokenizer del modelo principal")
+            drafter = DraftModelDrafter(draft_model, num_tokens=self.num_draft_tokens or 5)
+            print(f"Modelo borrador {self.draft_model_path} cargado en {time.time() - ti:.2f} segundos.")
+
+        self.speculative_decoder = SpeculativeDecoder(
+            self.model, self.tokenizer, drafter, self.stop_token_ids, token_masks=self.flow_token_masks
+        )
+        print(f"Decodificación especulativa activada ({self.speculative}, "
+              f"{drafter.num_tokens} tokens por borrador).")
+
+    def count_tokens(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def generate_batch(self, batch_suffix_ids, cancel_events=None, max_new_tokens=None, token_callbacks=None):
+        """
+        Runs a single generate call for several prompts.
+
+        All prompts share the fixed prefix, so only the variable suffix is
+        left-padded: the padding sits between the prefix and the suffix, which
+        keeps the cached prefix positions valid for every row. The token
+        callback of a row (if any) receives its new tokens at every step.
+
+        Returns:
+            list: (new token ids, TimingStreamer) per prompt, in input order
+        """
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        if self.speculative_decoder is not None:
+            return [self._generate_speculative(
+                batch_suffix_ids[0], cancel_events[0] if cancel_events else None, max_new_tokens,
+                token_callbacks[0] if token_callbacks else None
+            )]
+
+        pad_id = self.tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = self.tokenizer.eos_token_id
+
+        padded, masks, _ = left_pad(batch_suffix_ids, pad_id)
+        suffix_ids = torch.tensor(padded, device=self.device)
+        suffix_mask = torch.tensor(masks, device=self.device)
+        prefix_ids = self.prefix_input_ids.expand(len(padded), -1)
+
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=-1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids), suffix_mask], dim=-1)
+
+        generate_kwargs = {}
+        if self.prefix_cache is not None:
+            # generate() extends the cache in place, so every batch works on its own copy
+            prefix_cache = copy.deepcopy(self.prefix_cache)
+            if len(padded) > 1:
+                prefix_cache.batch_repeat_interleave(len(padded))
+            generate_kwargs['past_key_values'] = prefix_cache
+
+        if self.flow_token_masks is not None:
+            generate_kwargs['logits_processor'] = LogitsProcessorList([
+                FlowSchemaLogitsProcessor(self.flow_token_masks, input_ids.shape[-1])
+            ])
+
+        streamer = TimingStreamer()
+        stopping_criteria = JsonStoppingCriteria(
+            self.tokenizer, input_ids.shape[-1], self.stop_token_ids,
+            cancel_events=cancel_events, token_callbacks=token_callbacks
+        )
+        output = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            eos_token_id=self.stop_token_ids,
+            pad_token_id=pad_id,
+            stopping_criteria=StoppingCriteriaList([stopping_criteria]),
+            streamer=streamer,
+            **generate_kwargs
+        )
+
+        if len(padded) > 1:
+            print(f"Batch de {len(padded)} peticiones generado en {streamer.total_time:.2f} s.")
+
+        # Hand back only the newly generated tokens of each row, up to its stop point
+        input_len = input_ids.shape[-1]
+        results = []
+        for i in range(len(padded)):
+            generated = stopping_criteria.generated_tokens[i] if stopping_criteria.generated_tokens else 0
+            results.append((output[i, input_len:input_len + generated].tolist(), streamer))
+        return results
+
+    def _generate_speculative(self, suffix_ids, cancel_event=None, max_new_tokens=None, on_token=None):
+        """Greedy speculative decoding of a single prompt; same return shape as a generate_batch row."""
+        input_ids = torch.cat([
+            self.prefix_input_ids, torch.tensor([suffix_ids], device=self.prefix_input_ids.device)
+        ], dim=-1)
+        past_key_values = copy.deepcopy(self.prefix_cache) if self.prefix_cache is not None else DynamicCache()
+
+        streamer = TimingStreamer()
+        output_ids, stats = self.speculative_decoder.generate(
+            input_ids, past_key_values, max_new_tokens or self.max_new_tokens,
+            cancel_event=cancel_event, streamer=streamer, on_token=on_token
+        )
+        print(f"Generación especulativa: {stats.generated} tokens en {stats.forward_passes} pasadas, "
+              f"aceptación {stats.acceptance_rate:.0%}.")
+        return output_ids, streamer
+
+    def generate(self, prompt_suffix, cancel_event=None, on_text=None):
+        ti = time.time()
+        suffix_ids = self.tokenizer(prompt_suffix, add_special_tokens=False).input_ids
+        tokenization_time = time.time() - ti
+
+        # Text of the new tokens, decoded while the batch runs
+        text_stream = TokenTextStream(self.tokenizer, on_text) if on_text is not None else None
+
+        # The scheduler groups this request with concurrent ones into a single generate call
+        output_ids, streamer = self.batcher.submit(
+            suffix_ids, cancel_event=cancel_event, on_token=text_stream
+        ).result()
+        if text_stream is not None:
+            text_stream.end()
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled("Petición cancelada durante la generación")
+
+        prefill_tokens = len(suffix_ids)
+        if self.prefix_cache is None:
+            prefill_tokens += self.prefix_input_ids.shape[-1]
+
+        ti = time.time()
+        text = self.tokenizer.decode(output_ids, skip_special_tokens=True).strip()
+        decode_to_text_time = time.time() - ti
+
+        return GenerationResult(
+            text=text,
+            prompt_tokens=self.prefix_input_ids.shape[-1] + len(suffix_ids),
+            prefill_tokens=prefill_tokens,
+            generated_tokens=len(output_ids),
+            time_to_first_token=streamer.time_to_first_token,
+            generation_time=streamer.total_time,
+            tokenization_time=tokenization_time,
+            decode_to_text_time=decode_to_text_time
+        )
+
+    def warmup(self, max_new_tokens=16):
+        """
+        Short generation through the same path as requests (prefix cache copy,
+        stopping criteria, grammar masks), run directly instead of through the
+        scheduler so it does not count in the batching statistics.
+        """
+        suffix_ids = self.tokenizer(
+            build_prompt_suffix('', "Proceso de calentamiento"), add_special_tokens=False
+        ).input_ids
+        self.generate_batch([suffix_ids], max_new_tokens=max_new_tokens)
+        if self.speculative_decoder is not None:
+            self.speculative_decoder.stats = SpeculativeStats()
+
+    def stats(self):
+        stats = self.batcher.stats()
+        if self.speculative_decoder is not None:
+            stats['speculative'] = dict(mode=self.speculative, **self.speculative_decoder.stats.to_dict())
+        return stats
+
+
+class CPUBackend(HFTransformersBackend):
+    """Same pipeline on CPU: full precision, no bitsandbytes quantization."""
+
+    def __init__(self, model_path="/mnt/backupnas/fgarcia/Llama3", **options):
+        options.setdefault('device', 'cpu')
+        options.setdefault('quantize_4bit', False)
+        options.setdefault('torch_dtype', torch.float32)
+        options.setdefault('max_batch_size', 1)
+        super().__init__(model_path=model_path, **options)
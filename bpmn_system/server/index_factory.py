@@ -0,0 +1,123 @@
+"""
+Construcción de índices FAISS exactos o aproximados para el vectorstore.
+
+Tipos disponibles:
+    flat   búsqueda exacta sobre todos los vectores (por defecto)
+    ivf    particiones k-means; `nlist` particiones, se exploran `nprobe`
+    hnsw   grafo HNSW con `m` vecinos por nodo; `ef_construction` y `ef_search`
+    ivfpq  como ivf pero con los vectores comprimidos por product quantization
+           (`pq_m` subvectores de `pq_bits` bits)
+
+Una configuración se escribe como texto, p. ej. "ivf,nlist=256,nprobe=16".
+"""
+
+import faiss
+import math
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq')
+
+DEFAULT_PARAMS = {
+    'ivf': {'nlist': None, 'nprobe': 8},
+    'hnsw': {'m': 32, 'ef_construction': 40, 'ef_search': 64},
+    'ivfpq': {'nlist': None, 'nprobe': 8, 'pq_m': 48, 'pq_bits': 8},
+}
+
+# FAISS recomienda al menos 39 vectores de entrenamiento por centroide
+MIN_POINTS_PER_CENTROID = 39
+
+
+def parse_index_config(text):
+    """
+    Parses "type,key=value,..." into a config dict, e.g. "hnsw,m=16,ef_search=128".
+
+    Raises:
+        ValueError: If the type or a parameter is unknown
+    """
+    parts = [part.strip() for part in (text or 'flat').split(',') if part.strip()]
+    config = {'type': parts[0].lower()}
+    if config['type'] not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {config['type']} (opciones: {', '.join(INDEX_TYPES)})")
+
+    allowed = DEFAULT_PARAMS.get(config['type'], {})
+    for part in parts[1:]:
+        key, _, value = part.partition('=')
+        if key not in allowed:
+            raise ValueError(f"Parámetro desconocido para {config['type']}: {key}")
+        config[key] = int(value)
+    return config
+
+
+def format_index_config(config):
+    return ','.join([config['type']] + [f"{k}={v}" for k, v in sorted(config.items()) if k != 'type'])
+
+
+def resolve_params(config, num_vectors):
+    """Fills the defaults of a config; the number of IVF partitions depends on the number of vectors."""
+    params = dict(DEFAULT_PARAMS.get(config['type'], {}))
+    params.update({k: v for k, v in config.items() if k != 'type'})
+    if 'nlist' in params:
+        nlist = params['nlist'] or int(4 * math.sqrt(max(num_vectors, 1)))
+        params['nlist'] = max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+    return params
+
+
+def factory_string(config, dimension, num_vectors):
+    """FAISS index_factory description of a config."""
+    index_type = config['type']
+    params = resolve_params(config, num_vectors)
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'ivf':
+        return f"IVF{params['nlist']},Flat"
+    if index_type == 'hnsw':
+        return f"HNSW{params['m']}"
+    if dimension % params['pq_m']:
+        raise ValueError(f"pq_m={params['pq_m']} debe dividir la dimensión de los vectores ({dimension})")
+    return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_bits']}"
+
+
+def apply_search_params(index, config, num_vectors=None):
+    """Sets the search-time parameters (nprobe, efSearch) of an index."""
+    params = resolve_params(config, num_vectors if num_vectors is not None else index.ntotal)
+    space = faiss.ParameterSpace()
+    if config['type'] in ('ivf', 'ivfpq'):
+        space.set_index_parameter(index, 'nprobe', min(params['nprobe'], params['nlist']))
+    elif config['type'] == 'hnsw':
+        space.set_index_parameter(index, 'efSearch', params['ef_search'])
+
+
+def build_index(vectors, config):
+    """
+    Builds, trains and fills an L2 index of the given type with `vectors`.
+
+    Vectors keep their position as id, so the index can replace a flat one
+    that has the same docstore mapping. Approximate types that cannot be
+    trained with so few vectors fall back to an exact index.
+
+    Returns:
+        tuple: (faiss index, config actually used)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    num_vectors, dimension = vectors.shape
+
+    min_vectors = MIN_POINTS_PER_CENTROID
+    if config['type'] == 'ivfpq':
+        min_vectors = MIN_POINTS_PER_CENTROID * 2 ** resolve_params(config, num_vectors)['pq_bits']
+    if config['type'] in ('ivf', 'ivfpq') and num_vectors < min_vectors:
+        print(f"Solo hay {num_vectors} vectores para entrenar un índice {config['type']}: se usa un índice exacto.")
+        config = {'type': 'flat'}
+
+    index = faiss.index_factory(dimension, factory_string(config, dimension, num_vectors), faiss.METRIC_L2)
+    if config['type'] == 'hnsw':
+        faiss.downcast_index(index).hnsw.efConstruction = resolve_params(config, num_vectors)['ef_construction']
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, config, num_vectors)
+    return index, config
+
+
+def index_memory_bytes(index):
+    """Size of the serialized index, a close estimate of its memory footprint."""
+    return int(faiss.serialize_index(index).nbytes)
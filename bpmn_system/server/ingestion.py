@@ -0,0 +1,440 @@
+"""
+Ingesta incremental de documentos PDF en el vectorstore FAISS.
+
+Cada fragmento (párrafo numerado) se identifica por el hash de su contenido, que
+es también su id en el docstore. Al sincronizar se compara el conjunto de
+fragmentos de los PDF con los ids del índice: solo se calculan embeddings de los
+fragmentos nuevos o modificados y se eliminan del índice los que ya no existen.
+Un manifiesto con el hash de cada PDF, de sus páginas y de sus fragmentos permite
+saltarse los documentos que no han cambiado y, si no ha cambiado ninguno, no
+cargar siquiera el índice: arrancar el servidor no deserializa `index.pkl`.
+
+Los PDF se procesan en paralelo en un pool de procesos, página a página, y los
+embeddings se calculan por lotes, de modo que la memoria no depende del tamaño
+del corpus.
+
+Uso:
+    python ingestion.py --source manuales/ context/contexto.pdf --index context/faiss_index
+"""
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from index_factory import build_index, format_index_config, parse_index_config
+from mmap_store import DOCS_FILE, OFFSETS_FILE, write_documents
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import faiss
+import hashlib
+import json
+import os
+import PyPDF2
+import re
+import shutil
+import tempfile
+import time
+
+MANIFEST_FILE = 'manifest.json'
+INDEX_FILES = ('index.faiss', 'index.pkl')
+# Con un índice aproximado, copia exacta de los vectores para poder actualizarlo y reconstruirlo
+VECTORS_FILE = 'vectors.faiss'
+
+# Los párrafos comienzan con un número seguido de punto
+PARAGRAPH_SPLIT = re.compile(r'(?=\d+\.)')
+
+
+class CustomEmbeddings:
+    def __init__(self, embedding_model, batch_size=64):
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        # Convert texts to embeddings, encoding them in batches
+        return self.embedding_model.encode(list(texts), batch_size=self.batch_size).tolist()
+
+    def embed_query(self, query):
+        # Embed a single query
+        return self.embedding_model.encode(query).tolist()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pdf_pages(pdf_path):
+    """Yields the text of every page, with line breaks replaced by spaces."""
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            # Reemplazar saltos de línea por espacios al extraer el texto
+            yield (page.extract_text() or '').replace('\n', ' ')
+
+
+class ParagraphChunker:
+    """
+    Splits a stream of page texts into the numbered paragraphs used as chunks.
+
+    Only the unfinished paragraph at the end of a page is carried over to the
+    next one, so memory does not grow with the size of the document. Pages are
+    joined with a space, which gives the same paragraphs as splitting the whole
+    text at once.
+    """
+
+    def __init__(self):
+        self._carry = ''
+        self._first = True
+
+    def feed(self, page_text):
+        """Adds a page and returns the paragraphs it completed."""
+        pieces = PARAGRAPH_SPLIT.split(self._carry + page_text + ' ')
+        self._carry = pieces.pop()
+        return self._clean(pieces)
+
+    def flush(self):
+        """Returns the last paragraph once there are no more pages."""
+        pieces, self._carry = [self._carry], ''
+        return self._clean(pieces)
+
+    def _clean(self, pieces):
+        paragraphs = []
+        for piece in pieces:
+            # Limpiar y filtrar párrafos
+            stripped = piece.strip()
+            if not stripped or len(stripped) <= 50:
+                continue
+            paragraph = ' '.join(stripped.split())
+
+            # Descartar el texto previo al primer párrafo numerado
+            if self._first:
+                self._first = False
+                if not paragraph.startswith('1.'):
+                    continue
+            paragraphs.append(paragraph)
+        return paragraphs
+
+
+def split_paragraphs(full_text):
+    """Splits a whole text into its numbered paragraphs."""
+    chunker = ParagraphChunker()
+    return chunker.feed(full_text) + chunker.flush()
+
+
+def parse_pdf(pdf_path):
+    """
+    Extracts and chunks one PDF page by page (runs in the ingestion process pool).
+
+    Returns:
+        dict: File hash, page hashes and (chunk hash, text) pairs of the document
+    """
+    chunker = ParagraphChunker()
+    page_hashes = []
+    chunks = []
+    for page_text in iter_pdf_pages(pdf_path):
+        page_hashes.append(content_hash(page_text))
+        chunks.extend((content_hash(p), p) for p in chunker.feed(page_text))
+    chunks.extend((content_hash(p), p) for p in chunker.flush())
+
+    return {
+        'path': pdf_path,
+        'sha256': file_hash(pdf_path),
+        'pages': page_hashes,
+        'chunks': chunks,
+    }
+
+
+def find_pdfs(sources):
+    """Expands folders into the PDF files they contain (recursively)."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for folder, _, files in os.walk(source):
+                paths.extend(os.path.join(folder, name) for name in files if name.lower().endswith('.pdf'))
+        else:
+            paths.append(source)
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+class IncrementalIndexer:
+    """
+    Keeps the FAISS vectorstore of a set of PDFs in sync with their content.
+
+    `sync()` diffs the content hashes of the chunks of every PDF against the ids
+    already stored in the index. Removed chunks are deleted, new or edited ones
+    are embedded in batches of `batch_size` and added, and unchanged ones are
+    left untouched. PDFs whose hash matches the manifest are not parsed again,
+    and when all of them match (with the same index config) the index is not
+    even loaded.
+    The index files are written to a temporary folder and moved into place
+    before the manifest, so an interrupted sync is repaired by the next one
+    instead of leaving the index out of sync with the documents.
+
+    With an approximate `index_config` (see index_factory) the exact vectors
+    are kept in `vectors.faiss` and updated incrementally; the search index
+    `index.faiss` is rebuilt from them whenever the content or the config
+    changes, with the same docstore mapping.
+
+    Args:
+        sources (list): PDF files and/or folders with PDF files
+        vectorstore_path (str): Folder of the FAISS index
+        embeddings: Embeddings wrapper used to embed the new chunks
+        workers (int, optional): Processes parsing PDFs in parallel (default: CPU count)
+        batch_size (int): Chunks embedded and added to the index at once
+        index_config (dict or str, optional): Search index type and parameters (default: flat)
+    """
+
+    def __init__(self, sources, vectorstore_path, embeddings, workers=None, batch_size=256,
+                 index_config=None):
+        self.sources = [sources] if isinstance(sources, str) else list(sources)
+        self.vectorstore_path = vectorstore_path
+        self.embeddings = embeddings
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        if index_config is None or isinstance(index_config, str):
+            index_config = parse_index_config(index_config)
+        self.index_config = index_config
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.vectorstore_path, MANIFEST_FILE)
+
+    def _index_exists(self):
+        return all(os.path.exists(os.path.join(self.vectorstore_path, name)) for name in INDEX_FILES)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def current_manifest(self):
+        """
+        The manifest if the index already matches the PDFs and the index config,
+        otherwise None. Only the PDFs are hashed; the index is not loaded.
+        """
+        manifest = self.load_manifest()
+        if (manifest is None or not self._index_exists()
+                or not os.path.exists(os.path.join(self.vectorstore_path, DOCS_FILE))
+                or manifest.get('index', 'flat') != format_index_config(self.index_config)):
+            return None
+        sources = manifest.get('sources', {})
+        paths = find_pdfs(self.sources)
+        if set(paths) != set(sources) or any(sources[path]['sha256'] != file_hash(path) for path in paths):
+            return None
+        return manifest
+
+    def is_current(self):
+        return self.current_manifest() is not None
+
+    def _write_manifest(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.vectorstore_path, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _save(self, vectorstore):
+        """Writes the index next to its final location and moves the files into place."""
+        os.makedirs(self.vectorstore_path, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.vectorstore_path, prefix='.sync-')
+        try:
+            vectorstore.save_local(tmp_dir)
+            names = list(reversed(INDEX_FILES))
+
+            # Memory-mapped copy of the texts, in index order, read by the server without pickle
+            write_documents(tmp_dir, [
+                vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).page_content
+                for i in range(vectorstore.index.ntotal)
+            ])
+            names[1:1] = [DOCS_FILE, OFFSETS_FILE]
+
+            exact = vectorstore.index
+            if self.index_config['type'] != 'flat' and exact.ntotal > 0:
+                tb = time.time()
+                os.replace(os.path.join(tmp_dir, 'index.faiss'), os.path.join(tmp_dir, VECTORS_FILE))
+                index, used_config = build_index(exact.reconstruct_n(0, exact.ntotal), self.index_config)
+                faiss.write_index(index, os.path.join(tmp_dir, 'index.faiss'))
+                names.insert(0, VECTORS_FILE)
+                print(f"Índice {format_index_config(used_config)} construido en {time.time() - tb:.2f} segundos.")
+
+            # index.faiss last, so the retriever reloads once every file is in place
+            for name in names:
+                os.replace(os.path.join(tmp_dir, name), os.path.join(self.vectorstore_path, name))
+            if VECTORS_FILE not in names and os.path.exists(os.path.join(self.vectorstore_path, VECTORS_FILE)):
+                os.remove(os.path.join(self.vectorstore_path, VECTORS_FILE))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _parse(self, paths):
+        """Yields the parsed PDFs as they finish, in a process pool when there are several."""
+        if len(paths) <= 1 or self.workers == 1:
+            for path in paths:
+                yield parse_pdf(path)
+            return
+
+        # At most two documents per worker are in flight, so parsed results never pile up
+        workers = min(self.workers, len(paths))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            for path in paths:
+                futures.append(executor.submit(parse_pdf, path))
+                if len(futures) >= 2 * workers:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def sync(self, force=False):
+        """
+        Brings the index up to date with the PDFs.
+
+        Args:
+            force (bool): Parse every PDF even if its hash matches the manifest
+
+        Returns:
+            dict: Counts of documents, pages and chunks processed, added, removed and unchanged
+        """
+        ti = time.time()
+        # Nothing to re-embed or delete: the LangChain store (index.pkl) is never unpickled
+        manifest = None if force else self.current_manifest()
+        if manifest is not None:
+            unchanged = len({chunk_id for entry in manifest['sources'].values() for chunk_id in entry['chunks']})
+            print(f"Vectorstore al día, comprobado en {time.time() - ti:.2f} segundos: "
+                  f"{unchanged} fragmentos sin cambios.")
+            return {'documents': 0, 'pages': 0, 'chunks': 0, 'added': 0, 'removed': 0,
+                    'changed_pages': 0, 'unchanged': unchanged}
+
+        manifest = self.load_manifest() or {}
+        old_sources = manifest.get('sources', {})
+
+        vectorstore = None
+        stored_ids = set()
+        if self._index_exists():
+            vectorstore = FAISS.load_local(
+                self.vectorstore_path, self.embeddings, allow_dangerous_deserialization=True
+            )
+            # Updates always go to the exact vectors, never to an approximate index
+            vectors_path = os.path.join(self.vectorstore_path, VECTORS_FILE)
+            if os.path.exists(vectors_path):
+                vectorstore.index = faiss.read_index(vectors_path)
+            stored_ids = set(vectorstore.index_to_docstore_id.values())
+
+        # Documents unchanged since the last sync keep their chunks without being parsed
+        sources = {}
+        to_parse = []
+        for path in find_pdfs(self.sources):
+            entry = old_sources.get(path)
+            if (not force and entry is not None and entry['sha256'] == file_hash(path)
+                    and all(chunk_id in stored_ids for chunk_id in entry['chunks'])):
+                sources[path] = entry
+            else:
+                to_parse.append(path)
+
+        current_ids = set()
+        for entry in sources.values():
+            current_ids.update(entry['chunks'])
+
+        pending = []
+        stats = {'documents': len(to_parse), 'pages': 0, 'chunks': 0, 'added': 0, 'removed': 0,
+                 'changed_pages': 0}
+        embedding_time = 0.0
+
+        def add_pending():
+            nonlocal vectorstore, embedding_time
+            te = time.time()
+            documents = [Document(page_content=text, metadata={'source': source}) for _, text, source in pending]
+            ids = [chunk_id for chunk_id, _, _ in pending]
+            if vectorstore is None:
+                vectorstore = FAISS.from_documents(documents, embedding=self.embeddings, ids=ids)
+            else:
+                vectorstore.add_documents(documents, ids=ids)
+            embedding_time += max(time.time() - te, 1e-6)
+            stats['added'] += len(pending)
+            pending.clear()
+
+        tp = time.time()
+        for parsed in self._parse(to_parse):
+            path = parsed['path']
+            old_pages = old_sources.get(path, {}).get('pages', [])
+            stats['pages'] += len(parsed['pages'])
+            stats['changed_pages'] += sum(
+                1 for i, page_hash in enumerate(parsed['pages'])
+                if i >= len(old_pages) or old_pages[i] != page_hash
+            ) + max(len(old_pages) - len(parsed['pages']), 0)
+
+            chunk_ids = []
+            for chunk_id, text in parsed['chunks']:
+                stats['chunks'] += 1
+                chunk_ids.append(chunk_id)
+                # Identical paragraphs share a hash and are stored once
+                if chunk_id in current_ids:
+                    continue
+                current_ids.add(chunk_id)
+                if chunk_id not in stored_ids:
+                    pending.append((chunk_id, text, os.path.basename(path)))
+                    if len(pending) >= self.batch_size:
+                        add_pending()
+
+            sources[path] = {'sha256': parsed['sha256'], 'pages': parsed['pages'], 'chunks': chunk_ids}
+
+        if pending:
+            add_pending()
+        parse_time = max(time.time() - tp, 1e-6)
+
+        removed = [chunk_id for chunk_id in stored_ids if chunk_id not in current_ids]
+        if removed:
+            vectorstore.delete(removed)
+            stats['removed'] = len(removed)
+
+        index_spec = format_index_config(self.index_config)
+        outdated = (stats['added'] or stats['removed'] or manifest.get('index', 'flat') != index_spec
+                    or not os.path.exists(os.path.join(self.vectorstore_path, DOCS_FILE)))
+        if vectorstore is not None and outdated:
+            self._save(vectorstore)
+
+        os.makedirs(self.vectorstore_path, exist_ok=True)
+        self._write_manifest({'index': index_spec, 'sources': sources})
+
+        stats['unchanged'] = len(current_ids) - stats['added']
+        if stats['documents']:
+            print(f"{stats['documents']} documentos procesados en {parse_time:.2f} segundos: "
+                  f"{stats['pages'] / parse_time:.1f} páginas/s, {stats['chunks'] / parse_time:.1f} fragmentos/s.")
+        if stats['added']:
+            print(f"Embeddings de {stats['added']} fragmentos calculados en {embedding_time:.2f} segundos "
+                  f"({stats['added'] / embedding_time:.1f} fragmentos/s).")
+        print(f"Vectorstore sincronizado en {time.time() - ti:.2f} segundos: "
+              f"{stats['added']} fragmentos añadidos, {stats['removed']} eliminados, "
+              f"{stats['unchanged']} sin cambios ({stats['changed_pages']} páginas modificadas).")
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de PDF en el vectorstore")
+    parser.add_argument('--source', nargs='+', required=True, help="Ficheros PDF o carpetas con PDF")
+    parser.add_argument('--index', required=True, help="Carpeta del índice FAISS")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos que leen PDF en paralelo")
+    parser.add_argument('--batch-size', type=int, default=256, help="Fragmentos por lote de embeddings")
+    parser.add_argument('--device', default=None, help="Dispositivo del modelo de embeddings (cuda o cpu)")
+    parser.add_argument('--index-type', default='flat',
+                        help="Índice de búsqueda, p. ej. flat, ivf,nprobe=16 o hnsw,m=32,ef_search=64")
+    parser.add_argument('--force', action='store_true', help="Vuelve a leer todos los PDF")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device=args.device)
+    indexer = IncrementalIndexer(
+        args.source, args.index, CustomEmbeddings(embedding_model, batch_size=args.batch_size),
+        workers=args.workers, batch_size=args.batch_size, index_config=args.index_type
+    )
+    indexer.sync(force=args.force)
+
+
+if __name__ == "__main__":
+    main()
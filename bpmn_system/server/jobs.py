@@ -0,0 +1,158 @@
+from batching import GenerationCancelled
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class Job:
+    """State of a generation job."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, prompt, options=None):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.options = options or {}
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED, Job.CANCELLED)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+        }
+        if self.status == Job.DONE:
+            data['data'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """
+    Runs generation jobs on a fixed-size pool of worker threads.
+
+    Jobs wait in a bounded queue; when it is full `submit` raises QueueFullError
+    so the HTTP layer can answer immediately instead of piling up work. Finished
+    jobs are kept for `result_ttl` seconds so clients can fetch their result.
+
+    Args:
+        handler (callable): handler(prompt, request_id=..., cancel_event=..., **options) -> result
+        num_workers (int): Number of generations running at once.
+        max_queue_size (int): Maximum number of jobs waiting to start.
+        result_ttl (float): Seconds a finished job is kept.
+    """
+
+    def __init__(self, handler, num_workers=4, max_queue_size=32, result_ttl=3600):
+        self.handler = handler
+        self.result_ttl = result_ttl
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+        self._workers = [
+            threading.Thread(target=self._run, daemon=True, name=f"job-worker-{i}")
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, prompt, **options):
+        """
+        Queues a new job and returns it without waiting for the generation.
+        `options` are passed as keyword arguments to the handler.
+        """
+        self._cleanup()
+
+        job = Job(prompt, options)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError("La cola de generación está llena, inténtalo más tarde")
+
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job. A queued job never starts; a running one stops at the next
+        decoding step. Returns the job, or None if it does not exist.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        # Same lock as the worker that starts the job: a queued job is either cancelled or started
+        with self._lock:
+            if not job.is_finished:
+                job.cancel_event.set()
+                if job.status == Job.QUEUED:
+                    job.status = Job.CANCELLED
+                    job.finished = time.time()
+        return job
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                with self._lock:
+                    if job.cancel_event.is_set():
+                        continue
+                    job.status = Job.RUNNING
+                    job.started = time.time()
+
+                try:
+                    job.result = self.handler(
+                        job.prompt, request_id=job.id, cancel_event=job.cancel_event, **job.options
+                    )
+                    job.status = Job.DONE
+                except GenerationCancelled:
+                    job.status = Job.CANCELLED
+                except Exception as e:
+                    job.error = str(e)
+                    job.status = Job.FAILED
+                job.finished = time.time()
+            finally:
+                self._queue.task_done()
+
+    def _cleanup(self):
+        """Forgets finished jobs older than result_ttl."""
+        limit = time.time() - self.result_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.is_finished and job.finished is not None and job.finished < limit
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
@@ -0,0 +1,215 @@
+"""
+Bases de conocimiento adicionales, cargadas bajo demanda.
+
+Cada subcarpeta de la carpeta raíz es una base de conocimiento con sus PDF; su
+índice se guarda en `<base>/faiss_index` (puede prepararse antes con el CLI de
+ingestion.py). Las bases se cargan la primera vez que una petición las nombra y
+se mantienen en un LRU con un presupuesto de memoria: al superarlo se descargan
+las menos usadas. Si los PDF han cambiado, el índice se sincroniza en segundo
+plano, nunca en el hilo de la petición: mientras tanto se sigue usando el índice
+anterior o, si la base aún no tiene índice, la petición recibe un 503.
+"""
+
+from collections import OrderedDict
+from ingestion import IncrementalIndexer, find_pdfs
+from mmap_store import MmapVectorStore
+from retriever import ContextRetriever
+import os
+import re
+import threading
+import time
+
+VALID_NAME = re.compile(r'^[A-Za-z0-9_\-]+$')
+
+
+class UnknownKnowledgeBaseError(Exception):
+    """Raised when a request names a knowledge base that does not exist."""
+
+
+class KnowledgeBaseNotReadyError(Exception):
+    """Raised while a knowledge base without an index is being indexed in the background."""
+
+
+class _LoadedKnowledgeBase:
+    __slots__ = ('retriever', 'size', 'load_time', 'last_used', 'hits')
+
+    def __init__(self, retriever, size, load_time):
+        self.retriever = retriever
+        self.size = size
+        self.load_time = load_time
+        self.last_used = time.time()
+        self.hits = 0
+
+
+class KnowledgeBaseRegistry:
+    """
+    LRU of the knowledge bases below `root_dir`, bounded by `memory_budget_mb`.
+
+    The footprint of a base is the size of its index and document files, which
+    is what stays resident (or in the page cache, when memory-mapped) while it
+    is loaded. The base just loaded is never evicted, even if it alone exceeds
+    the budget.
+    """
+
+    INDEX_DIR = 'faiss_index'
+
+    def __init__(self, root_dir, embeddings, memory_budget_mb=1024, similarity_threshold=0.2,
+                 index_config=None):
+        self.root_dir = root_dir
+        self.embeddings = embeddings
+        self.memory_budget = memory_budget_mb * 2**20
+        self.similarity_threshold = similarity_threshold
+        self.index_config = index_config
+
+        self._loaded = OrderedDict()  # name -> _LoadedKnowledgeBase, least recently used first
+        self._loading = {}  # name -> lock held while the base is being loaded
+        self._indexing = set()  # names with a sync running in the background
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def names(self):
+        """Knowledge bases available on disk."""
+        if not os.path.isdir(self.root_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root_dir)
+            if VALID_NAME.match(name) and os.path.isdir(os.path.join(self.root_dir, name))
+        )
+
+    def exists(self, name):
+        return bool(VALID_NAME.match(name)) and os.path.isdir(os.path.join(self.root_dir, name))
+
+    def get(self, name):
+        """
+        Returns the retriever of a knowledge base, loading it if it is not resident.
+
+        Raises:
+            UnknownKnowledgeBaseError: If there is no such knowledge base
+            KnowledgeBaseNotReadyError: If the base has no index yet and is being indexed
+        """
+        retriever = self._touch(name)
+        if retriever is not None:
+            return retriever
+
+        if not self.exists(name):
+            raise UnknownKnowledgeBaseError(f"Base de conocimiento desconocida: {name}")
+
+        with self._lock:
+            loading = self._loading.setdefault(name, threading.Lock())
+        # Concurrent requests for the same cold base wait for a single load
+        with loading:
+            retriever = self._touch(name)
+            if retriever is not None:
+                return retriever
+            return self._load(name)
+
+    def _touch(self, name):
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None:
+                return None
+            self._loaded.move_to_end(name)
+            entry.last_used = time.time()
+            entry.hits += 1
+            self.hits += 1
+            return entry.retriever
+
+    def _load(self, name):
+        ti = time.time()
+        base_dir = os.path.join(self.root_dir, name)
+        index_path = os.path.join(base_dir, self.INDEX_DIR)
+
+        indexer = IncrementalIndexer(base_dir, index_path, self.embeddings, index_config=self.index_config)
+        if find_pdfs([base_dir]) and not indexer.is_current():
+            self._start_indexing(name, indexer)
+        # Only the memory-mapped format is loaded here: the request thread never unpickles index.pkl
+        if not MmapVectorStore.exists(index_path):
+            with self._lock:
+                indexing = name in self._indexing
+            if indexing:
+                raise KnowledgeBaseNotReadyError(f"La base de conocimiento '{name}' se está indexando")
+            raise UnknownKnowledgeBaseError(f"La base de conocimiento '{name}' no tiene documentos indexados")
+        retriever = ContextRetriever(index_path, self.embeddings, similarity_threshold=self.similarity_threshold)
+        load_time = time.time() - ti
+
+        entry = _LoadedKnowledgeBase(retriever, self._footprint(index_path), load_time)
+        with self._lock:
+            self._loaded[name] = entry
+            self.loads += 1
+            evicted = self._evict(keep=name)
+            resident = self._resident_bytes()
+
+        print(f"Base de conocimiento '{name}' cargada en {load_time * 1000:.1f} ms "
+              f"({entry.size / 2**20:.1f} MB); residentes: {len(self._loaded)} "
+              f"({resident / 2**20:.1f} de {self.memory_budget / 2**20:.0f} MB)"
+              + (f", descargadas: {', '.join(evicted)}" if evicted else "") + ".")
+        return retriever
+
+    def _start_indexing(self, name, indexer):
+        """Syncs the index of a base in a background thread, unless a sync is already running."""
+        with self._lock:
+            if name in self._indexing:
+                return
+            self._indexing.add(name)
+
+        def run():
+            try:
+                indexer.sync()
+            except Exception as e:
+                print(f"Error al indexar la base de conocimiento '{name}': {e}")
+            finally:
+                with self._lock:
+                    self._indexing.discard(name)
+
+        threading.Thread(target=run, name=f"index-{name}", daemon=True).start()
+
+    def _footprint(self, index_path):
+        names = ['index.faiss', 'docs.bin', 'docs.offsets.npy']
+        if not os.path.exists(os.path.join(index_path, 'docs.bin')):
+            names.append('index.pkl')
+        return sum(
+            os.path.getsize(os.path.join(index_path, n))
+            for n in names if os.path.exists(os.path.join(index_path, n))
+        )
+
+    def _resident_bytes(self):
+        return sum(entry.size for entry in self._loaded.values())
+
+    def _evict(self, keep):
+        """Unloads least recently used bases until the budget is met (caller holds the lock)."""
+        evicted = []
+        while self._resident_bytes() > self.memory_budget and len(self._loaded) > 1:
+            name = next(iter(self._loaded))
+            if name == keep:
+                break
+            del self._loaded[name]
+            self.evictions += 1
+            evicted.append(name)
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            resident = [
+                {
+                    'name': name,
+                    'size_mb': entry.size / 2**20,
+                    'load_ms': entry.load_time * 1000,
+                    'hits': entry.hits,
+                    'idle_seconds': time.time() - entry.last_used,
+                }
+                for name, entry in reversed(self._loaded.items())
+            ]
+            return {
+                'available': self.names(),
+                'resident': resident,
+                'indexing': sorted(self._indexing),
+                'resident_mb': self._resident_bytes() / 2**20,
+                'memory_budget_mb': self.memory_budget / 2**20,
+                'hits': self.hits,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
@@ -1,32 +1,41 @@
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
 from sentence_transformers import SentenceTransformer
-from langchain_community.vectorstores import FAISS
-from langchain_core.documents import Document
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
-import json
+from retriever import ContextRetriever
+from ingestion import CustomEmbeddings, IncrementalIndexer
+from knowledge_bases import KnowledgeBaseRegistry, UnknownKnowledgeBaseError
+from prompts import PROMPT_TEMPLATE_HASH, build_prompt_suffix, extract_process_json
+from backends import create_backend
+from sinks import JsonFileSink
+from response_cache import ResponseCache, make_cache_key
+from semantic_cache import SemanticCache
+from metrics import ServerMetrics
+from batching import GenerationCancelled
+from contextlib import nullcontext
 import os
-import PyPDF2
-import re
 import time
+import uuid
 
-class CustomEmbeddings:
-    def __init__(self, embedding_model):
-        self.embedding_model = embedding_model
-    
-    def embed_documents(self, texts):
-        # Convert texts to embeddings
-        return [self.embedding_model.encode(text).tolist() for text in texts]
-    
-    def embed_query(self, query):
-        # Embed a single query
-        return self.embedding_model.encode(query).tolist()
+# Name of the knowledge base built from the context PDF of the server
+DEFAULT_KNOWLEDGE_BASE = 'default'
 
 class LLMHandler:
-    def __init__(self):
+    def __init__(self, backend=None, embedding_device=None, json_output_dir=None,
+                 cache_size=256, cache_ttl=86400, cache_dir=None,
+                 semantic_cache_size=1000, semantic_cache_threshold=0.92, metrics=None,
+                 index_config=None, knowledge_bases_dir=None, knowledge_base_memory_mb=1024,
+                 startup=None):
+        ti = time.time()
+
+        # Times the slow steps of the constructor as startup phases (see startup.Startup)
+        phase = startup.phase if startup is not None else (lambda name: nullcontext())
+
+        # Per-stage timings and counters exposed at /metrics
+        self.metrics = metrics if metrics is not None else ServerMetrics()
+        if torch.cuda.is_available():
+            self.metrics.gpu_memory_allocated.set_function(torch.cuda.memory_allocated)
+            self.metrics.gpu_memory_peak.set_function(torch.cuda.max_memory_allocated)
+
         # Paths and configurations
-        self.model_path = "/mnt/backupnas/fgarcia/Llama3"
-        self.json_path = "/home/fgarcia/bpmn_system/client/process.json"
         self.context_pdf_path = "/home/fgarcia/bpmn_system/server/context/contexto.pdf"
         self.vectorstore_path = os.path.join(
             os.path.dirname(self.context_pdf_path), 
@@ -35,284 +44,265 @@ class LLMHandler:
         
         # Similarity threshold for context retrieval
         self.similarity_threshold = 0.2
+
+        # Generation backend (GPU transformers model by default)
+        self.backend = backend if backend is not None else create_backend('hf')
+        self.model_id = self.backend.model_id
+
+        # Device of the sentence embedding model
+        if embedding_device is None:
+            embedding_device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.embedding_device = embedding_device
+
+        # Optional asynchronous copy of every generated process on disk
+        self.json_sink = JsonFileSink(json_output_dir) if json_output_dir else None
+
+        # Exact-match cache of generated processes (cache_size=0 disables it)
+        self.response_cache = None
+        if cache_size > 0:
+            self.response_cache = ResponseCache(
+                max_entries=cache_size,
+                ttl=cache_ttl,
+                disk_path=os.path.join(cache_dir, 'responses.sqlite') if cache_dir else None
+            )
+
+        # Semantic cache for near-duplicate prompts (created once the embedder is loaded)
+        self.semantic_cache_size = semantic_cache_size
+        self.semantic_cache_threshold = semantic_cache_threshold
+
+        # Setup RAG components
+        with phase('embedding'):
+            self.setup_embedding()
+
+        self.semantic_cache = None
+        if self.semantic_cache_size > 0:
+            self.semantic_cache = SemanticCache(
+                self.embedding_model,
+                threshold=self.semantic_cache_threshold,
+                capacity=self.semantic_cache_size
+            )
         
-        # Setup model and RAG components
-        self.setup_model()
-        self.setup_embedding()
-        
-        # Check if vectorstore exists, create only if not
-        if not os.path.exists(os.path.join(self.vectorstore_path, 'index.faiss')):
-            self.create_vectorstore()
-        
-    def setup_model(self):
-        # Quantization configuration
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_compute_dtype=torch.bfloat16,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_quant_type="nf4"
-        )
-        
-        # Load model and tokenizer
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_path,
-            device_map="auto",
-            torch_dtype=torch.bfloat16,
-            quantization_config=quantization_config
-        )
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        with phase('vectorstore'):
+            # Re-embed only the chunks of the context PDF that changed since the last run
+            self.indexer = IncrementalIndexer(
+                self.context_pdf_path, self.vectorstore_path, self.embeddings, index_config=index_config
+            )
+            self.sync_vectorstore()
+
+            # Load the vectorstore once, reusing the embedding model for queries
+            self.retriever = ContextRetriever(
+                self.vectorstore_path,
+                self.embeddings,
+                similarity_threshold=self.similarity_threshold
+            )
+
+        # Additional knowledge bases (one subfolder each), loaded on demand
+        self.knowledge_bases = None
+        if knowledge_bases_dir:
+            self.knowledge_bases = KnowledgeBaseRegistry(
+                knowledge_bases_dir,
+                self.embeddings,
+                memory_budget_mb=knowledge_base_memory_mb,
+                similarity_threshold=self.similarity_threshold,
+                index_config=index_config
+            )
+
+        print(f"LLMHandler inicializado en {time.time() - ti:.2f} segundos.")
         
     def setup_embedding(self):
-        # Use GPU-accelerated embedding model
+        # Use GPU-accelerated embedding model when available
         self.embedding_model = SentenceTransformer(
             'sentence-transformers/all-MiniLM-L6-v2', 
-            device='cuda'
+            device=self.embedding_device
         )
         
         # Create custom embeddings wrapper
         self.embeddings = CustomEmbeddings(self.embedding_model)
         
-    def extract_pdf_text(self):
-        """Extract text from PDF file and split into paragraphs"""
-        with open(self.context_pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            full_text = ""
-            for page in reader.pages:
-                # Reemplazar saltos de línea por espacios al extraer el texto
-                page_text = page.extract_text().replace('\n', ' ')
-                full_text += page_text + " "
-            
-            # Usar regex para separar párrafos que comienzan con un número seguido de punto
-            paragraphs = re.split(r'(?=\d+\.)', full_text)
-            
-            # Limpiar y filtrar párrafos
-            paragraphs = [
-                ' '.join(p.strip().split()) 
-                for p in paragraphs 
-                if p.strip() and len(p.strip()) > 50
-            ]
-            
-            # Eliminar el primer elemento si está vacío (puede ocurrir con el split)
-            if paragraphs and not paragraphs[0].startswith('1.'):
-                paragraphs = paragraphs[1:]
-            
-            # Mostrar los párrafos 1 y 2 por terminal
-            if len(paragraphs) >= 2:
-                print("Párrafo 1:", paragraphs[0])
-                print("\nPárrafo 2:", paragraphs[1])
-            
-            print("\nTotal de párrafos:", len(paragraphs))
-            
-            return paragraphs
-    
-    def create_vectorstore(self):
-        print("Creating vectorstore...")
-        
-        # Extract paragraphs from PDF
-        paragraphs = self.extract_pdf_text()
-        
-        # Create documents from paragraphs
-        documents = [Document(page_content=para) for para in paragraphs]
-        
-        # Create FAISS vectorstore with custom embeddings
-        vectorstore = FAISS.from_documents(
-            documents, 
-            embedding=self.embeddings
-        )
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(self.vectorstore_path), exist_ok=True)
-        
-        # Save vectorstore locally
-        vectorstore.save_local(self.vectorstore_path)
-        print("Vectorstore created successfully.")
+    def warmup(self):
+        """
+        Runs one retrieval and one short generation outside the caches and metrics.
+
+        The first calls initialize CUDA kernels, allocator pools and lazy
+        buffers; doing them at startup keeps that cost out of the first request.
+        """
+        self.retrieve_context("Proceso de calentamiento")
+        self.backend.warmup()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+
+    def sync_vectorstore(self, force=False):
+        """Updates the vectorstore with the chunks of the context PDF that changed since the last sync."""
+        return self.indexer.sync(force=force)
         
-    def retrieve_context(self, query, k=1):
+    def get_retriever(self, knowledge_base=None):
+        """
+        Retriever of a knowledge base; None or 'default' is the context PDF of the server.
+
+        Raises:
+            UnknownKnowledgeBaseError: If the knowledge base does not exist
+        """
+        if knowledge_base in (None, '', DEFAULT_KNOWLEDGE_BASE):
+            return self.retriever
+        if self.knowledge_bases is None:
+            raise UnknownKnowledgeBaseError(f"Base de conocimiento desconocida: {knowledge_base}")
+        return self.knowledge_bases.get(knowledge_base)
+
+    def retrieve_context(self, query, k=1, knowledge_base=None):
         """
         Retrieve top k most relevant context documents above similarity threshold
         
         Args:
             query (str): Input query to find relevant context
-            k (int, optional): Maximum number of documents to retrieve. Defaults to 3.
+            k (int, optional): Maximum number of documents to retrieve. Defaults to 1.
+            knowledge_base (str, optional): Knowledge base to search. Defaults to the context PDF.
         
         Returns:
             str: Concatenated relevant context paragraphs
         """
-        # Load existing vectorstore
-        vectorstore = FAISS.load_local(
-            self.vectorstore_path, 
-            HuggingFaceBgeEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2'),
-            allow_dangerous_deserialization=True
-        )
-        
-        # Compute similarity scores for all documents
-        retriever = vectorstore.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={
-                "k": k,
-                "score_threshold": self.similarity_threshold
-            }
-        )
-        
-        # Retrieve similar documents
-        similar_docs = retriever.get_relevant_documents(query)
+        ti = time.time()
+        context = self.get_retriever(knowledge_base).retrieve(query, k=k)
+        tf = time.time()
 
-        # Return concatenated paragraphs or empty string if no relevant docs
-        return "\n".join([doc.page_content for doc in similar_docs]) if similar_docs else ""
+        print(f"Contexto recuperado en {(tf - ti) * 1000:.1f} ms.")
+
+        return context
     
-    def generate_json(self, user_prompt):
+    def generate_json(self, user_prompt, request_id=None, cancel_event=None, use_semantic_cache=True,
+                      knowledge_base=None, on_text=None):
+        """
+        Generates the process flow for a user description.
+
+        Args:
+            user_prompt (str): Description of the process
+            request_id (str, optional): Identifier used to name the saved copy
+            cancel_event (threading.Event, optional): Stops the generation when set
+            use_semantic_cache (bool, optional): Set to False to skip the semantic cache
+            knowledge_base (str, optional): Knowledge base used as context (default: the context PDF)
+            on_text (callable, optional): Receives the generated text piece by piece
+                (not called when the answer comes from a cache)
+
+        Returns:
+            dict: Parsed process JSON
 
+        Raises:
+            ValueError: If the model output does not contain valid JSON
+            GenerationCancelled: If cancel_event was set (raised by the backend)
+            UnknownKnowledgeBaseError: If knowledge_base does not exist
+        """
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+
+        ti = time.time()
+        record = {'outcome': 'error', 'stages': {}, 'prompt_tokens': None, 'generated_tokens': None}
+        try:
+            return self._generate_json(
+                user_prompt, request_id, cancel_event, use_semantic_cache, knowledge_base, record, on_text
+            )
+        except GenerationCancelled:
+            record['outcome'] = 'cancelled'
+            raise
+        finally:
+            self.metrics.record_request(request_id, duration=time.time() - ti, **record)
+
+    def _generate_json(self, user_prompt, request_id, cancel_event, use_semantic_cache, knowledge_base, record,
+                       on_text=None):
+        """Body of generate_json; fills `record` with the outcome, stage timings and token counts."""
+        stages = record['stages']
         ti = time.time()
 
         # Retrieve relevant context
-        context = self.retrieve_context(user_prompt)
+        if knowledge_base == DEFAULT_KNOWLEDGE_BASE:
+            knowledge_base = None
+        context = self.retrieve_context(user_prompt, knowledge_base=knowledge_base)
+        stages['retrieval'] = time.time() - ti
         
         print("CONTEXT: ",context)
 
-        # Augment system prompt with context
-        system_prompt = f"""Eres un experto en modelado de procesos y generación de diagramas BPMN. 
-        
-        Contexto adicional relevante para generar la información del JSON:
-        
-        {context}
-        """
+        # Same prompt, context, model and template: reuse the previous result
+        ts = time.time()
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = make_cache_key(user_prompt, context, self.model_id, PROMPT_TEMPLATE_HASH)
+            process_json = self.response_cache.get(cache_key)
+            if process_json is not None:
+                stages['cache_lookup'] = time.time() - ts
+                print(f"Respuesta servida desde la caché en {(time.time() - ti) * 1000:.1f} ms.")
+                record['outcome'] = 'exact_cache'
+                self._save(request_id, process_json, stages)
+                return process_json
 
-        system_prompt = system_prompt + """
-        **Requisitos principales**:
-
-        1. **Único flujo secuencial**:
-            - Todo el proceso debe estar estructurado en un único flujo de principio a fin.
-            - Cada elemento del proceso (tareas, pasarelas, bucles) debe integrarse en el flujo principal sin interrupciones.
-
-        2. **Estructura secuencial**:
-            - El flujo debe seguir un orden estricto definido por el arreglo `flow`. Este orden determina cómo se ejecutan las tareas, pasarelas y bucles.
-
-        3. **Eventos**:
-            - Debe existir un único evento de inicio (`inicio`) y uno o varios eventos de fin (`fin`). El evento de fin contendrá un campo de condición.
-
-        4. **Tareas**:
-            - Cada tarea debe incluir un `name` único y una descripción opcional (`description`).
-            - Deben estar alineadas en el flujo secuencial.
-
-        5. **Pasarelas (Gateways)**:
-            - Representan decisiones (XOR) o paralelismos (AND).
-            - Cada pasarela debe incluir:
-                - `name`: Identificador único.
-                - `type_pasarela`: Especifica si es "XOR" o "AND". En caso de ser "AND" no llevará condición. En caso de sr "XOR" llevará condición.
-                - `ramas`: Listas de tareas o elementos dentro de cada rama.
-                - Cada rama debe incluir:
-                    `name`: Nombre de la rama
-                    `condición`: Condición de elección de la rama   
-                    `tareas`: Tareas a realizar en la rama
-
-
-        6. **Bucles**:
-            - Representan tareas o procesos repetitivos.
-            - Deben incluir:
-                - `name`: Identificador único del bucle.
-                - `condición`: Criterio para detener el bucle.
-                - `tareas`: Lista de elementos que forman parte del bucle.
-
-        7. **Formato JSON actualizado**:
-            - Todo el proceso debe estar contenido en un único flujo dentro del arreglo `flow`.
-            - Los elementos en el flujo deben ser secuenciales, respetando las conexiones lógicas.
-            - Cuando generes tareas dentro de las ramas de una pasarela o bucle, SIEMPRE utiliza listas de strings simples para los nombres de las tareas.
-            - Si una tarea requiere más detalles, conviértela en un elemento completo de diccionario dentro del flujo principal, y en las ramas de pasarelas o bucles, usa solo su nombre como string.
-
-        A continuación se te proporciona un ejemplo de JSON. ES SOLO UN EJEMPLO de como se representa cada tipo de suceso. Los eventos serán distintos para cada proceso.
-        Basándote en esta estructura deberás de la manera más óptima posible como experto que eres seleccionar que tipo de pasarelas, bucles, eventos y tareas utilizar y en que orden. 
-        Deberás tratar de ser lo más variado posible a la vez que óptimo en la selección de eventos.
-
-        **Ejemplo de Formato JSON esperado**:
-
-        ```json
-        {
-            "flow": [
-                {"type": "evento", "name": "inicio"},
-                {"type": "tarea", "name": "Preparar contrato de empleo", "description": "Preparar el contrato de empleo y los documentos necesarios"},
-                {
-                    "type": "pasarela",
-                    "name": "Evaluación del candidato",
-                    "type_pasarela": "XOR",
-                    "ramas": [
-                        {
-                            "name": "Contratar al candidato", 
-                            "condición": "El candidato cumple con los requisitos del puesto",
-                            "tareas": [
-                                "Preparar contrato de empleo", 
-                                "Realizar entrevista de ingreso"
-                            ]
-                        },
-                        {
-                            "name": "Revisar otros candidatos",
-                            "condición": "El candidato no cumple con los requisitos del puesto", 
-                            "tareas": ["Evaluar otros candidatos"]
-                        }
-                    ]
-                },
-                {
-                    "type": "bucle",
-                    "name": "Revisión de documentos",
-                    "condición": "Hasta que todos los documentos estén aprobados",
-                    "tareas": [
-                        "Revisar documento", 
-                        "Solicitar correcciones si es necesario"
-                    ]
-                },
-                {"type": "evento", "name": "fin", "condicion": "Empleado contratado"}
-            ]
-        }
-        ```
-
-        DEVUELVE ÚNICAMENTE EL JSON PEDIDO SIN NINGÚN COMENTARIO ADICIONAL.
-        """
+        # A prompt that means the same as a previous one reuses its result
+        if self.semantic_cache is not None:
+            if not use_semantic_cache:
+                self.semantic_cache.record_bypass()
+            else:
+                cached = self.semantic_cache.lookup(user_prompt, namespace=knowledge_base)
+                if cached is not None:
+                    stages['cache_lookup'] = time.time() - ts
+                    process_json, similarity, cached_prompt = cached
+                    print(f"Respuesta servida desde la caché semántica (similitud {similarity:.3f} "
+                          f"con '{cached_prompt}') en {(time.time() - ti) * 1000:.1f} ms.")
+                    record['outcome'] = 'semantic_cache'
+                    self._save(request_id, process_json, stages)
+                    return process_json
+        stages['cache_lookup'] = time.time() - ts
 
-        # Rest of the generation logic remains the same
-        input_text = f"""
-        <|begin_of_text|><|start_header_id|>system<|end_header_id|>
-        {system_prompt}<|eot_id|>
-        <|start_header_id|>user<|end_header_id|>
-        {user_prompt}<|eot_id|>
-        <|start_header_id|>assistant<|end_header_id|>
-        """
+        # Build the variable part of the prompt (the fixed part comes first)
+        ts = time.time()
+        prompt_suffix = build_prompt_suffix(context, user_prompt)
+        stages['prompt_build'] = time.time() - ts
         
-        input_ids = self.tokenizer(input_text, return_tensors="pt").to("cuda")
-        output = self.model.generate(**input_ids, max_new_tokens=2000)
-        decoded_output = self.tokenizer.decode(output[0], skip_special_tokens=False)
+        result = self.backend.generate(prompt_suffix, cancel_event=cancel_event, on_text=on_text)
+        generated_text = result.text
         
         tf = time.time()
 
-        print("JSON generado en ", tf-ti , " segundos.")
+        record['prompt_tokens'] = result.prompt_tokens
+        record['generated_tokens'] = result.generated_tokens
+        stages['tokenization'] = result.tokenization_time
+        if result.time_to_first_token is not None:
+            stages['prefill'] = result.time_to_first_token
+            stages['decode'] = result.generation_time - result.time_to_first_token
+        stages['decode_to_text'] = result.decode_to_text_time
 
-        # Extract assistant's response (same as before)
-        assistant_start = "<|start_header_id|>assistant<|end_header_id|>"
-        if assistant_start in decoded_output:
-            generated_text = decoded_output.split(assistant_start)[-1].strip()
-        else:
-            generated_text = decoded_output
+        print("JSON generado en ", tf-ti , " segundos.")
+        # Sin tokens generados no hay TTFT
+        ttft = '-' if result.time_to_first_token is None else f"{result.time_to_first_token:.3f}"
+        print(f"Tokens prompt: {result.prompt_tokens} | "
+              f"tokens prefill: {result.prefill_tokens} | "
+              f"TTFT: {ttft} s | "
+              f"generación: {result.generation_time:.2f} s")
+        print(f"Tokens generados: {result.generated_tokens} "
+              f"(ahorrados frente a max_new_tokens: {self.backend.max_new_tokens - result.generated_tokens})")
         
+        # Extract JSON (same as before)
+        ts = time.time()
         try:
-            # Extract JSON (same as before)
-            json_start = generated_text.find('{')
-            json_end = generated_text.rfind('}') + 1
-            
-            if json_start == -1 or json_end == 0:
-                raise ValueError("No se encontró JSON válido en la respuesta")
-            
-            json_text = generated_text[json_start:json_end]
-            process_json = json.loads(json_text)
-
-            print(json_text)
-
-            # Save JSON
-            with open(self.json_path, 'w', encoding='utf-8') as f:
-                json.dump(process_json, f, indent=2, ensure_ascii=False)
-            
-            return 200
-        except Exception as e:
-            print(f"Error al procesar o guardar el JSON: {str(e)}")
-            print(f"Texto generado: {json_text}")  # For debugging
-            return 500
+            process_json = extract_process_json(generated_text)
+        except ValueError:
+            self.metrics.json_parse_failures.inc()
+            raise
+        stages['json_parse'] = time.time() - ts
+
+        print(generated_text)
+
+        ts = time.time()
+        if cache_key is not None:
+            self.response_cache.put(cache_key, process_json, tf - ti)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(user_prompt, process_json, tf - ti, namespace=knowledge_base)
+        self._save(request_id, process_json, stages, started=ts)
+        
+        record['outcome'] = 'generated'
+        return process_json
+
+    def _save(self, request_id, process_json, stages, started=None):
+        """Persists a copy in the background if a sink is configured and times the save stage."""
+        ts = time.time() if started is None else started
+        if self.json_sink is not None:
+            self.json_sink.submit(request_id, process_json)
+        stages['save'] = time.time() - ts
 
 # Usage example
 if __name__ == "__main__":
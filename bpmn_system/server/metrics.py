@@ -0,0 +1,239 @@
+"""
+Métricas del servidor en el formato de texto de Prometheus.
+
+Implementación mínima de contadores, gauges e histogramas con etiquetas, sin
+dependencias externas, y el conjunto de métricas que registra LLMHandler por
+cada petición. El endpoint `/metrics` devuelve `ServerMetrics.render()`.
+"""
+
+import json
+import threading
+import time
+
+# Límites de los histogramas de latencia (segundos) y de número de tokens
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base of a metric family: one value per combination of label values."""
+
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """Yields (suffix, label values, extra label, value) for the exposition."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield '_total', values, None, value
+
+
+class Gauge(Metric):
+    """Gauge set explicitly or read from a callback at scrape time."""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """`function()` returns the current value (or None to omit it); only for unlabeled gauges."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            value = self._function()
+            if value is not None:
+                yield '', (), None, value
+            return
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield '', values, None, value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield '_bucket', values, ('le', _format_value(bound)), cumulative
+            yield '_sum', values, None, total
+            yield '_count', values, None, count
+
+
+class ServerMetrics:
+    """
+    Metrics recorded for every generation request.
+
+    Stage timings go to a single histogram labeled by stage; requests are
+    counted by outcome (generated, exact_cache, semantic_cache, cancelled or
+    error). Gauges such as the job queue depth or GPU memory are read through
+    callbacks when `/metrics` is scraped. With `json_log` every request also
+    prints one JSON line with its timings and token counts.
+    """
+
+    STAGES = ('retrieval', 'cache_lookup', 'prompt_build', 'tokenization', 'prefill', 'decode',
+              'decode_to_text', 'json_parse', 'save')
+
+    def __init__(self, json_log=False):
+        self.json_log = json_log
+        self.stage_duration = Histogram(
+            'bpmn_stage_duration_seconds', "Duration of each stage of a generation request.", ('stage',)
+        )
+        self.request_duration = Histogram(
+            'bpmn_request_duration_seconds', "End-to-end duration of generation requests.", ('outcome',)
+        )
+        self.requests = Counter('bpmn_requests', "Generation requests by outcome.", ('outcome',))
+        self.prompt_tokens = Histogram(
+            'bpmn_prompt_tokens', "Prompt tokens per generated request.", buckets=TOKEN_BUCKETS
+        )
+        self.generated_tokens = Histogram(
+            'bpmn_generated_tokens', "Generated tokens per request.", buckets=TOKEN_BUCKETS
+        )
+        self.stream_latency = Histogram(
+            'bpmn_stream_latency_seconds',
+            "Time from the start of a streamed request to its first token, its first flow element and its end.",
+            ('point',)
+        )
+        self.json_parse_failures = Counter(
+            'bpmn_json_parse_failures', "Model outputs without a valid process JSON."
+        )
+        self.queue_depth = Gauge('bpmn_job_queue_depth', "Jobs waiting for a generation worker.")
+        self.gpu_memory_allocated = Gauge(
+            'bpmn_gpu_memory_allocated_bytes', "GPU memory currently allocated by torch."
+        )
+        self.gpu_memory_peak = Gauge(
+            'bpmn_gpu_memory_peak_bytes', "Peak GPU memory allocated by torch since start."
+        )
+        self._metrics = [
+            self.stage_duration, self.request_duration, self.requests, self.prompt_tokens,
+            self.generated_tokens, self.stream_latency, self.json_parse_failures, self.queue_depth,
+            self.gpu_memory_allocated, self.gpu_memory_peak,
+        ]
+
+    def register(self, metric):
+        """Adds another metric (e.g. from a component of the server) to the exposition."""
+        self._metrics.append(metric)
+        return metric
+
+    def record_request(self, request_id, outcome, duration, stages, prompt_tokens=None, generated_tokens=None):
+        """
+        Records one finished request.
+
+        Args:
+            outcome (str): generated, exact_cache, semantic_cache, cancelled or error
+            duration (float): Seconds since the request started
+            stages (dict): Seconds spent in each stage that ran
+        """
+        for stage, seconds in stages.items():
+            self.stage_duration.observe(seconds, stage=stage)
+        self.request_duration.observe(duration, outcome=outcome)
+        self.requests.inc(outcome=outcome)
+        if prompt_tokens is not None:
+            self.prompt_tokens.observe(prompt_tokens)
+        if generated_tokens is not None:
+            self.generated_tokens.observe(generated_tokens)
+
+        if self.json_log:
+            print(json.dumps({
+                'event': 'generate_json',
+                'time': time.time(),
+                'request_id': request_id,
+                'outcome': outcome,
+                'duration_ms': round(duration * 1000, 3),
+                'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+                'prompt_tokens': prompt_tokens,
+                'generated_tokens': generated_tokens,
+            }), flush=True)
+
+    def record_stream(self, time_to_first_token=None, time_to_first_element=None, total_time=None):
+        """Records the latency points of one streamed request; points it never reached are None."""
+        for point, seconds in (('first_token', time_to_first_token),
+                               ('first_element', time_to_first_element),
+                               ('total', total_time)):
+            if seconds is not None:
+                self.stream_latency.observe(seconds, point=point)
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
@@ -0,0 +1,114 @@
+"""
+Vectorstore de solo lectura abierto con memory mapping.
+
+El índice FAISS se abre mapeado en memoria y los textos de los documentos se
+guardan en un fichero compacto (`docs.bin`, textos UTF-8 concatenados) con sus
+posiciones en `docs.offsets.npy`, también mapeado. Abrirlo es casi instantáneo,
+varios procesos del servidor comparten las mismas páginas de la caché del
+sistema operativo y no se deserializa ningún pickle al atender peticiones.
+"""
+
+import faiss
+import math
+import mmap
+import numpy as np
+import os
+
+INDEX_FILE = 'index.faiss'
+DOCS_FILE = 'docs.bin'
+OFFSETS_FILE = 'docs.offsets.npy'
+MMAP_FILES = (INDEX_FILE, DOCS_FILE, OFFSETS_FILE)
+
+
+def write_documents(folder, texts):
+    """Writes the texts (in index order) as docs.bin plus their start offsets."""
+    offsets = np.zeros(len(texts) + 1, dtype='<i8')
+    with open(os.path.join(folder, DOCS_FILE), 'wb') as f:
+        for i, text in enumerate(texts):
+            data = text.encode('utf-8')
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(os.path.join(folder, OFFSETS_FILE), offsets)
+
+
+def read_index_mmap(path):
+    """Opens a FAISS index memory-mapped, or reads it into memory if this index type cannot be mapped."""
+    flags = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class DocumentFile:
+    """Random access to the texts of docs.bin through the memory-mapped offsets."""
+
+    def __init__(self, folder):
+        self.offsets = np.load(os.path.join(folder, OFFSETS_FILE), mmap_mode='r', allow_pickle=False)
+        self._file = open(os.path.join(folder, DOCS_FILE), 'rb')
+        # An empty file cannot be mapped
+        self._data = b''
+        if self.offsets[-1] > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class MmapVectorStore:
+    """
+    Similarity search over a memory-mapped index and document file.
+
+    Scores follow LangChain's FAISS vectorstore for L2 indexes (relevance =
+    1 - distance / sqrt(2)), so the same similarity threshold keeps working.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index = read_index_mmap(os.path.join(folder, INDEX_FILE))
+        self.documents = DocumentFile(folder)
+        if self.index.ntotal != len(self.documents):
+            self.documents.close()
+            raise ValueError(
+                f"El índice tiene {self.index.ntotal} vectores pero hay {len(self.documents)} documentos"
+            )
+
+    @staticmethod
+    def exists(folder):
+        return all(os.path.exists(os.path.join(folder, name)) for name in MMAP_FILES)
+
+    def search(self, query_vector, k=1, score_threshold=None):
+        """
+        Returns up to k (text, relevance score) pairs, best first.
+
+        Args:
+            query_vector: Embedding of the query
+            k (int): Maximum number of documents
+            score_threshold (float, optional): Minimum relevance score
+        """
+        if self.index.ntotal == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype='float32').reshape(1, -1)
+        distances, ids = self.index.search(query, min(k, self.index.ntotal))
+
+        results = []
+        for distance, i in zip(distances[0], ids[0]):
+            if i < 0:
+                continue
+            score = 1.0 - float(distance) / math.sqrt(2)
+            if score_threshold is not None and score < score_threshold:
+                continue
+            results.append((self.documents[i], score))
+        return results
+
+    def close(self):
+        self.documents.close()
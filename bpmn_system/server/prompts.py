@@ -0,0 +1,145 @@
+"""
+Plantilla del prompt usado para generar el JSON del proceso.
+
+El prompt se divide en una parte fija (instrucciones, reglas BPMN y ejemplo de JSON),
+que va primero para poder reutilizar su KV cache entre peticiones, y una parte variable
+con el contexto recuperado y la descripción del usuario.
+"""
+
+import hashlib
+import json
+
+# Parte fija del prompt: siempre idéntica, se procesa una única vez si el prefix cache está activo
+SYSTEM_PROMPT_PREFIX = """
+        <|begin_of_text|><|start_header_id|>system<|end_header_id|>
+        Eres un experto en modelado de procesos y generación de diagramas BPMN. 
+
+        **Requisitos principales**:
+
+        1. **Único flujo secuencial**:
+            - Todo el proceso debe estar estructurado en un único flujo de principio a fin.
+            - Cada elemento del proceso (tareas, pasarelas, bucles) debe integrarse en el flujo principal sin interrupciones.
+
+        2. **Estructura secuencial**:
+            - El flujo debe seguir un orden estricto definido por el arreglo `flow`. Este orden determina cómo se ejecutan las tareas, pasarelas y bucles.
+
+        3. **Eventos**:
+            - Debe existir un único evento de inicio (`inicio`) y uno o varios eventos de fin (`fin`). El evento de fin contendrá un campo de condición.
+
+        4. **Tareas**:
+            - Cada tarea debe incluir un `name` único y una descripción opcional (`description`).
+            - Deben estar alineadas en el flujo secuencial.
+
+        5. **Pasarelas (Gateways)**:
+            - Representan decisiones (XOR) o paralelismos (AND).
+            - Cada pasarela debe incluir:
+                - `name`: Identificador único.
+                - `type_pasarela`: Especifica si es "XOR" o "AND". En caso de ser "AND" no llevará condición. En caso de sr "XOR" llevará condición.
+                - `ramas`: Listas de tareas o elementos dentro de cada rama.
+                - Cada rama debe incluir:
+                    `name`: Nombre de la rama
+                    `condición`: Condición de elección de la rama   
+                    `tareas`: Tareas a realizar en la rama
+
+
+        6. **Bucles**:
+            - Representan tareas o procesos repetitivos.
+            - Deben incluir:
+                - `name`: Identificador único del bucle.
+                - `condición`: Criterio para detener el bucle.
+                - `tareas`: Lista de elementos que forman parte del bucle.
+
+        7. **Formato JSON actualizado**:
+            - Todo el proceso debe estar contenido en un único flujo dentro del arreglo `flow`.
+            - Los elementos en el flujo deben ser secuenciales, respetando las conexiones lógicas.
+            - Cuando generes tareas dentro de las ramas de una pasarela o bucle, SIEMPRE utiliza listas de strings simples para los nombres de las tareas.
+            - Si una tarea requiere más detalles, conviértela en un elemento completo de diccionario dentro del flujo principal, y en las ramas de pasarelas o bucles, usa solo su nombre como string.
+
+        A continuación se te proporciona un ejemplo de JSON. ES SOLO UN EJEMPLO de como se representa cada tipo de suceso. Los eventos serán distintos para cada proceso.
+        Basándote en esta estructura deberás de la manera más óptima posible como experto que eres seleccionar que tipo de pasarelas, bucles, eventos y tareas utilizar y en que orden. 
+        Deberás tratar de ser lo más variado posible a la vez que óptimo en la selección de eventos.
+
+        **Ejemplo de Formato JSON esperado**:
+
+        ```json
+        {
+            "flow": [
+                {"type": "evento", "name": "inicio"},
+                {"type": "tarea", "name": "Preparar contrato de empleo", "description": "Preparar el contrato de empleo y los documentos necesarios"},
+                {
+                    "type": "pasarela",
+                    "name": "Evaluación del candidato",
+                    "type_pasarela": "XOR",
+                    "ramas": [
+                        {
+                            "name": "Contratar al candidato", 
+                            "condición": "El candidato cumple con los requisitos del puesto",
+                            "tareas": [
+                                "Preparar contrato de empleo", 
+                                "Realizar entrevista de ingreso"
+                            ]
+                        },
+                        {
+                            "name": "Revisar otros candidatos",
+                            "condición": "El candidato no cumple con los requisitos del puesto", 
+                            "tareas": ["Evaluar otros candidatos"]
+                        }
+                    ]
+                },
+                {
+                    "type": "bucle",
+                    "name": "Revisión de documentos",
+                    "condición": "Hasta que todos los documentos estén aprobados",
+                    "tareas": [
+                        "Revisar documento", 
+                        "Solicitar correcciones si es necesario"
+                    ]
+                },
+                {"type": "evento", "name": "fin", "condicion": "Empleado contratado"}
+            ]
+        }
+        ```
+
+        DEVUELVE ÚNICAMENTE EL JSON PEDIDO SIN NINGÚN COMENTARIO ADICIONAL.
+        """
+
+
+def build_prompt_suffix(context, user_prompt):
+    """Builds the variable part of the prompt: retrieved context and user request."""
+    return f"""
+        Contexto adicional relevante para generar la información del JSON:
+        
+        {context}
+        <|eot_id|>
+        <|start_header_id|>user<|end_header_id|>
+        {user_prompt}<|eot_id|>
+        <|start_header_id|>assistant<|end_header_id|>
+        """
+
+
+def extract_process_json(generated_text):
+    """
+    Parses the process JSON from the model output, ignoring any text around it.
+
+    Raises:
+        ValueError: If the output does not contain a valid JSON object
+    """
+    json_start = generated_text.find('{')
+    json_end = generated_text.rfind('}') + 1
+
+    if json_start == -1 or json_end == 0:
+        print(f"Texto generado: {generated_text}")  # For debugging
+        raise ValueError("No se encontró JSON válido en la respuesta")
+
+    json_text = generated_text[json_start:json_end]
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError as e:
+        print(f"Texto generado: {json_text}")  # For debugging
+        raise ValueError(f"El JSON generado no es válido: {str(e)}")
+
+
+# Identifica la versión de la plantilla completa (para invalidar cachés si cambia)
+PROMPT_TEMPLATE_HASH = hashlib.sha256(
+    (SYSTEM_PROMPT_PREFIX + build_prompt_suffix('{context}', '{user_prompt}')).encode('utf-8')
+).hexdigest()
@@ -0,0 +1,130 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_prompt(prompt):
+    """Unicode-normalizes, case-folds and collapses whitespace so trivial variations share a key."""
+    return ' '.join(unicodedata.normalize('NFC', prompt).casefold().split())
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def make_cache_key(prompt, context, model_path, prompt_template):
+    """Key of a generation: normalized prompt plus hashes of the context, model and template."""
+    parts = [normalize_prompt(prompt), _sha256(context), model_path, _sha256(prompt_template)]
+    return _sha256(json.dumps(parts, ensure_ascii=False))
+
+
+class ResponseCache:
+    """
+    Exact-match cache of generated processes.
+
+    Two tiers: an in-memory LRU of `max_entries` items and, if `disk_path` is
+    given, a SQLite file that survives restarts and holds up to `max_disk_entries`
+    items. Entries older than `ttl` seconds are treated as missing and removed.
+    Each entry remembers how long its generation took, so hits report the
+    generation time they saved.
+    """
+
+    def __init__(self, max_entries=256, ttl=86400, disk_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT, generation_time REAL, created REAL, last_access REAL)"
+            )
+            self._db.commit()
+
+        # Statistics
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        """Returns the cached process for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, generation_time, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self.saved_seconds += generation_time
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, generation_time, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, generation_time, created = row
+                    if now - created <= self.ttl:
+                        self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, value, generation_time, created)
+                        self.disk_hits += 1
+                        self.saved_seconds += generation_time
+                        return json.loads(value)
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key, process_json, generation_time):
+        """Stores a generated process in both tiers."""
+        value = json.dumps(process_json, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, generation_time, now)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                    (key, value, generation_time, now, now)
+                )
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY last_access DESC LIMIT ?)",
+                    (self.max_disk_entries,)
+                )
+                self._db.commit()
+
+    def _remember(self, key, value, generation_time, created):
+        self._memory[key] = (value, generation_time, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': hits / total if total else 0.0,
+            'memory_entries': len(self._memory),
+            'saved_seconds': self.saved_seconds,
+        }
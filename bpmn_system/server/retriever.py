@@ -0,0 +1,114 @@
+from langchain_community.vectorstores import FAISS
+from mmap_store import MmapVectorStore
+import os
+import threading
+import time
+
+
+class ContextRetriever:
+    """
+    Keeps the FAISS vectorstore loaded for the whole life of the process.
+
+    The index is loaded once and reused by every request. Before each search the
+    modification time and size of the files in the index folder are checked, and
+    the vectorstore is reloaded if any of them changed on disk.
+
+    When the folder has the memory-mapped format (docs.bin) the index and texts
+    are mapped instead of read, with no pickle involved; otherwise the LangChain
+    `index.pkl` docstore is loaded.
+    """
+
+    INDEX_FILES = ('index.faiss', 'index.pkl', 'docs.bin', 'docs.offsets.npy')
+
+    def __init__(self, vectorstore_path, embeddings, similarity_threshold=0.2):
+        self.vectorstore_path = vectorstore_path
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+
+        self.vectorstore = None
+        self._signature = None
+        self._lock = threading.Lock()
+
+        self.load()
+
+    def _index_signature(self):
+        """Returns (mtime, size) of every index file, or None if there is no index."""
+        if not os.path.exists(os.path.join(self.vectorstore_path, 'index.faiss')):
+            return None
+        signature = []
+        for name in self.INDEX_FILES:
+            try:
+                stat = os.stat(os.path.join(self.vectorstore_path, name))
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load(self):
+        """Loads the vectorstore from disk, reusing the already loaded embedding model."""
+        ti = time.time()
+
+        signature = self._index_signature()
+        if MmapVectorStore.exists(self.vectorstore_path):
+            vectorstore = MmapVectorStore(self.vectorstore_path)
+        else:
+            vectorstore = FAISS.load_local(
+                self.vectorstore_path,
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+
+        with self._lock:
+            self.vectorstore = vectorstore
+            self._signature = signature
+
+        tf = time.time()
+        print(f"Vectorstore cargado en {(tf - ti) * 1000:.1f} ms ({vectorstore.index.ntotal} vectores"
+              f"{', mmap' if isinstance(vectorstore, MmapVectorStore) else ''}).")
+
+    def reload_if_changed(self):
+        """Reloads the vectorstore if the files in the index folder changed on disk."""
+        signature = self._index_signature()
+        if signature is None or signature == self._signature:
+            return False
+
+        print("Cambios detectados en el índice, recargando vectorstore...")
+        try:
+            self.load()
+        except ValueError as e:
+            # The files are still being replaced: keep serving the loaded index and retry later
+            print(f"No se pudo recargar el vectorstore: {e}")
+            return False
+        return True
+
+    def retrieve(self, query, k=1):
+        """
+        Retrieve top k most relevant context documents above similarity threshold
+
+        Args:
+            query (str): Input query to find relevant context
+            k (int, optional): Maximum number of documents to retrieve. Defaults to 1.
+
+        Returns:
+            str: Concatenated relevant context paragraphs
+        """
+        self.reload_if_changed()
+
+        vectorstore = self.vectorstore
+        if isinstance(vectorstore, MmapVectorStore):
+            results = vectorstore.search(
+                self.embeddings.embed_query(query), k=k, score_threshold=self.similarity_threshold
+            )
+            return "\n".join(text for text, _ in results)
+
+        retriever = vectorstore.as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={
+                "k": k,
+                "score_threshold": self.similarity_threshold
+            }
+        )
+        similar_docs = retriever.get_relevant_documents(query)
+
+        return "\n".join([doc.page_content for doc in similar_docs]) if similar_docs else ""
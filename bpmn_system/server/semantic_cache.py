@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from response_cache import normalize_prompt
+import faiss
+import json
+import numpy as np
+import threading
+import time
+
+
+class SemanticCache:
+    """
+    Reuses generated processes for prompts that mean the same thing.
+
+    Every stored prompt is embedded with the sentence embedding model and kept in
+    a dedicated inner-product FAISS index over normalized vectors (cosine
+    similarity). A lookup returns the stored process of the closest prompt when
+    its similarity reaches `threshold`. At most `capacity` prompts are kept; the
+    least recently used one is evicted first.
+
+    Entries belong to a namespace (e.g. the knowledge base used to generate
+    them) and a lookup only matches prompts of its own namespace.
+    """
+
+    # Closest stored prompts checked for one of the requested namespace
+    SEARCH_CANDIDATES = 8
+
+    def __init__(self, embedding_model, threshold=0.92, capacity=1000):
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.capacity = capacity
+
+        dimension = embedding_model.get_sentence_embedding_dimension()
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self.entries = OrderedDict()  # id -> (prompt, process JSON, generation time, namespace)
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.lookup_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _embed(self, prompt):
+        embedding = self.embedding_model.encode(
+            [normalize_prompt(prompt)], normalize_embeddings=True
+        )
+        return np.asarray(embedding, dtype='float32')
+
+    def lookup(self, prompt, namespace=None):
+        """
+        Returns (process JSON, similarity, cached prompt) of the most similar
+        stored prompt of `namespace` above the threshold, or None.
+        """
+        ti = time.time()
+        embedding = self._embed(prompt)
+
+        with self._lock:
+            result = None
+            if self.index.ntotal > 0:
+                scores, ids = self.index.search(embedding, min(self.SEARCH_CANDIDATES, self.index.ntotal))
+                for entry_id, similarity in zip(ids[0].tolist(), scores[0].tolist()):
+                    if similarity < self.threshold:
+                        break
+                    entry = self.entries.get(entry_id)
+                    if entry is None or entry[3] != namespace:
+                        continue
+                    self.entries.move_to_end(entry_id)
+                    cached_prompt, value, generation_time, _ = entry
+                    result = (json.loads(value), similarity, cached_prompt)
+                    break
+
+            lookup_time = time.time() - ti
+            self.lookup_seconds += lookup_time
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += max(generation_time - lookup_time, 0.0)
+        return result
+
+    def add(self, prompt, process_json, generation_time, namespace=None):
+        """Stores a generated process, evicting the least recently used prompt if full."""
+        embedding = self._embed(prompt)
+        value = json.dumps(process_json, ensure_ascii=False)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(embedding, np.array([entry_id], dtype='int64'))
+            self.entries[entry_id] = (prompt, value, generation_time, namespace)
+
+            while len(self.entries) > self.capacity:
+                evicted_id, _ = self.entries.popitem(last=False)
+                self.index.remove_ids(np.array([evicted_id], dtype='int64'))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'avg_lookup_ms': self.lookup_seconds / lookups * 1000 if lookups else 0.0,
+            'saved_seconds': self.saved_seconds,
+        }
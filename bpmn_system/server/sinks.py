@@ -0,0 +1,42 @@
+import json
+import os
+import queue
+import threading
+
+
+class JsonFileSink:
+    """
+    Writes generated processes to disk in a background thread.
+
+    Each result goes to its own `<request_id>.json` file inside `output_dir`, so
+    concurrent requests never overwrite each other and the request path never
+    waits for the disk.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, request_id, process_json):
+        """Queues a process to be saved and returns immediately."""
+        self._queue.put((request_id, process_json))
+
+    def _run(self):
+        while True:
+            request_id, process_json = self._queue.get()
+            path = os.path.join(self.output_dir, f"{request_id}.json")
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(process_json, f, indent=2, ensure_ascii=False)
+            except Exception as e:
+                print(f"Error al guardar el JSON {path}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Blocks until every queued process has been written."""
+        self._queue.join()
@@ -0,0 +1,251 @@
+"""
+Decodificación especulativa (greedy) para una petición.
+
+Un drafter propone varios tokens de golpe y el modelo principal los verifica
+en una sola pasada: se aceptan mientras coinciden con su predicción greedy y se
+añade siempre un token del propio modelo, de modo que la salida es idéntica a
+la decodificación greedy normal pero con menos pasadas del modelo grande.
+
+Drafters disponibles:
+    NgramDrafter       busca el último n-grama generado en el prompt (que
+                       incluye el ejemplo de JSON del esquema) y en lo ya generado
+    DraftModelDrafter  un modelo pequeño con el mismo tokenizer
+"""
+
+from generation_utils import JsonStoppingCriteria
+import time
+import torch
+
+
+class SpeculativeStats:
+    """Counters of one or more speculative generations."""
+
+    __slots__ = ('drafted', 'accepted', 'forward_passes', 'generated', 'decode_time')
+
+    def __init__(self):
+        self.drafted = 0
+        self.accepted = 0
+        self.forward_passes = 0
+        self.generated = 0
+        self.decode_time = 0.0
+
+    def merge(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / self.drafted if self.drafted else 0.0
+
+    @property
+    def tokens_per_pass(self):
+        return self.generated / self.forward_passes if self.forward_passes else 0.0
+
+    def to_dict(self):
+        return {
+            'drafted_tokens': self.drafted,
+            'accepted_tokens': self.accepted,
+            'acceptance_rate': self.acceptance_rate,
+            'forward_passes': self.forward_passes,
+            'generated_tokens': self.generated,
+            'tokens_per_pass': self.tokens_per_pass,
+        }
+
+
+class NgramDrafter:
+    """
+    Proposes the tokens that followed the most recent earlier occurrence of the
+    last `max_ngram` (down to `min_ngram`) tokens of the sequence.
+
+    The prompt holds the example JSON of the schema and the user description,
+    so keys such as `"type": "tarea"` and task names are found there or in the
+    output generated so far.
+    """
+
+    def __init__(self, num_tokens=8, max_ngram=3, min_ngram=1):
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+    def reset(self, prompt_ids):
+        pass
+
+    def propose(self, ids):
+        for n in range(self.max_ngram, self.min_ngram - 1, -1):
+            if len(ids) <= n:
+                continue
+            pattern = ids[-n:]
+            # Latest match first: recent context predicts the next tokens best
+            for start in range(len(ids) - n - 1, -1, -1):
+                if ids[start:start + n] == pattern:
+                    continuation = ids[start + n:start + n + self.num_tokens]
+                    if continuation:
+                        return continuation
+        return []
+
+    def accepted(self, num_ids):
+        pass
+
+
+class DraftModelDrafter:
+    """
+    Greedy drafts from a small causal LM that shares the main model's tokenizer.
+
+    The draft model keeps its own KV cache over the accepted sequence and crops
+    it back after every verification, so each proposal only processes the
+    tokens that were not seen before.
+    """
+
+    def __init__(self, model, num_tokens=5):
+        self.model = model
+        self.num_tokens = num_tokens
+        self.cache = None
+        self.device = next(model.parameters()).device
+
+    def reset(self, prompt_ids):
+        from transformers import DynamicCache
+        self.cache = DynamicCache()
+
+    @torch.no_grad()
+    def propose(self, ids):
+        seen = self.cache.get_seq_length()
+        new_ids = torch.tensor([ids[seen:]], device=self.device)
+
+        draft = []
+        for _ in range(self.num_tokens):
+            logits = self.model(input_ids=new_ids, past_key_values=self.cache, use_cache=True).logits
+            token_id = int(logits[0, -1].argmax())
+            draft.append(token_id)
+            new_ids = torch.tensor([[token_id]], device=self.device)
+        return draft
+
+    def accepted(self, num_ids):
+        """Forgets the cached drafted positions beyond the accepted sequence."""
+        if self.cache.get_seq_length() > num_ids:
+            self.cache.crop(num_ids)
+
+
+class SpeculativeDecoder:
+    """
+    Greedy speculative decoding for batch size 1.
+
+    Args:
+        model: Main causal LM
+        tokenizer: Tokenizer of the main model (used by the JSON stopping criteria)
+        drafter: NgramDrafter or DraftModelDrafter
+        stop_token_ids (list): Tokens that end the generation
+        token_masks (FlowTokenMasks, optional): Restricts every verified position to the flow schema
+    """
+
+    def __init__(self, model, tokenizer, drafter, stop_token_ids, token_masks=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.drafter = drafter
+        self.stop_token_ids = stop_token_ids
+        self.token_masks = token_masks
+        self.stats = SpeculativeStats()
+
+    def _pick(self, logits, state):
+        """Greedy token of one position, restricted to the grammar state if constrained."""
+        if state is not None:
+            allowed = self.token_masks.allowed_tensor(state, logits.device)
+            return int(allowed[logits[allowed].argmax()])
+        return int(logits.argmax())
+
+    def _advance(self, state, token_id):
+        if state is None:
+            return None
+        return self.token_masks.next_state(state, token_id)
+
+    @torch.no_grad()
+    def generate(self, input_ids, past_key_values, max_new_tokens, cancel_event=None, streamer=None,
+                 on_token=None):
+        """
+        Generates the continuation of `input_ids` (1 x n tensor).
+
+        `past_key_values` may already hold a prefix of the input (the prefix KV
+        cache); it is extended in place. The streamer (if any) receives the
+        prompt, then each token chosen by the main model as soon as it is known
+        (the first one right after prefill) and every accepted group of drafted
+        tokens; `on_token` (if any) receives each accepted token id up to the stop.
+
+        Returns:
+            tuple: (new token ids, SpeculativeStats of this generation)
+        """
+        stats = SpeculativeStats()
+        device = input_ids.device
+        ids = input_ids[0].tolist()
+        prompt_length = len(ids)
+        stopping = JsonStoppingCriteria(
+            self.tokenizer, prompt_length, self.stop_token_ids, token_callbacks=[on_token]
+        )
+        state = self.token_masks.start if self.token_masks is not None else None
+
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+        self.drafter.reset(ids)
+
+        # Prefill: the tokens of the input not covered by the cache
+        cached = past_key_values.get_seq_length()
+        logits = self.model(
+            input_ids=input_ids[:, cached:], past_key_values=past_key_values, use_cache=True
+        ).logits
+        stats.forward_passes += 1
+        next_token = self._pick(logits[0, -1], state)
+
+        ti = time.time()
+        while True:
+            # next_token is produced by the main model but not yet in its cache
+            ids.append(next_token)
+            state = self._advance(state, next_token)
+            # Streamed before drafting: time to first token does not include a draft and verify pass
+            if streamer is not None:
+                streamer.put(torch.tensor([next_token]))
+
+            done = stopping(torch.tensor([ids], device=device), None)[0]
+            generated = len(ids) - prompt_length
+            if done or generated >= max_new_tokens or (cancel_event is not None and cancel_event.is_set()):
+                break
+
+            draft = self.drafter.propose(ids)[:max_new_tokens - generated - 1]
+            verify = torch.tensor([[next_token] + draft], device=device)
+            logits = self.model(input_ids=verify, past_key_values=past_key_values, use_cache=True).logits[0]
+            stats.forward_passes += 1
+            stats.drafted += len(draft)
+
+            # Accept drafted tokens while they match the main model's own choice
+            accepted_tokens = []
+            for i, token_id in enumerate(draft):
+                predicted = self._pick(logits[i], state)
+                if predicted != token_id:
+                    next_token = predicted
+                    break
+                ids.append(token_id)
+                accepted_tokens.append(token_id)
+                state = self._advance(state, token_id)
+                stats.accepted += 1
+                if stopping(torch.tensor([ids], device=device), None)[0]:
+                    break
+            else:
+                next_token = self._pick(logits[len(draft)], state)
+
+            # Keep only the cache entries of accepted tokens
+            past_key_values.crop(len(ids))
+            self.drafter.accepted(len(ids))
+            if streamer is not None and accepted_tokens:
+                streamer.put(torch.tensor(accepted_tokens))
+
+            if stopping.done[0]:
+                break
+            # The last accepted token is already in the cache; continue from the model's next choice
+            if len(ids) - prompt_length >= max_new_tokens:
+                break
+
+        if streamer is not None:
+            streamer.end()
+
+        generated_ids = ids[prompt_length:prompt_length + stopping.generated_tokens[0]]
+        stats.generated = len(generated_ids)
+        stats.decode_time = time.time() - ti
+        self.stats.merge(stats)
+        return generated_ids, stats
@@ -0,0 +1,119 @@
+"""
+Arranque del servidor por fases en segundo plano.
+
+El proceso HTTP escucha desde el primer momento mientras el backend, el modelo
+de embeddings y el vectorstore se cargan en un hilo aparte y se ejecuta una
+generación de calentamiento. `/healthz` indica si el proceso está vivo y
+`/readyz` si ya puede recibir tráfico; cada fase registra su duración.
+"""
+
+from contextlib import contextmanager
+from metrics import Gauge
+import threading
+import time
+import traceback
+
+
+class Startup:
+    """
+    Runs the startup steps of the server in a background thread, timing each phase.
+
+    Steps call `phase(name)` (directly or through the components they build) to
+    time a part of the startup. The state goes from 'starting' to 'ready' once
+    every step has run, or to 'failed' with the error of the step that raised.
+    """
+
+    STARTING = 'starting'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self, metrics=None):
+        self.status = Startup.STARTING
+        self.error = None
+        self.phases = {}  # name -> seconds, in completion order
+        self.current_phase = None
+        self.failed_phase = None
+        self.started = time.time()
+        self.finished = None
+        self._ready = threading.Event()
+        self._thread = None
+
+        self.phase_duration = Gauge(
+            'bpmn_startup_phase_seconds', "Duration of each phase of the server startup.", ('phase',)
+        )
+        self.ready_gauge = Gauge('bpmn_ready', "1 once the server has finished its startup and warm-up.")
+        self.ready_gauge.set(0)
+        if metrics is not None:
+            metrics.register(self.phase_duration)
+            metrics.register(self.ready_gauge)
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    @contextmanager
+    def phase(self, name):
+        """Times one phase of the startup and logs it."""
+        previous = self.current_phase
+        self.current_phase = name
+        ti = time.time()
+        try:
+            yield
+        except Exception:
+            # The innermost phase that raised
+            if self.failed_phase is None:
+                self.failed_phase = name
+            raise
+        finally:
+            seconds = time.time() - ti
+            self.current_phase = previous
+        self.phases[name] = seconds
+        self.phase_duration.set(seconds, phase=name)
+        print(f"Fase de arranque '{name}' completada en {seconds:.2f} segundos.", flush=True)
+
+    def start(self, steps):
+        """
+        Runs `steps`, a list of (phase name, callable), in a daemon thread.
+
+        Each callable runs inside its own phase, so nested phases it opens
+        are timed separately.
+        """
+        self._thread = threading.Thread(target=self._run, args=(steps,), daemon=True, name="startup")
+        self._thread.start()
+
+    def _run(self, steps):
+        try:
+            for name, step in steps:
+                with self.phase(name):
+                    step()
+        except Exception as e:
+            self.status = Startup.FAILED
+            self.error = f"{self.failed_phase or name}: {e}"
+            traceback.print_exc()
+            print(f"El arranque ha fallado en la fase '{self.failed_phase or name}': {e}", flush=True)
+            return
+        finally:
+            self.finished = time.time()
+
+        self.status = Startup.READY
+        self.ready_gauge.set(1)
+        self._ready.set()
+        print(f"Servidor listo en {self.finished - self.started:.2f} segundos.", flush=True)
+
+    def wait(self, timeout=None):
+        """Blocks until the server is ready; returns False on timeout or failure."""
+        self._ready.wait(timeout)
+        return self.is_ready
+
+    def to_dict(self):
+        end = self.finished if self.finished is not None else time.time()
+        data = {
+            'status': self.status,
+            'elapsed_seconds': end - self.started,
+            'phases': dict(self.phases),
+        }
+        if self.current_phase is not None and self.status == Startup.STARTING:
+            data['current_phase'] = self.current_phase
+        if self.error is not None:
+            data['error'] = self.error
+        return data
@@ -0,0 +1,81 @@
+"""
+Generación de procesos sintéticos con el mismo formato `flow` que produce el LLM.
+
+Se usan como respuesta del backend de pruebas y en los benchmarks para medir el
+sistema con procesos de cualquier tamaño sin necesidad de GPU.
+"""
+
+import random
+
+
+def synthetic_flow(num_elements=10, seed=0, gateway_ratio=0.2, loop_ratio=0.1, max_branch_tasks=3,
+                   max_depth=0, nested_ratio=0.3):
+    """
+    Builds a flow with `num_elements` elements between the start and end events.
+
+    Args:
+        num_elements (int): Number of tasks, gateways and loops in the main flow
+        seed (int): Seed of the random generator, the same seed gives the same flow
+        gateway_ratio (float): Fraction of elements that are gateways
+        loop_ratio (float): Fraction of elements that are loops
+        max_branch_tasks (int): Maximum number of tasks per branch or loop
+        max_depth (int): Levels of elements nested inside branches and loops (0: only task names)
+        nested_ratio (float): Fraction of branch and loop items that are nested elements
+
+    Returns:
+        dict: Process JSON with a `flow` list
+    """
+    rng = random.Random(seed)
+    options = (gateway_ratio, loop_ratio, max_branch_tasks, nested_ratio)
+    flow = [{"type": "evento", "name": "inicio"}]
+
+    for i in range(num_elements):
+        flow.append(_synthetic_element(rng, str(i), options, max_depth))
+
+    flow.append({"type": "evento", "name": "fin", "condicion": "Proceso completado"})
+    return {"flow": flow}
+
+
+def _synthetic_items(rng, label, prefix, options, depth):
+    """Task names of a branch or loop; with depth left, some are nested elements."""
+    items = []
+    for t in range(rng.randint(1, options[2])):
+        if depth > 0 and rng.random() < options[3]:
+            items.append(_synthetic_element(rng, f"{label}.{t}", options, depth - 1))
+        else:
+            items.append(f"{prefix} {label}.{t}")
+    return items
+
+
+def _synthetic_element(rng, label, options, depth):
+    gateway_ratio, loop_ratio = options[0], options[1]
+    r = rng.random()
+    if r < gateway_ratio:
+        gateway_type = rng.choice(["XOR", "AND"])
+        branches = []
+        for b in range(rng.randint(2, 3)):
+            branch = {
+                "name": f"Rama {label}.{b}",
+                "tareas": _synthetic_items(rng, f"{label}.{b}", "Tarea", options, depth)
+            }
+            if gateway_type == "XOR":
+                branch["condición"] = f"Se cumple la condición {label}.{b}"
+            branches.append(branch)
+        return {
+            "type": "pasarela",
+            "name": f"Decisión {label}",
+            "type_pasarela": gateway_type,
+            "ramas": branches
+        }
+    if r < gateway_ratio + loop_ratio:
+        return {
+            "type": "bucle",
+            "name": f"Bucle {label}",
+            "condición": f"Hasta completar la iteración {label}",
+            "tareas": _synthetic_items(rng, label, "Paso", options, depth)
+        }
+    return {
+        "type": "tarea",
+        "name": f"Tarea {label}",
+        "description": f"Realizar la actividad número {label} del proceso"
+    }